@@ -2,6 +2,7 @@
 # author: Jan Hybs
 import enum
 import os
+import threading
 from copy import deepcopy
 
 from loguru import logger
@@ -10,6 +11,7 @@ from cihpc.artifacts.modules import system_info
 from cihpc.common.utils import strings
 from cihpc.common.utils.datautils import dotdict
 from cihpc.core import db as db
+from cihpc.core.db.bulk_writer import BulkWriter
 
 
 class ICollectTool(object):
@@ -95,39 +97,66 @@ class CollectResult(object):
         return None
 
 
-class CIHPCReport(dotdict):
-    global_system = dotdict()
-    global_git = dotdict()
-    global_result = dotdict()
-    global_problem = dotdict()
-    global_index = dotdict()
+_host_system = None
+_host_system_lock = threading.Lock()
 
-    inited = False
 
-    @classmethod
-    def init(cls, path_to_repo=None):
-        if cls.inited:
-            return
+def host_system():
+    """
+    Returns the system information of this host,
+    obtained once per process
+    :rtype: dict
+    """
+    global _host_system
+    with _host_system_lock:
+        if _host_system is None:
+            _host_system = dict(system_info())
+        return _host_system
+
 
-        # if path_to_repo:
-        #     cls.global_git = CIHPCReportGit.get(path_to_repo)
-        # elif global_configuration.project_git:
-        #     cls.global_git = CIHPCReportGit.get(global_configuration.project_git.repo)
-        # else:
-        #     logger.warning(f'no git repository set')
+class ReportContext(object):
+    """
+    Fields shared by all the reports of a single job
 
-        cls.global_system = system_info()
-        cls.inited = True
+    Each job creates its own context, which is passed to the collect
+    module, so several jobs can be collected at the same time, in threads
+    or in worker processes (the context can be pickled).
+
+    :type system:  dict
+    :type git:     dict
+    :type result:  dict
+    :type problem: dict
+    :type index:   dict
+    """
+
+    def __init__(self, system=None, git=None, result=None, problem=None, index=None):
+        self.system = dict(host_system() if system is None else system)
+        self.git = dict(git or dict())
+        self.result = dict(result or dict())
+        self.problem = dict(problem or dict())
+        self.index = dict(index or dict())
+
+    def __repr__(self):
+        return 'ReportContext(git={self.git}, index={self.index})'.format(self=self)
 
-    def __init__(self):
+
+class CIHPCReport(dotdict):
+
+    def __init__(self, context=None):
+        """
+        :type context: ReportContext
+        :param context: fields of the job the report belongs to, if not set
+                        only the system information is filled in
+        """
         super(CIHPCReport, self).__init__()
+        context = context or ReportContext()
         self.update(
             dict(
-                system=self.global_system.copy(),
-                git=self.global_git.copy(),
-                result=self.global_result.copy(),
-                problem=self.global_problem.copy(),
-                index=self.global_index.copy(),
+                system=context.system.copy(),
+                git=context.git.copy(),
+                result=context.result.copy(),
+                problem=context.problem.copy(),
+                index=context.index.copy(),
 
                 timers=list(),
                 libs=list(),
@@ -257,36 +286,32 @@ class AbstractCollectModule(object):
     fields 'system' and 'git' are automatically obtained
     field 'index' can be set through config.yaml
     field  'libs' is optional
+
+    The automatically obtained fields come from the ReportContext
+    of the job, given to the method process
     """
 
     def __init__(self, project_name):
         self.project_name = project_name
 
-    def save_to_db(self, collect_results):
+    def save_to_db(self, collect_results, writer=None):
         """
         Method will insert results into db
         :type collect_results: list[CollectResult]
+        :type writer: cihpc.core.db.bulk_writer.BulkWriter
+        :param writer: a buffered writer, if not set the results are inserted immediately
         """
 
         logger.debug(f'saving {len(collect_results)} report files to database')
-        cihpc_mongo = db.CIHPCMongo.get_default()
-
-        results = list()
-        for item in collect_results:
-
-            # save logs first
-            if item.logs and item.items:
-                log_ids = cihpc_mongo.files.insert_many(item.logs).inserted_ids
-                logger.debug(f'inserted {len(log_ids)} files')
-                item.update(log_ids)
-
-            # insert rest to db
-            if item.items:
-                results.append(cihpc_mongo.reports.insert_many(item.items))
-        logger.debug(f'inserted {len(results)} reports')
-        return results
-
-    def process(self, object, from_file=None):
+        if writer is None:
+            writer = BulkWriter(db.CIHPCMongo.get_default())
+            writer.add(collect_results)
+            writer.flush()
+        else:
+            writer.add(collect_results)
+        return writer
+
+    def process(self, object, from_file=None, context=None):
         """
         method will process given object and returns a CollectResult.
 
@@ -296,6 +321,10 @@ class AbstractCollectModule(object):
         ----------
         object : dict or str
             a report containing timing information
+        from_file : str
+            location of the report file, if the report was read from a file
+        context : ReportContext
+            fields of the job, the reports are created by CIHPCReport(context)
         """
         raise NotImplementedError()
 
@@ -7,25 +7,17 @@ from cihpc.common.utils import datautils
 
 def system_info():
     """
-    Function will return system info and as a dict
+    Function will return system info and as a dict,
+    the value is cached on the disk until the host reboots,
+    see :class:`cihpc.common.utils.host.HostInfoCache`
     """
-    import subprocess
+    from cihpc.cfg.config import global_configuration
+    from cihpc.common.utils.host import HostInfoCache
 
-    def run(cmd, line=None):
-        lines = subprocess.check_output(cmd, shell=True).decode().strip().splitlines()
-        if line:
-            for l in lines:
-                if l.startswith(line):
-                    return l[len(line):].replace('"', '')
-        return lines[0].replace('"', '')
-
-    return dict(
-        name=run('uname'),
-        hostname=run('hostname'),
-        os_name=run('cat /etc/*-release', 'VERSION='),
-        os_version=run('cat /etc/*-release', 'NAME='),
-        username=run('echo $(whoami):$(id -u):$(id -g)'),
-    )
+    return HostInfoCache(
+        global_configuration.host_info_cache,
+        global_configuration.host_info_ttl,
+    ).get()
 
 
 def unwind_report(report, unwind_from='timers', unwind_to='timer', flatten=False):
@@ -33,7 +33,7 @@ class CollectModule(artifact_base.AbstractCollectModule):
         re.compile('size'),
     ]
 
-    def process(self, object, from_file=None):
+    def process(self, object, from_file=None, context=None):
         # tweak given object a bit
 
         # rename frames to timers
@@ -51,7 +51,7 @@ class CollectModule(artifact_base.AbstractCollectModule):
         object = self.convert_fields(object, self._floats, float, recursive=True)
         object = self.convert_fields(object, self._ints, int, recursive=True)
 
-        report = artifact_base.CIHPCReport()
+        report = artifact_base.CIHPCReport(context)
         report.merge(object)
 
         return artifact_base.CollectResult([report])
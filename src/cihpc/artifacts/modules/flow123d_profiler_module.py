@@ -12,9 +12,9 @@ from cihpc.artifacts.base import CollectResult, CIHPCReport, AbstractCollectModu
 class CollectModule(AbstractCollectModule):
     _children = 'children'
 
-    def process(self, object, from_file=None):
+    def process(self, object, from_file=None, context=None):
         # initial report
-        report = CIHPCReport()
+        report = CIHPCReport(context)
 
         # if status file is present, enrich the report
         if from_file and os.path.exists(from_file):
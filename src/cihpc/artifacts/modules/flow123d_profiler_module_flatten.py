@@ -11,9 +11,9 @@ import cihpc.artifacts.base as artifacts_base
 class CollectModule(artifacts_base.AbstractCollectModule):
     _children = 'children'
 
-    def process(self, object, from_file=None):
+    def process(self, object, from_file=None, context=None):
         # initial report
-        report = artifacts_base.CIHPCReport()
+        report = artifacts_base.CIHPCReport(context)
         run_id = uuid.uuid4().hex
 
         # link timers together
@@ -53,8 +53,8 @@ class CollectModule(artifacts_base.AbstractCollectModule):
 
     """
 
-    def process(self, object, from_file=None):
-        report = artifacts_base.CIHPCReport()
+    def process(self, object, from_file=None, context=None):
+        report = artifacts_base.CIHPCReport(context)
         report.merge(object)
 
         logger.debug(str(report))
@@ -1,11 +1,11 @@
 #!/usr/bin/python
 # author: Jan Hybs
 
+import functools
 import itertools
 from loguru import logger
 import os
 import re
-from copy import deepcopy, copy
 
 import yaml
 
@@ -29,16 +29,73 @@ _configure_object_dict = {
     '2i':lambda x: int(str(x).split('_')[2]),
     '3i':lambda x: int(str(x).split('_')[3]),
 }
+_configure_object_prefix_regex = re.compile('<[a-zA-Z0-9_$.|-]*$')
 _no_such_value = object()
 
 
+class FrozenDict(dict):
+    """
+    Immutable dictionary
+
+    Since the instance can never change, it is shared instead of copied,
+    copy and deepcopy simply return the same instance. Use the function
+    thaw to get a mutable copy.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('%s is immutable' % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+
+    def __repr__(self):
+        return 'FrozenDict(%s)' % dict.__repr__(self)
+
+
+def freeze(obj):
+    """
+    Returns an immutable version of the given object,
+    dictionaries are converted to FrozenDict and lists to tuples
+    """
+    if isinstance(obj, FrozenDict):
+        return obj
+    if isinstance(obj, dict):
+        return FrozenDict((k, freeze(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze(v) for v in obj)
+    return obj
+
+
+def thaw(obj):
+    """
+    Returns a mutable deep copy of an object created by freeze
+    """
+    if isinstance(obj, dict):
+        return {k: thaw(v) for k, v in obj.items()}
+    if isinstance(obj, tuple):
+        return [thaw(v) for v in obj]
+    return obj
+
+
 class Config(object):
     """
     Class which loads a .config.yaml file which should be located somewhere in a parent directory
     """
     _instance = None
     _hostname = None
-    _cfg = dict()
+    _cfg = FrozenDict()
 
     @classmethod
     def get(cls, *args, **kwargs):
@@ -81,29 +138,33 @@ class Config(object):
         cls._instance = Config()
         try:
             with open(config_file, 'r') as fp:
-                cls._cfg = yaml_load(fp.read()) or dict()
+                cls._cfg = freeze(yaml_load(fp.read()) or dict())
         except Exception as e:
             logger.exception(f'Failed to load/parse {config_file} configuration file, will use empty dict')
             logger.warning(f'You may want to create this file in order to use database connection')
-            cls._cfg = dict()
+            cls._cfg = FrozenDict()
         return cls._instance
 
     def _get(self, key=None, default=None):
         """
-        :rtype: dict or list or string or int or bool
+        Returns the value of the given (dot separated) key,
+        dictionaries and lists are returned frozen (see the function freeze)
+        so the value is shared and never copied
+
+        :rtype: FrozenDict or tuple or string or int or bool
         """
         self.__class__.init()
-        cfg_copy = deepcopy(self.__class__._cfg)
+        cfg = self.__class__._cfg
         if key is None:
-            return cfg_copy
+            return cfg
 
         keys = str(key).split('.')
         if len(keys) == 1:
-            return cfg_copy.get(key, default)
+            return cfg.get(key, default)
 
-        r = cfg_copy
+        r = cfg
         for k in keys:
-            r = r.get(k, {})
+            r = r.get(k, FrozenDict())
         return r
 
     def _set(self, key, value):
@@ -111,14 +172,16 @@ class Config(object):
         :rtype: dict or list or string or int or bool
         """
         self.__class__.init()
-        self.__class__._cfg[key] = value
+        cfg = dict(self.__class__._cfg)
+        cfg[key] = freeze(value)
+        self.__class__._cfg = FrozenDict(cfg)
         return value
 
     def __getitem__(self, item):
         return self.get(item)
 
     def __repr__(self):
-        cfg = self.__class__._cfg.copy()
+        cfg = thaw(self.__class__._cfg)
         try:
             cfg['pymongo']['password'] = '---HIDDEN---'
         except:
@@ -197,6 +260,9 @@ def configure_object(obj, vars, preserve_if_missing=False):
         <KEY|i> to convert value to int
         <KEY|f> to convert value to float
         <KEY|s> to convert value to string (default)
+
+    The given object is not modified, new lists and dicts are created
+    while the values are rendered using the compiled templates
     :type obj: dict or list
     :type vars: dict
     """
@@ -207,16 +273,13 @@ def configure_object(obj, vars, preserve_if_missing=False):
         return None
 
     if isinstance(obj, list):
-        obj_copy = deepcopy(obj)
-        for i, v in enumerate(obj_copy):
-            obj_copy[i] = configure_object(v, vars, preserve_if_missing)
-        return obj_copy
+        return [configure_object(v, vars, preserve_if_missing) for v in obj]
+
+    if isinstance(obj, tuple):
+        return tuple(configure_object(v, vars, preserve_if_missing) for v in obj)
 
     if isinstance(obj, dict):
-        obj_copy = deepcopy(obj)
-        for k, v in obj_copy.items():
-            obj_copy[k] = configure_object(v, vars, preserve_if_missing)
-        return obj_copy
+        return {k: configure_object(v, vars, preserve_if_missing) for k, v in obj.items()}
 
     else:
         return configure_string(obj, vars, preserve_if_missing)
@@ -244,14 +307,115 @@ def _get_property(obj, val, default=_no_such_value):
     return root
 
 
-def configure_string(value, vars, preserve_if_missing=False):
-    matches = _configure_object_regex.findall(str(value))
-    if matches:
-        value = str(value)
-        for key, dtype in matches:
-            orig = '<%s%s>' % (key, dtype)
-            func = _configure_object_dict.get(dtype[1:], str)
-            prop = _get_property(vars, key)
+def _resolve_property(obj, keys, default=_no_such_value):
+    """
+    Same as _get_property but with the path already split
+    :type keys: tuple[str]
+    """
+    root = obj
+    for k in keys:
+        try:
+            if isinstance(root, dict):
+                root = root[k]
+            else:
+                root = getattr(root, k)
+        except:
+            return default
+    return root
+
+
+class Template(object):
+    """
+    A string compiled into a list of literal and placeholder segments
+
+    Each placeholder <KEY|dtype> holds its path already split
+    and its conversion function, so rendering the template
+    is a single pass over the segments.
+
+    Instances are created using the function compile_template,
+    which caches them, so each string is parsed only once.
+
+    :type segments: tuple[str or (tuple[str], callable, str)]
+    :type matches:  list[(tuple[str], callable, str)]
+    """
+
+    def __init__(self, value):
+        self.value = value
+        self.segments = list()
+        self.matches = list()
+
+        position = 0
+        for match in _configure_object_regex.finditer(value):
+            key, dtype = match.groups(default='')
+            placeholder = tuple(key.split('.')), _configure_object_dict.get(dtype[1:], str), match.group(0)
+            if match.start() > position:
+                self.segments.append(value[position:match.start()])
+            self.segments.append(placeholder)
+            self.matches.append(placeholder)
+            position = match.end()
+
+        if position < len(value):
+            self.segments.append(value[position:])
+        self.segments = tuple(self.segments)
+
+        # the conversion is applied to the entire value after each substitution,
+        # a single pass gives the same result only if all but the last conversions are str
+        # and no substitution can complete another placeholder
+        self.single_pass = all(func is str for _, func, _ in self.matches[:-1]) and not any(
+            segment.__class__ is str and nxt.__class__ is not str and _configure_object_prefix_regex.search(segment)
+            for segment, nxt in zip(self.segments, self.segments[1:])
+        )
+
+    def __bool__(self):
+        return bool(self.matches)
+
+    def render(self, vars, preserve_if_missing=False):
+        """
+        Renders the template using the given variables
+
+        :type vars: dict
+        :type preserve_if_missing: bool
+        """
+        if not self.matches:
+            return self.value
+
+        if not self.single_pass:
+            return self._render_sequential(vars, preserve_if_missing)
+
+        parts = list()
+        func = None
+        for segment in self.segments:
+            if segment.__class__ is str:
+                parts.append(segment)
+                continue
+
+            prop = _resolve_property(vars, segment[0])
+            if prop is _no_such_value:
+                if preserve_if_missing:
+                    parts.append(segment[2])
+                    continue
+                return self._render_sequential(vars, preserve_if_missing)
+
+            prop = str(prop)
+            if '<' in prop:
+                # the value could contain a placeholder itself
+                return self._render_sequential(vars, preserve_if_missing)
+            parts.append(prop)
+            func = segment[1]
+
+        # nothing was substituted
+        if func is None:
+            return self.value
+
+        try:
+            return func(''.join(parts))
+        except:
+            return func()
+
+    def _render_sequential(self, vars, preserve_if_missing=False):
+        value = self.value
+        for keys, func, orig in self.matches:
+            prop = _resolve_property(vars, keys)
 
             # if no such value exists
             if prop is _no_such_value:
@@ -270,6 +434,26 @@ def configure_string(value, vars, preserve_if_missing=False):
                     value = func(val)
                 except:
                     value = func()
+        return value
+
+    def __repr__(self):
+        return 'Template(%r)' % self.value
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_template(value):
+    """
+    Returns a compiled (and cached) template of the given string
+    :type value: str
+    :rtype: Template
+    """
+    return Template(value)
+
+
+def configure_string(value, vars, preserve_if_missing=False):
+    template = compile_template(value if value.__class__ is str else str(value))
+    if template:
+        return template.render(vars, preserve_if_missing)
     return value
 
 
@@ -41,6 +41,21 @@ class global_configuration(object):
         ttl=10 * 60
     )
 
+    # response cache of the www views (None to disable), budgets are in bytes
+    # disk is a directory of the on-disk tier, which is disabled if None
+    view_cache_opts = dict(
+        memory=256 * 1024 * 1024,
+        disk=None,
+        disk_size=1024 * 1024 * 1024,
+    )
+    # number of seconds the version of the project data is reused
+    view_cache_version_ttl = 5.0
+
+    # host information stored in the reports is cached in this directory
+    # (None to disable) until the host reboots or the ttl (in seconds) expires
+    host_info_cache = os.path.join(os.path.expanduser('~'), '.cache', 'cihpc')
+    host_info_ttl = 24 * 60 * 60
+
     # this file should be PROTECTED, as it may contain passwords and database connection details
     cfg_secret_path = __secret_yaml__
 
@@ -119,7 +119,13 @@ class ComplexSemaphore(object):
         """
         with self._cond:
             self._value += value
-            self._cond.notify()
+            # waiters may request different values, all of them must check
+            self._cond.notify_all()
+
+    def wait_release(self, timeout=None):
+        """Blocks until some units are released or until the timeout expires."""
+        with self._cond:
+            self._cond.wait(timeout)
 
     def __exit__(self, t, v, tb):
         self.release()
\ No newline at end of file
@@ -0,0 +1,267 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import itertools
+import os
+import sys
+import time
+
+from loguru import logger
+
+
+class ResourceUsage(object):
+    """
+    Resources consumed by a process and all its waited-for descendants
+
+    The values come from os.wait4 (rusage of the process tree) and,
+    if the process was started in its own cgroup v2, from the cgroup
+    statistics, which include also the descendants which were not waited for.
+
+    :type cgroup: dict
+    """
+
+    def __init__(self):
+        self.wall_time = None
+        self.cpu_user = None
+        self.cpu_system = None
+        self.max_rss = None
+        self.voluntary_switches = None
+        self.involuntary_switches = None
+        self.io_read_bytes = None
+        self.io_write_bytes = None
+        self.cgroup = None
+
+    @classmethod
+    def from_rusage(cls, rusage, wall_time=None):
+        """
+        :type rusage: resource.struct_rusage
+        """
+        usage = cls()
+        usage.wall_time = wall_time
+        usage.cpu_user = rusage.ru_utime
+        usage.cpu_system = rusage.ru_stime
+        # maxrss is in kilobytes on linux and in bytes on mac
+        usage.max_rss = rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        usage.voluntary_switches = rusage.ru_nvcsw
+        usage.involuntary_switches = rusage.ru_nivcsw
+        # number of 512 byte blocks
+        usage.io_read_bytes = rusage.ru_inblock * 512
+        usage.io_write_bytes = rusage.ru_oublock * 512
+        return usage
+
+    @property
+    def cpu_time(self):
+        if self.cpu_user is None:
+            return None
+        return self.cpu_user + self.cpu_system
+
+    def update_from_cgroup(self, stats):
+        """
+        Values from the cgroup are preferred, since they include
+        all the processes started in the cgroup
+        :type stats: dict
+        """
+        if not stats:
+            return
+
+        self.cgroup = stats
+        if 'cpu_user' in stats:
+            self.cpu_user = stats['cpu_user']
+            self.cpu_system = stats['cpu_system']
+        if stats.get('memory_peak'):
+            self.max_rss = max(self.max_rss or 0, stats['memory_peak'])
+        if 'io_read_bytes' in stats:
+            self.io_read_bytes = stats['io_read_bytes']
+            self.io_write_bytes = stats['io_write_bytes']
+
+    def to_json(self):
+        result = dict(
+            wall_time=self.wall_time,
+            cpu_time=self.cpu_time,
+            cpu_user=self.cpu_user,
+            cpu_system=self.cpu_system,
+            max_rss=self.max_rss,
+            voluntary_switches=self.voluntary_switches,
+            involuntary_switches=self.involuntary_switches,
+            io_read_bytes=self.io_read_bytes,
+            io_write_bytes=self.io_write_bytes,
+        )
+        if self.cgroup and 'oom_kills' in self.cgroup:
+            result['oom_kills'] = self.cgroup['oom_kills']
+        return result
+
+    def __repr__(self):
+        return 'ResourceUsage(wall={self.wall_time}, cpu={self.cpu_time}, rss={self.max_rss})'.format(self=self)
+
+
+def _cgroup2_mount():
+    try:
+        with open('/proc/self/mountinfo', 'r') as fp:
+            for line in fp:
+                # fields after the separator are fstype, source and options
+                fields = line.split(' - ')
+                if len(fields) == 2 and fields[1].split()[0] == 'cgroup2':
+                    return fields[0].split()[4]
+    except OSError:
+        pass
+    return None
+
+
+def _cgroup2_path():
+    try:
+        with open('/proc/self/cgroup', 'r') as fp:
+            for line in fp:
+                if line.startswith('0::'):
+                    return line[3:].strip()
+    except OSError:
+        pass
+    return None
+
+
+def _read_keys(path):
+    result = dict()
+    try:
+        with open(path, 'r') as fp:
+            for line in fp:
+                parts = line.split()
+                if len(parts) == 2:
+                    result[parts[0]] = int(parts[1])
+    except (OSError, ValueError):
+        pass
+    return result
+
+
+class CgroupScope(object):
+    """
+    A cgroup v2 created for a single job, if the cgroup hierarchy
+    is writable (e.g. delegated to the user), otherwise disabled
+
+    The process is moved to the cgroup right after it was started,
+    so all the descendants it creates are accounted as well.
+    """
+
+    # next() of the count is atomic, the names are unique across the threads
+    _counter = itertools.count(1)
+
+    def __init__(self):
+        self.path = None
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def __enter__(self):
+        mount, path = _cgroup2_mount(), _cgroup2_path()
+        if mount is None or path is None:
+            return self
+
+        name = 'cihpc-%d-%d' % (os.getpid(), next(CgroupScope._counter))
+        candidate = os.path.join(mount, path.lstrip('/'), name)
+        try:
+            os.mkdir(candidate)
+            self.path = candidate
+        except OSError as e:
+            logger.debug(f'cgroup accounting is not available: {e}')
+        return self
+
+    def attach(self, pid):
+        """
+        Moves the process to the cgroup, the cgroup is disabled
+        if the process cannot be moved
+        """
+        if not self.path:
+            return
+
+        try:
+            with open(os.path.join(self.path, 'cgroup.procs'), 'w') as fp:
+                fp.write(str(pid))
+        except OSError as e:
+            logger.debug(f'could not move process {pid} to cgroup {self.path}: {e}')
+            self.__exit__(None, None, None)
+            self.path = None
+
+    def stats(self):
+        """
+        Returns the statistics of the cgroup
+        :rtype: dict
+        """
+        if not self.path:
+            return None
+
+        stats = dict()
+        cpu = _read_keys(os.path.join(self.path, 'cpu.stat'))
+        if 'user_usec' in cpu:
+            stats['cpu_user'] = cpu['user_usec'] / 1e6
+            stats['cpu_system'] = cpu['system_usec'] / 1e6
+
+        # memory and io controllers may not be enabled for the cgroup
+        try:
+            with open(os.path.join(self.path, 'memory.peak'), 'r') as fp:
+                stats['memory_peak'] = int(fp.read().strip())
+        except (OSError, ValueError):
+            pass
+
+        events = _read_keys(os.path.join(self.path, 'memory.events'))
+        if 'oom_kill' in events:
+            stats['oom_kills'] = events['oom_kill']
+
+        try:
+            with open(os.path.join(self.path, 'io.stat'), 'r') as fp:
+                read, write = 0, 0
+                for line in fp:
+                    for item in line.split()[1:]:
+                        key, _, value = item.partition('=')
+                        if key == 'rbytes':
+                            read += int(value)
+                        elif key == 'wbytes':
+                            write += int(value)
+                stats['io_read_bytes'] = read
+                stats['io_write_bytes'] = write
+        except (OSError, ValueError):
+            pass
+
+        return stats
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.path:
+            try:
+                os.rmdir(self.path)
+            except OSError as e:
+                # processes which outlived the job keep the cgroup alive
+                logger.debug(f'could not remove cgroup {self.path}: {e}')
+        return False
+
+
+def wait_with_usage(process, start_time=None, cgroup=None):
+    """
+    Waits for the process and returns its return code
+    and the resources it consumed
+
+    Parameters
+    ----------
+    process: subprocess.Popen
+    start_time: float
+        time.perf_counter() value before the process was started
+    cgroup: CgroupScope
+        optional cgroup the process was started in
+
+    Returns
+    -------
+    (int, ResourceUsage)
+    """
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # already reaped, the usage is unknown
+        return process.wait(), None
+
+    wall_time = time.perf_counter() - start_time if start_time is not None else None
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+
+    usage = ResourceUsage.from_rusage(rusage, wall_time)
+    if cgroup:
+        usage.update_from_cgroup(cgroup.stats())
+    return process.returncode, usage
@@ -0,0 +1,227 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import contextlib
+import glob
+import os
+import re
+import threading
+
+from loguru import logger
+
+
+def parse_cpulist(value):
+    """
+    Converts the kernel cpu list format (e.g. 0-3,8,10-11) to a list of cores
+
+    :type value: str
+    :rtype: list[int]
+    """
+    cores = list()
+    for part in value.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, stop = part.split('-')
+            cores.extend(range(int(start), int(stop) + 1))
+        else:
+            cores.append(int(part))
+    return cores
+
+
+def format_cpulist(cores):
+    """
+    Converts the list of cores to the cpu list format (e.g. 0-3,8,10-11)
+    used by taskset -c, numactl -C, docker --cpuset-cpus and others
+
+    :type cores: list[int]
+    :rtype: str
+    """
+    ranges = list()
+    for core in sorted(cores):
+        if ranges and ranges[-1][1] == core - 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ','.join('%d' % a if a == b else '%d-%d' % (a, b) for a, b in ranges)
+
+
+def available_cores():
+    """
+    Returns the cores this process may run on
+    :rtype: list[int]
+    """
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def numa_topology(cores=None):
+    """
+    Returns the given cores grouped by the numa nodes, the nodes without
+    any of the cores are omitted, if the topology is unknown a single
+    node 0 with all the cores is returned
+
+    :type cores: list[int]
+    :rtype: dict[int, list[int]]
+    """
+    cores = available_cores() if cores is None else cores
+    allowed = set(cores)
+    nodes = dict()
+
+    for path in glob.glob('/sys/devices/system/node/node*/cpulist'):
+        match = re.search(r'node(\d+)', path)
+        try:
+            with open(path, 'r') as fp:
+                node_cores = [c for c in parse_cpulist(fp.read()) if c in allowed]
+        except (OSError, ValueError):
+            continue
+        if node_cores:
+            nodes[int(match.group(1))] = node_cores
+
+    assigned = set(c for node in nodes.values() for c in node)
+    if not nodes or assigned != allowed:
+        return {0: sorted(allowed)}
+    return nodes
+
+
+class CoreSet(list):
+    """
+    A list of cores assigned to a single job
+    :type nodes: list[int]
+    """
+
+    def __init__(self, cores, nodes=()):
+        super(CoreSet, self).__init__(sorted(cores))
+        self.nodes = sorted(set(nodes))
+
+    @property
+    def cpulist(self):
+        return format_cpulist(self)
+
+    def __repr__(self):
+        return 'CoreSet(%s)' % self.cpulist
+
+
+class CoreAllocator(object):
+    """
+    Hands out disjoint sets of cores to the jobs
+
+    A job is placed within a single numa node whenever possible,
+    the node with the least free cores which still fits the job is used,
+    so the other nodes remain free for the bigger jobs. Jobs bigger than
+    any node are spread over the nodes with the most free cores.
+
+    The allocator is disabled (acquire returns None) if more cores
+    are requested than the process may use, since the sets could not
+    be disjoint.
+
+    Parameters
+    ----------
+    processes: int
+        number of cores the pool uses, the cores are taken node by node
+    topology: dict[int, list[int]]
+        cores of each numa node, detected if not set
+    """
+
+    def __init__(self, processes, topology=None):
+        topology = numa_topology() if topology is None else topology
+        total = sum(len(cores) for cores in topology.values())
+
+        self.enabled = 0 < processes <= total
+        self._free = dict()
+        self._node_of = dict()
+        self._lock = threading.Lock()
+
+        if not self.enabled:
+            logger.debug(f'core pinning disabled, {processes} cores requested, {total} available')
+            return
+
+        # use whole nodes first
+        remaining = processes
+        for node, cores in sorted(topology.items(), key=lambda x: (-len(x[1]), x[0])):
+            if remaining <= 0:
+                break
+            self._free[node] = sorted(cores)[:remaining]
+            self._node_of.update({core: node for core in self._free[node]})
+            remaining -= len(self._free[node])
+
+    @property
+    def free(self):
+        return sum(len(cores) for cores in self._free.values())
+
+    def acquire(self, count):
+        """
+        Returns a set of count free cores or None if the allocator
+        is disabled or there is not enough free cores
+        :rtype: CoreSet
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            if count > self.free:
+                return None
+
+            fitting = [node for node, cores in self._free.items() if len(cores) >= count]
+            if fitting:
+                node = min(fitting, key=lambda n: (len(self._free[n]), n))
+                return CoreSet(self._take(node, count), [node])
+
+            cores, nodes = list(), list()
+            for node in sorted(self._free, key=lambda n: (-len(self._free[n]), n)):
+                taken = self._take(node, count - len(cores))
+                if taken:
+                    cores.extend(taken)
+                    nodes.append(node)
+                if len(cores) == count:
+                    break
+            return CoreSet(cores, nodes)
+
+    def _take(self, node, count):
+        taken = self._free[node][:count]
+        self._free[node] = self._free[node][count:]
+        return taken
+
+    def release(self, coreset):
+        """
+        Returns the cores of the given set to the allocator
+        :type coreset: CoreSet
+        """
+        if not coreset or not self.enabled:
+            return
+
+        with self._lock:
+            for core in coreset:
+                self._free[self._node_of[core]].append(core)
+            for node in coreset.nodes:
+                self._free[node].sort()
+
+
+@contextlib.contextmanager
+def pinned(cores):
+    """
+    Restricts the calling thread to the given cores, processes
+    started by the thread inherit the affinity, the original affinity
+    is restored on exit
+
+    :type cores: list[int]
+    """
+    if not cores or not hasattr(os, 'sched_setaffinity'):
+        yield
+        return
+
+    # pid 0 sets the affinity of the calling thread only
+    original = os.sched_getaffinity(0)
+    try:
+        os.sched_setaffinity(0, cores)
+    except OSError as e:
+        logger.warning(f'could not set the affinity to {format_cpulist(cores)}: {e}')
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, original)
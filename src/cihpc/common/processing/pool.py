@@ -6,16 +6,20 @@ import enum
 import itertools
 from loguru import logger
 import multiprocessing
+import queue
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from pluck import pluck
 
 from cihpc.common.processing import ComplexSemaphore
+from cihpc.common.processing.affinity import CoreAllocator
+from cihpc.common.processing.scheduler import JobQueue, ScheduleStats
 from cihpc.common.utils.events import EnterExitEvent
 from cihpc.common.utils.timer import Timer
 from cihpc.core.processing.step_shell import ProcessStepResult
-from cihpc.exceptions.exec_error import ExecError
+from cihpc.exceptions.exec_error import ExecError, OnError
 
 
 class PoolInt(object):
@@ -57,6 +61,10 @@ class SimpleWorker(threading.Thread):
         self._pretty_name = None
         self.terminate = False
         self.exception = None
+        # expected duration in seconds used when scheduling, None if unknown
+        self.expected_duration = None
+        # cores assigned by the pool, None if the worker is not pinned
+        self.cpuset = None  # type: cihpc.common.processing.affinity.CoreSet
 
     @property
     def status(self):
@@ -71,23 +79,33 @@ class SimpleWorker(threading.Thread):
         if self.target:
             self.result = self.target(self)
 
-    def run(self):
-        self.status = WorkerStatus.WAITING
-        self.semaphore.acquire(value=self.cpus)
+    def execute(self):
+        """
+        Runs the target, the cores must be already acquired by the caller
+        """
         self.status = WorkerStatus.RUNNING
         self.thread_event.on_enter(self)
 
-        with self.timer:
-            try:
-                self._run()
-            except ExecError as e:
-                logger.error(f'Caught ExecError {e.reason}!')
-                self.terminate = True
-                self.exception = e
+        try:
+            with self.timer:
+                try:
+                    self._run()
+                except ExecError as e:
+                    logger.error(f'Caught ExecError {e.reason}!')
+                    self.terminate = True
+                    self.exception = e
+        finally:
+            self.status = WorkerStatus.EXITING
+            self.lock_event.set()
+        return self
 
-        self.semaphore.release(value=self.cpus)
-        self.status = WorkerStatus.EXITING
-        self.lock_event.set()
+    def run(self):
+        self.status = WorkerStatus.WAITING
+        self.semaphore.acquire(value=self.cpus)
+        try:
+            self.execute()
+        finally:
+            self.semaphore.release(value=self.cpus)
 
     def __repr__(self):
         return '{self.name}({self.cpus}x, [{self.status}])'.format(self=self)
@@ -112,35 +130,130 @@ class Worker(SimpleWorker):
         return self._pretty_name or self.name
 
 
+class CoreBudget(object):
+    """
+    Cores shared by several pools running at the same time,
+    e.g. the stages of several commits processed concurrently
+
+    A worker of a pool with a budget starts only if both its pool
+    and the budget have enough free cores. If pin is set, the pools
+    pin their workers to the disjoint cores of the shared allocator.
+
+    :type semaphore: ComplexSemaphore
+    :type cores: CoreAllocator
+    """
+
+    def __init__(self, cpu_count=None, pin=False):
+        self.processes = cpu_count or multiprocessing.cpu_count()
+        self.semaphore = ComplexSemaphore(self.processes)
+        self.cores = CoreAllocator(self.processes) if pin else None
+
+    def acquire(self, cpus, blocking=True):
+        return self.semaphore.acquire(blocking=blocking, value=min(cpus, self.processes))
+
+    def release(self, cpus):
+        self.semaphore.release(value=min(cpus, self.processes))
+
+    @property
+    def free(self):
+        return self.semaphore.value
+
+    def __repr__(self):
+        return 'CoreBudget({self.free}/{self.processes} free)'.format(self=self)
+
+
 class WorkerPool(object):
     """
     :type threads: list[cihpc.common.processing.pool.SimpleWorker]
     :type exception: cihpc.exceptions.exec_error.ExecError
+
+    Workers can be given as a list or as an iterator. An iterator is consumed
+    lazily, only lookahead workers are kept pending at once and the finished
+    workers are released, so the memory does not grow with the number of jobs.
+
+    If pin is set, each worker gets a disjoint set of cores (worker.cpuset)
+    for the time it runs, see :class:`CoreAllocator`.
+
+    If budget is set, the cores are also taken from the :class:`CoreBudget`
+    shared with the other pools, the pool never uses more cores than the budget has.
     """
 
-    def __init__(self, cpu_count, threads):
+    def __init__(self, cpu_count, threads, lookahead=None, pin=False, budget=None):
+        self.budget = budget  # type: CoreBudget
         self.processes = cpu_count or multiprocessing.cpu_count()
+        if budget:
+            self.processes = min(self.processes, budget.processes)
         self.semaphore = ComplexSemaphore(self.processes)
         self.lock_event = threading.Event()
         self.thread_event = EnterExitEvent('thread')
         self.threads = list()
         self.terminate = False
         self.exception = None
+        self.stats = ScheduleStats(self.processes)
+        self.lookahead = lookahead or max(4 * self.processes, 16)
+
+        if budget and budget.cores:
+            self.cores = budget.cores if pin else None
+        else:
+            self.cores = CoreAllocator(self.processes) if pin else None
+
+        self._cpu_target = None
+        self._source = None
 
         logger.debug(f'process limit set to {self.processes}')
-        self.add_threads(*threads)
+        if isinstance(threads, (list, tuple)):
+            self.add_threads(*threads)
+        else:
+            self._source = iter(threads)
+
+    @property
+    def lazy(self):
+        """
+        True if the workers are taken from an iterator
+        """
+        return self._source is not None
 
     def add_threads(self, *threads: Worker):
         for worker in threads:
             worker.semaphore = self.semaphore
             worker.thread_event = self.thread_event
             worker.lock_event = self.lock_event
+            if self._cpu_target:
+                worker.cpus = self._cpu_target(worker)
             self.threads.append(worker)
 
     def update_cpu_values(self, target):
+        self._cpu_target = target
         for thread in self.threads:
             thread.cpus = target(thread)
 
+    def _take(self, count):
+        """
+        Method takes at most count workers from the lazy source
+        and returns them, the workers are added to the threads
+        """
+        if self._source is None:
+            return list()
+
+        workers = list(itertools.islice(self._source, count))
+        if len(workers) < count:
+            self._source = iter(())
+        self.add_threads(*workers)
+        return workers
+
+    def _assign_cores(self, thread):
+        if self.cores:
+            thread.cpuset = self.cores.acquire(thread.cpus)
+
+    def _release_cores(self, thread):
+        if self.cores:
+            self.cores.release(thread.cpuset)
+
+    def _release(self, thread):
+        # in the lazy mode the finished workers are not kept
+        if self.lazy:
+            self.threads.remove(thread)
+
     @property
     def result(self):
         return pluck(self.threads, 'result')
@@ -150,47 +263,155 @@ class WorkerPool(object):
             return self.start_serial()
         return self.start_parallel()
 
+    def _iter_serial(self):
+        if not self.lazy:
+            yield from list(self.threads)
+            return
+
+        while True:
+            workers = self._take(1)
+            if not workers:
+                break
+            yield workers[0]
+
     def start_serial(self):
         # in serial mode, we start the thread, wait for finish and fire on_exit
-        for thread in self.threads:
-            thread.start()
-            thread.join()
-            thread.status = WorkerStatus.FINISHED
-            self.thread_event.on_exit(thread)
-
-            if thread.terminate:
-                logger.error('Caught pool terminate signal!')
-                self.terminate = True
-                self.exception = thread.exception
-                return False
+        self.stats = ScheduleStats(1)
+        with self.stats:
+            for thread in self._iter_serial():
+                if self.budget:
+                    self.budget.acquire(thread.cpus)
+                self._assign_cores(thread)
+                try:
+                    thread.start()
+                    thread.join()
+                finally:
+                    self._release_cores(thread)
+                    if self.budget:
+                        self.budget.release(thread.cpus)
+                thread.status = WorkerStatus.FINISHED
+                self.stats.add(1, thread.timer.duration)
+                self.thread_event.on_exit(thread)
+                self._release(thread)
+
+                if thread.terminate:
+                    logger.error('Caught pool terminate signal!')
+                    self.terminate = True
+                    self.exception = thread.exception
+                    return False
+
+    @staticmethod
+    def _on_done(future, worker, finished):
+        """
+        Passes the finished worker to the pool, the unexpected exceptions
+        (the ExecError is handled by the worker) terminate the pool
+        """
+        try:
+            exception = future.exception()
+            if exception is not None:
+                logger.opt(exception=exception).error(f'Worker {worker.pretty_name} failed: {exception}')
+                worker.terminate = True
+                worker.exception = ExecError(
+                    reason=ExecError.EXECUTION_FAILED,
+                    on_error=OnError.EXIT,
+                    details=dict(exception=exception),
+                )
+        finally:
+            finished.put(worker)
 
     def start_parallel(self):
-        # start
-        for thread in self.threads:
-            thread.start()
-
-        # wait
-        not_joined = self.threads.copy()
-        while not_joined:
-            # wait 30 seconds at max before checking thread status
-            self.lock_event.wait(30.0)
-            # clear the flag
-            self.lock_event.clear()
-
-            # wait for the finished threads to join
-            for thread in not_joined.copy():
-                if thread.status is WorkerStatus.EXITING:
-                    thread.join()
-                    thread.status = WorkerStatus.FINISHED
-                    self.thread_event.on_exit(thread)
-                    not_joined.remove(thread)
+        """
+        Runs the workers on a bounded set of executor threads
+
+        Pending workers are kept in a :class:`JobQueue`, whenever cores
+        are released, the queue is asked for the next job which fits the
+        free cores (backfilling smaller jobs if the head job must wait).
+        """
+        pending = JobQueue(self.semaphore.limit)
+
+        def enqueue(threads):
+            for thread in threads:
+                if thread.cpus > self.semaphore.limit:
+                    logger.warning(f'{thread} requested {thread.cpus} cores but only {self.semaphore.limit} are '
+                                   f'available, will use {self.semaphore.limit} cores instead')
+                    thread.cpus = self.semaphore.limit
+                thread.status = WorkerStatus.WAITING
+                pending.put(thread)
+
+        enqueue(self.threads)
 
-                    if thread.terminate:
-                        logger.error('Caught pool terminate signal!')
-                        self.terminate = True
-                        self.exception = thread.exception
-                        return False
+        finished = queue.Queue()
+        running = dict()
+        self.stats = ScheduleStats(self.semaphore.limit)
+
+        if self.lazy:
+            max_workers = self.semaphore.limit
+        else:
+            max_workers = max(min(self.semaphore.limit, len(self.threads)), 1)
+
+        with self.stats, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                # keep enough pending workers to fill (and backfill) the free cores
+                if not self.terminate and len(pending) < self.lookahead:
+                    enqueue(self._take(self.lookahead - len(pending)))
+
+                if not pending and not running:
+                    break
+
+                # start as many workers as the free cores allow
+                while pending and not self.terminate:
+                    expected_ends = [
+                        (start + w.expected_duration if w.expected_duration else None, w.cpus)
+                        for w, start in running.items()
+                    ]
+                    free = self.semaphore.value
+                    if self.budget:
+                        free = min(free, self.budget.free)
+
+                    worker, backfilled = pending.pop(free, expected_ends)
+                    if worker is None:
+                        break
+
+                    # other pools may have taken the cores of the budget meanwhile
+                    if self.budget and not self.budget.acquire(worker.cpus, blocking=False):
+                        pending.put(worker)
+                        break
+
+                    self.semaphore.acquire(blocking=False, value=worker.cpus)
+                    self._assign_cores(worker)
+                    self.stats.backfilled += int(backfilled)
+                    running[worker] = time.time()
+                    executor.submit(worker.execute).add_done_callback(
+                        lambda future, w=worker: self._on_done(future, w, finished)
+                    )
+
+                # the budget is exhausted by the other pools, wait for their cores
+                if not running and pending and self.budget and not self.terminate:
+                    self.budget.semaphore.wait_release(timeout=1.0)
+                    continue
+
+                # on terminate signal we only wait for the running workers
+                if not running:
+                    break
 
+                thread = finished.get()
+                running.pop(thread)
+                self.semaphore.release(value=thread.cpus)
+                self._release_cores(thread)
+                if self.budget:
+                    self.budget.release(thread.cpus)
+                self.stats.add(thread.cpus, thread.timer.duration)
+                thread.status = WorkerStatus.FINISHED
+                self.thread_event.on_exit(thread)
+                self._release(thread)
+
+                if thread.terminate and not self.terminate:
+                    logger.error('Caught pool terminate signal!')
+                    self.terminate = True
+                    self.exception = thread.exception
+
+        if self.terminate:
+            return False
         return self.result
 
     def get_statuses(self, format):
@@ -258,7 +479,7 @@ class WorkerPool(object):
         def target():
             # no work to be done? just finish up here
             # and return the thread
-            if not self.threads:
+            if not self.threads and not self.lazy:
                 return
 
             last_print = 0
@@ -267,7 +488,7 @@ class WorkerPool(object):
                     logger.debug(self.get_statuses(format))
                     last_print = time.time()
 
-                if set(pluck(self.threads, 'status')) == {WorkerStatus.FINISHED}:
+                if set(pluck(self.threads, 'status')) <= {WorkerStatus.FINISHED} and self.stats.stop_time:
                     break
                 time.sleep(update_period)
 
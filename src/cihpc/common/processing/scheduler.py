@@ -0,0 +1,173 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import bisect
+import itertools
+import time
+
+
+class ScheduleStats(object):
+    """
+    Simple crate holding the core utilisation of a single schedule
+
+    :type cores: int
+    :type core_seconds: float
+    :type jobs: int
+    :type backfilled: int
+    """
+
+    def __init__(self, cores):
+        self.cores = cores
+        self.core_seconds = 0.0
+        self.jobs = 0
+        self.backfilled = 0
+        self.start_time = None
+        self.stop_time = None
+
+    def __enter__(self):
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop_time = time.time()
+        return False
+
+    def add(self, cpus, duration):
+        self.core_seconds += cpus * duration
+        self.jobs += 1
+
+    @property
+    def makespan(self):
+        if self.start_time and self.stop_time:
+            return self.stop_time - self.start_time
+        elif self.start_time:
+            return time.time() - self.start_time
+        return 0.0
+
+    @property
+    def utilisation(self):
+        capacity = self.cores * self.makespan
+        if capacity <= 0.0:
+            return 0.0
+        return min(self.core_seconds / capacity, 1.0)
+
+    def __repr__(self):
+        return '{self.jobs} job(s) on {self.cores} core(s) in {self.makespan:1.2f} sec, ' \
+               'utilisation {u:1.1f}%, backfilled {self.backfilled}'.format(
+                    self=self,
+                    u=self.utilisation * 100
+                )
+
+
+class JobQueue(object):
+    """
+    A priority queue of pending workers, ordered by the longest expected
+    duration first and then by the number of requested cores
+
+    When the job at the head of the queue does not fit into the free cores,
+    smaller jobs are backfilled. If the expected durations of the running jobs
+    are known, the head job gets a reservation (EASY backfilling) and only
+    jobs which do not delay it are picked. Otherwise the largest job which
+    fits the free cores is picked.
+
+    :type limit: int
+    """
+
+    def __init__(self, limit, workers=()):
+        self.limit = limit
+        self._items = list()
+        self._counter = itertools.count()
+
+        for worker in workers:
+            self.put(worker)
+
+    @staticmethod
+    def priority(worker):
+        expected = getattr(worker, 'expected_duration', None) or 0.0
+        return -expected, -worker.cpus
+
+    def put(self, worker):
+        bisect.insort(self._items, (self.priority(worker), next(self._counter), worker))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def __iter__(self):
+        return (worker for _, _, worker in self._items)
+
+    def pop(self, free, running=(), now=None):
+        """
+        Method returns the next worker which should be started
+        or None if no worker can be started right now
+
+        Parameters
+        ----------
+        free: int
+            number of free cores
+        running: list[(float or None, int)]
+            a list of tuples (expected end time, cores) of the running jobs,
+            expected end time is None if unknown
+        now: float
+            current time, defaults to time.time()
+
+        Returns
+        -------
+        cihpc.common.processing.pool.SimpleWorker or None, bool
+            a worker and a flag whether the worker was backfilled
+        """
+        if not self._items:
+            return None, False
+
+        now = time.time() if now is None else now
+        head = self._items[0][2]
+
+        if head.cpus <= free:
+            return self._items.pop(0)[2], False
+
+        shadow, extra = self.reservation(head.cpus, free, running)
+
+        for i in range(1, len(self._items)):
+            worker = self._items[i][2]
+            if worker.cpus > free:
+                continue
+
+            # no estimates are known, greedy pick of the largest fitting job
+            if shadow is None:
+                return self._items.pop(i)[2], True
+
+            # the job does not touch the cores reserved for the head job
+            if worker.cpus <= extra:
+                return self._items.pop(i)[2], True
+
+            # the job will end before the head job can start
+            expected = getattr(worker, 'expected_duration', None)
+            if expected and now + expected <= shadow:
+                return self._items.pop(i)[2], True
+
+        return None, False
+
+    @staticmethod
+    def reservation(cpus, free, running):
+        """
+        Method computes so called shadow time (time when the job
+        with the given cores can start) and number of extra cores,
+        which will be free at the shadow time even after the job has started
+
+        Returns
+        -------
+        (float, int) or (None, None)
+            shadow time and extra cores or None values if any
+            running job has unknown expected duration
+        """
+        if any(end is None for end, _ in running):
+            return None, None
+
+        available = free
+        for end, cores in sorted(running, key=lambda x: x[0]):
+            available += cores
+            if available >= cpus:
+                return end, available - cpus
+        return None, None
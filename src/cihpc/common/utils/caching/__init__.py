@@ -2,6 +2,27 @@
 # author: Jan Hybs
 
 from cihpc.cfg.config import global_configuration
+from cihpc.common.utils.caching.response_cache import ResponseCache, cached_view
+
+
+_response_cache = None
+
+
+def response_cache():
+    """
+    Returns a shared instance of the ResponseCache configured
+    by the global_configuration.view_cache_opts or None if disabled
+
+    :rtype: ResponseCache
+    """
+    global _response_cache
+
+    if global_configuration.view_cache_opts is None:
+        return None
+
+    if _response_cache is None:
+        _response_cache = ResponseCache(**global_configuration.view_cache_opts)
+    return _response_cache
 
 
 try:
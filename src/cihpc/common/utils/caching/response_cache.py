@@ -0,0 +1,283 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import base64
+import functools
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from loguru import logger
+
+
+class ResponseCache(object):
+    """
+    Two-tier cache of the view responses
+
+    Responses are stored pickled, so the size of each entry is known and
+    the memory tier is limited by the number of bytes rather than the number
+    of entries. The least recently used entries are evicted first.
+
+    If a directory is given, every entry is also written to the disk tier,
+    which survives restarts of the server. The disk tier is limited
+    by its own size budget, the oldest files are removed first.
+
+    The keys should contain a version of the data they were computed from,
+    entries of the older versions are then simply never hit and are evicted
+    eventually.
+
+    Parameters
+    ----------
+    memory : int
+        memory budget in bytes
+    disk : str or None
+        a directory of the disk tier, the disk tier is disabled if None
+    disk_size : int
+        disk budget in bytes
+    """
+
+    suffix = '.pkl'
+
+    def __init__(self, memory=256 * 1024 * 1024, disk=None, disk_size=1024 * 1024 * 1024):
+        self.memory = memory
+        self.disk = disk
+        self.disk_size = disk_size
+
+        # metrics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+
+        if self.disk:
+            os.makedirs(self.disk, exist_ok=True)
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries or bool(self.disk and os.path.exists(self._path(key)))
+
+    def get(self, key, default=None):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pickle.loads(data)
+
+        data = self._read(key)
+        if data is None:
+            self.misses += 1
+            return default
+
+        self.disk_hits += 1
+        self._put(key, data)
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning(f'could not cache the value: {e}')
+            return
+
+        self._put(key, data)
+        self._write(key, data)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+        if self.disk:
+            for path in self._disk_files():
+                self._remove(path)
+
+    def _put(self, key, data):
+        if len(data) > self.memory:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+
+            self._entries[key] = data
+            self._size += len(data)
+
+            while self._size > self.memory:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.disk, key + self.suffix)
+
+    def _disk_files(self):
+        return [
+            os.path.join(self.disk, name)
+            for name in os.listdir(self.disk)
+            if name.endswith(self.suffix)
+        ]
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _read(self, key):
+        if not self.disk:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _write(self, key, data):
+        if not self.disk or len(data) > self.disk_size:
+            return
+
+        path = self._path(key)
+        tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        try:
+            with open(tmp, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f'could not write cache entry {path}: {e}')
+            self._remove(tmp)
+            return
+
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = list()
+        for path in self._disk_files():
+            try:
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+            except OSError:
+                pass
+
+        total = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_size:
+                break
+            self._remove(path)
+            total -= size
+
+    def __repr__(self):
+        return 'ResponseCache({n} entries, {mb:1.2f} MB, hits: {self.hits}, ' \
+               'disk hits: {self.disk_hits}, misses: {self.misses})'.format(
+                    self=self,
+                    n=len(self),
+                    mb=self.size / 1024 / 1024,
+                )
+
+
+def canonical_options(base64data):
+    """
+    Returns the options encoded in the base64 string as a JSON string
+    with sorted keys, so the same options give the same string regardless
+    of the order of the keys. The string is returned unchanged
+    if it cannot be decoded.
+
+    :type base64data: str
+    :rtype: str
+    """
+    if not base64data:
+        return ''
+
+    try:
+        options = json.loads(base64.decodebytes(base64data.encode()).decode())
+    except Exception:
+        return base64data
+    return json.dumps(options, sort_keys=True, separators=(',', ':'), default=str)
+
+
+class DataVersion(object):
+    """
+    Remembers version tokens of the projects for a short time,
+    so the database is not asked on every request
+
+    Parameters
+    ----------
+    version : callable
+        a function which returns the current version token of the given project
+    ttl : float
+        number of seconds a token is considered current
+    """
+
+    def __init__(self, version, ttl=5.0):
+        self.version = version
+        self.ttl = ttl
+        self._tokens = dict()
+
+    def __call__(self, project):
+        now = time.time()
+        token = self._tokens.get(project)
+        if token is None or now - token[0] > self.ttl:
+            token = self._tokens[project] = now, str(self.version(project))
+        return token[1]
+
+
+def cached_view(version, cache=None, ttl=5.0):
+    """
+    Decorator caching responses of a view function func(project, base64data)
+
+    The cache key is composed of the name of the function, the project,
+    the current version token of the project (data and configuration)
+    and the canonical form of the options.
+
+    Parameters
+    ----------
+    version : callable
+        a function which returns a token, which changes whenever new
+        data of the given project are available or its configuration
+        is edited
+    cache : ResponseCache or callable
+        the cache instance or a function returning it
+    ttl : float
+        number of seconds a version token is reused
+    """
+    versions = DataVersion(version, ttl)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(project, base64data=''):
+            instance = cache() if callable(cache) else cache
+            if instance is None:
+                return func(project, base64data)
+
+            key = hashlib.sha1(json.dumps([
+                func.__module__, func.__qualname__, project, versions(project), canonical_options(base64data)
+            ]).encode()).hexdigest()
+
+            result = instance.get(key)
+            if result is None:
+                result = func(project, base64data)
+                instance.set(key, result)
+            return result
+
+        wrapper.versions = versions
+        return wrapper
+
+    return decorator
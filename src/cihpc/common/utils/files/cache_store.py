@@ -0,0 +1,547 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import enum
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+
+from loguru import logger
+
+
+# ioctl request which clones the extents of a file (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+class LinkMode(enum.Enum):
+    """
+    How the files are placed from the store to the destination
+    AUTO tries reflink first, then hardlink and falls back to copy
+    """
+    AUTO = 'auto'
+    REFLINK = 'reflink'
+    HARDLINK = 'hardlink'
+    COPY = 'copy'
+
+
+class CacheCorrupted(Exception):
+    pass
+
+
+def parse_size(value):
+    """
+    Converts size such as 512M or 20G to bytes
+
+    :type value: int or str or None
+    :rtype: int or None
+    """
+    if value is None or isinstance(value, int):
+        return value
+
+    units = dict(K=1024, M=1024 ** 2, G=1024 ** 3, T=1024 ** 4)
+    value = str(value).strip().upper().rstrip('B')
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """
+    Returns sha256 hex digest of the file content
+
+    :type path: str
+    :rtype: str
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class CacheStore(object):
+    """
+    Content addressed store of directory snapshots
+
+    Files are stored once per content (sha256) in the objects directory,
+    so the same files of different snapshots (e.g. build trees of different
+    commits) are deduplicated. A snapshot is a json manifest listing
+    the files, links and directories together with the hash of each file.
+
+    When restoring, the objects are reflinked, hardlinked or copied to the
+    destination and only the files which differ from the snapshot are
+    transferred, extra files are removed. Hardlinked files share the inode
+    with the object, so they must not be modified in place. Such modification
+    is detected (the size or modification time of the object changes),
+    the object is removed and the restore fails.
+
+    To avoid hashing unchanged files again, the stat of every file written
+    or hashed is remembered in a state file of the directory.
+
+    The store is limited by max_size bytes, the least recently used snapshots
+    (saved or restored) are removed first, together with the objects
+    no other snapshot uses.
+
+    Hits, misses and durations of the snapshots are recorded in the stats
+    file, so the time the cache saves can be evaluated.
+
+    Parameters
+    ----------
+    root : str
+        the storage directory
+    max_size : int or None
+        maximum size of the objects in bytes, unlimited if None
+    link : LinkMode
+        how to place the objects to the destination
+    """
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self, root, max_size=None, link=LinkMode.AUTO):
+        self.root = os.path.abspath(root)
+        self.max_size = max_size
+        self.link = link
+
+        self.objects = os.path.join(self.root, 'objects')
+        self.snapshots = os.path.join(self.root, 'snapshots')
+        self.states = os.path.join(self.root, 'states')
+        self.stats = os.path.join(self.root, 'stats.json')
+
+        self._reflink = link in (LinkMode.AUTO, LinkMode.REFLINK)
+        self._hardlink = link in (LinkMode.AUTO, LinkMode.HARDLINK)
+
+        # metrics of the last operation
+        self.transferred = 0
+        self.skipped = 0
+        self.removed = 0
+        self.bytes = 0
+
+    def snapshot_path(self, name):
+        return os.path.join(self.snapshots, name + '.json')
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest)
+
+    def state_path(self, directory):
+        key = hashlib.md5(os.path.abspath(directory).encode()).hexdigest()
+        return os.path.join(self.states, key + '.json')
+
+    def exists(self, name):
+        return os.path.isfile(self.snapshot_path(name))
+
+    def _lock(self, exclusive):
+        os.makedirs(self.root, exist_ok=True)
+        return _FileLock(os.path.join(self.root, '.lock'), exclusive)
+
+    # -----------------------------------------------------------------
+
+    def save(self, name, cwd, directories, meta=None):
+        """
+        Stores the given directories as a snapshot with the given name
+
+        Parameters
+        ----------
+        name : str
+            name of the snapshot
+        cwd : str
+            a directory the directories are relative to
+        directories : list[str]
+        meta : dict
+            optional json serializable info stored in the manifest
+        """
+        self._reset()
+        with self._lock(exclusive=True):
+            manifest = dict(name=name, created=time.time(), meta=meta or dict(), directories=dict())
+            for dirname in directories:
+                manifest['directories'][dirname] = self._save_directory(os.path.join(cwd, dirname))
+
+            manifest['size'] = sum(
+                entry[2] for d in manifest['directories'].values() for entry in d['files']
+            )
+            _write_json(self.snapshot_path(name), manifest)
+            logger.debug(f'saved snapshot {name}: {self.transferred} new object(s), {self.skipped} known object(s)')
+
+            self.evict(keep=name)
+        return manifest
+
+    def _save_directory(self, directory):
+        state = self._read_state(directory)
+        new_state = dict()
+        result = dict(files=list(), links=list(), dirs=list())
+
+        for root, dirs, files in os.walk(directory):
+            rel_root = os.path.relpath(root, directory)
+            for name in sorted(dirs):
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    result['links'].append([os.path.normpath(os.path.join(rel_root, name)), os.readlink(path)])
+                else:
+                    result['dirs'].append(os.path.normpath(os.path.join(rel_root, name)))
+
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                rel = os.path.normpath(os.path.join(rel_root, name))
+                st = os.lstat(path)
+
+                if stat.S_ISLNK(st.st_mode):
+                    result['links'].append([rel, os.readlink(path)])
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+
+                digest = self._known_digest(state.get(rel), st) or self._digest(path, st)
+                self._put(path, digest)
+                obj = os.stat(self.object_path(digest))
+                result['files'].append([rel, digest, st.st_size, obj.st_mtime_ns])
+                new_state[rel] = _stat_key(st) + [digest]
+
+        self._write_state(directory, new_state)
+        return result
+
+    @staticmethod
+    def _known_digest(entry, st):
+        if entry and entry[:-1] == _stat_key(st):
+            return entry[-1]
+        return None
+
+    def _digest(self, path, st):
+        # executable and regular files are stored separately,
+        # since hardlinks share the permissions
+        return file_digest(path, self.chunk_size) + ('-x' if st.st_mode & stat.S_IXUSR else '')
+
+    def _put(self, path, digest):
+        target = self.object_path(digest)
+        if os.path.exists(target):
+            self.skipped += 1
+            return
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = '%s.%d.%d.tmp' % (target, os.getpid(), threading.get_ident())
+        # the store must own the inode, so the objects are never hardlinked from the source
+        if not (self._reflink and self._try_reflink(path, tmp)):
+            shutil.copyfile(path, tmp)
+        os.chmod(tmp, 0o755 if digest.endswith('-x') else 0o644)
+        os.replace(tmp, target)
+
+        self.transferred += 1
+        self.bytes += os.path.getsize(target)
+
+    # -----------------------------------------------------------------
+
+    def restore(self, name, cwd, directories=None):
+        """
+        Restores the snapshot with the given name
+
+        Parameters
+        ----------
+        name : str
+            name of the snapshot
+        cwd : str
+            a directory the directories are relative to
+        directories : list[str]
+            optional subset of the directories to restore
+
+        Returns
+        -------
+        bool
+            False if the snapshot does not exist or is corrupted
+        """
+        self._reset()
+        with self._lock(exclusive=False):
+            manifest = _read_json(self.snapshot_path(name))
+            if manifest is None:
+                return False
+
+            try:
+                for dirname, content in manifest['directories'].items():
+                    if directories is None or dirname in directories:
+                        self._restore_directory(content, os.path.join(cwd, dirname))
+            except CacheCorrupted as e:
+                logger.warning(f'snapshot {name} is corrupted: {e}')
+                corrupted = True
+            else:
+                corrupted = False
+                _touch(self.snapshot_path(name))
+
+        if corrupted:
+            with self._lock(exclusive=True):
+                _remove(self.snapshot_path(name))
+            return False
+
+        logger.debug(f'restored snapshot {name}: {self.transferred} file(s) transferred, '
+                     f'{self.skipped} file(s) unchanged, {self.removed} removed')
+        return True
+
+    def _restore_directory(self, content, directory):
+        state = self._read_state(directory)
+        new_state = dict()
+
+        os.makedirs(directory, exist_ok=True)
+        expected = set(['.'])
+        for rel in content['dirs']:
+            expected.add(rel)
+            os.makedirs(os.path.join(directory, rel), exist_ok=True)
+
+        for rel, target in content['links']:
+            expected.add(rel)
+            path = os.path.join(directory, rel)
+            if os.path.islink(path) and os.readlink(path) == target:
+                continue
+            _remove(path)
+            os.symlink(target, path)
+
+        for rel, digest, size, mtime in content['files']:
+            expected.add(rel)
+            path = os.path.join(directory, rel)
+            obj = self.object_path(digest)
+
+            try:
+                obj_stat = os.stat(obj)
+            except OSError:
+                raise CacheCorrupted(f'object {digest} is missing')
+
+            if obj_stat.st_size != size or obj_stat.st_mtime_ns != mtime:
+                # most likely modified in place through a hardlink
+                _remove(obj)
+                raise CacheCorrupted(f'object {digest} was modified')
+
+            try:
+                st = os.lstat(path)
+            except OSError:
+                st = None
+
+            unchanged = st is not None and stat.S_ISREG(st.st_mode) and (
+                (st.st_ino == obj_stat.st_ino and st.st_dev == obj_stat.st_dev)
+                or self._known_digest(state.get(rel), st) == digest
+            )
+            if unchanged:
+                self.skipped += 1
+            else:
+                if st is not None and stat.S_ISDIR(st.st_mode):
+                    shutil.rmtree(path)
+                self._place(obj, path)
+                self.transferred += 1
+                self.bytes += size
+                st = os.lstat(path)
+
+            new_state[rel] = _stat_key(st) + [digest]
+
+        # remove everything the snapshot does not contain
+        for root, dirs, files in os.walk(directory, topdown=False):
+            for name in files + dirs:
+                path = os.path.join(root, name)
+                rel = os.path.normpath(os.path.relpath(path, directory))
+                if rel not in expected:
+                    if os.path.isdir(path) and not os.path.islink(path):
+                        shutil.rmtree(path)
+                    else:
+                        _remove(path)
+                    self.removed += 1
+
+        self._write_state(directory, new_state)
+
+    def _place(self, obj, path):
+        tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        placed = False
+
+        if self._reflink:
+            placed = self._try_reflink(obj, tmp)
+
+        if not placed and self._hardlink:
+            try:
+                os.link(obj, tmp)
+                placed = True
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+                logger.debug(f'hardlinks are not supported ({e}), will copy the files')
+                self._hardlink = False
+
+        if not placed:
+            shutil.copy2(obj, tmp)
+        os.replace(tmp, path)
+
+    def _try_reflink(self, src, dst):
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            shutil.copystat(src, dst)
+            return True
+        except OSError as e:
+            _remove(dst)
+            logger.debug(f'reflinks are not supported ({e})')
+            self._reflink = False
+            return False
+
+    # -----------------------------------------------------------------
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used snapshots until the objects fit
+        into the max_size and removes the objects no snapshot uses
+
+        Parameters
+        ----------
+        keep : str
+            name of a snapshot which is never removed
+
+        Returns
+        -------
+        int
+            number of removed snapshots
+        """
+        snapshots = list()
+        if os.path.isdir(self.snapshots):
+            for name in os.listdir(self.snapshots):
+                if name.endswith('.json'):
+                    path = os.path.join(self.snapshots, name)
+                    snapshots.append((os.path.getmtime(path), name[:-len('.json')], path))
+
+        # the most recently used snapshots are kept first
+        snapshots.sort(reverse=True)
+        snapshots.sort(key=lambda x: x[1] != keep)
+
+        used, total, removed = set(), 0, list()
+        for mtime, name, path in snapshots:
+            manifest = _read_json(path) or dict(directories=dict())
+            objects = {
+                entry[1]: entry[2]
+                for content in manifest['directories'].values() for entry in content['files']
+            }
+            size = sum(v for k, v in objects.items() if k not in used)
+
+            if self.max_size is not None and total + size > self.max_size and name != keep:
+                logger.debug(f'evicting snapshot {name}')
+                _remove(path)
+                removed.append(name)
+                continue
+
+            used.update(objects.keys())
+            total += size
+
+        self._collect_garbage(used)
+
+        if removed:
+            stats = _read_json(self.stats) or dict()
+            for name in removed:
+                stats.pop(name, None)
+            _write_json(self.stats, stats)
+        return len(removed)
+
+    def _collect_garbage(self, used):
+        if not os.path.isdir(self.objects):
+            return
+
+        for prefix in os.listdir(self.objects):
+            folder = os.path.join(self.objects, prefix)
+            for name in os.listdir(folder):
+                if name not in used:
+                    _remove(os.path.join(folder, name))
+
+    # -----------------------------------------------------------------
+
+    def record(self, name, **values):
+        """
+        Adds the given values to the statistics of the snapshot,
+        e.g. record(name, hits=1, restore_time=0.5)
+
+        Parameters
+        ----------
+        name : str
+            name of the snapshot
+        values : int or float
+            increments of the statistics
+        """
+        with self._lock(exclusive=True):
+            stats = _read_json(self.stats) or dict()
+            entry = stats.setdefault(name, dict())
+            for key, value in values.items():
+                entry[key] = entry.get(key, 0) + value
+            entry['last'] = time.time()
+            _write_json(self.stats, stats)
+
+    def statistics(self, name=None):
+        """
+        Returns the statistics of the given snapshot,
+        or of all the snapshots if name is None
+
+        :rtype: dict
+        """
+        stats = _read_json(self.stats) or dict()
+        if name is not None:
+            return stats.get(name, dict())
+        return stats
+
+    # -----------------------------------------------------------------
+
+    def _reset(self):
+        self.transferred = 0
+        self.skipped = 0
+        self.removed = 0
+        self.bytes = 0
+
+    def _read_state(self, directory):
+        return _read_json(self.state_path(directory)) or dict()
+
+    def _write_state(self, directory, state):
+        _write_json(self.state_path(directory), state)
+
+    def __repr__(self):
+        return 'CacheStore({self.root}, {self.link.value})'.format(self=self)
+
+
+class _FileLock(object):
+    def __init__(self, path, exclusive):
+        self.path = path
+        self.exclusive = exclusive
+        self.fp = None
+
+    def __enter__(self):
+        self.fp = open(self.path, 'a')
+        fcntl.flock(self.fp.fileno(), fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        fcntl.flock(self.fp.fileno(), fcntl.LOCK_UN)
+        self.fp.close()
+        return False
+
+
+def _stat_key(st):
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, obj):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+    with open(tmp, 'w') as fp:
+        json.dump(obj, fp)
+    os.replace(tmp, path)
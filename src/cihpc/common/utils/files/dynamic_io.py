@@ -1,9 +1,12 @@
 #!/usr/bin/python
 # author: Jan Hybs
 
+import codecs
 import os
 import subprocess
-import tempfile
+import threading
+
+from loguru import logger
 
 from cihpc.common.logging import LogConfig
 
@@ -53,26 +56,143 @@ class OpenerFile(Opener):
         return None
 
 
+class RingBuffer(object):
+    """
+    Bounded buffer which keeps only the last capacity bytes written
+
+    :type capacity: int
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.total = 0
+        self._buffer = bytearray()
+
+    @property
+    def truncated(self):
+        return self.total > len(self._buffer)
+
+    def write(self, data):
+        self.total += len(data)
+        self._buffer += data
+        excess = len(self._buffer) - self.capacity
+        if excess > 0:
+            # removal from the beginning of bytearray does not move the data
+            del self._buffer[:excess]
+
+    def getvalue(self):
+        return bytes(self._buffer)
+
+
+class OutputPump(threading.Thread):
+    """
+    Thread which reads the output of the process from a pipe
+    in chunks, tees it to the log file, keeps the last part of it
+    in a ring buffer and passes the decoded chunks to the listeners
+
+    :type listeners: list[callable]
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, fd, buffer, log_path=None, listeners=None):
+        super(OutputPump, self).__init__(daemon=True, name='output-pump')
+        self.fd = fd
+        self.buffer = buffer
+        self.log_path = log_path
+        self.listeners = listeners if listeners is not None else list()
+        self.error = None
+
+    def run(self):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        log = open(self.log_path, 'ab') if self.log_path else None
+        pending = b''
+
+        try:
+            with open(self.fd, 'rb', buffering=0, closefd=True) as pipe:
+                while True:
+                    chunk = pipe.read(self.chunk_size)
+                    if not chunk:
+                        break
+
+                    self.buffer.write(chunk)
+                    if log:
+                        # only complete lines are written, so the outputs
+                        # of the parallel processes are not mixed within a line
+                        pending += chunk
+                        newline = pending.rfind(b'\n') + 1
+                        if newline:
+                            log.write(pending[:newline])
+                            log.flush()
+                            pending = pending[newline:]
+
+                    self._notify(decoder.decode(chunk))
+                self._notify(decoder.decode(b'', final=True))
+        except Exception as e:
+            self.error = e
+            logger.exception('could not read the output of the process')
+        finally:
+            if log:
+                log.write(pending)
+                log.close()
+
+    def _notify(self, text):
+        if not text:
+            return
+
+        for listener in self.listeners:
+            try:
+                listener(text)
+            except Exception:
+                logger.exception(f'output listener {listener} failed')
+
+
 class OpenerBoth(Opener):
+    """
+    Captures the output through a pipe, the output is appended to the log
+    file while the process is running and only the last buffer_size bytes
+    are kept in the memory
+
+    Functions registered via listen receive the decoded output
+    in chunks as soon as it is read.
+    """
+
+    buffer_size = 4 * 1024 * 1024
+
+    # background processes of the job may keep the pipe open
+    join_timeout = 60.0
+
     def __init__(self, location, mode):
         super(OpenerBoth, self).__init__(location, mode)
-        self.tf = None
         self.output = None
+        self.buffer = None
+        self.pump = None
+        self.listeners = list()
+
+    def listen(self, listener):
+        self.listeners.append(listener)
 
     def open(self):
-        fd, self.tf = tempfile.mkstemp()
-        self.fp = os.fdopen(fd, 'w')
+        read_fd, write_fd = os.pipe()
+        self.buffer = RingBuffer(self.buffer_size)
+        self.pump = OutputPump(read_fd, self.buffer, LogConfig.log_path, self.listeners)
+        self.pump.start()
+
+        self.fp = os.fdopen(write_fd, 'w')
         return self.fp
 
     def close(self):
+        # the process holds its own copy of the pipe, so the pump
+        # finishes once both the process and we are done writing
         self.fp.close()
-        with open(self.tf, 'r') as fp:
-            self.output = fp.read()
-        os.unlink(self.tf)
-
-        if LogConfig.log_path and self.output:
-            with open(LogConfig.log_path, 'a') as fp:
-                fp.write(self.output)
+        self.pump.join(self.join_timeout)
+        if self.pump.is_alive():
+            logger.warning(f'output pipe is still open after {self.join_timeout} sec, '
+                           f'the rest of the output will not be captured')
+
+        self.output = self.buffer.getvalue().decode('utf-8', errors='replace')
+        if self.buffer.truncated:
+            logger.debug(f'kept last {len(self.output)} chars of the output ({self.buffer.total} bytes total)')
         return None
 
 
@@ -85,8 +205,8 @@ class DynamicIO(object):
 
     # stdout      - live output to the stdout
     # log         - redirects to the log file
-    # log+stdout  - redirect output to temp file, and after the subprocess
-    #                 has ended, print out to stdout and append to file
+    # log+stdout  - capture the output through a pipe, append it to the log
+    #                 file and keep the last part of it in the memory
     # stdout+log  - same as above
     # null        - redirects to /dev/null
     TYPES = {
@@ -103,6 +223,17 @@ class DynamicIO(object):
         self.opener = self.TYPES.get(self.location, OpenerFile)(self.location, self.mode)
         self.fp = None
 
+    def listen(self, listener):
+        """
+        Registers a function which receives the output in chunks
+        while the process is running, returns False if the output
+        is not captured
+        """
+        if not hasattr(self.opener, 'listen'):
+            return False
+        self.opener.listen(listener)
+        return True
+
     def is_writable(self):
         if self.fp is None:
             return False
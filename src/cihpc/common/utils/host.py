@@ -0,0 +1,236 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import glob
+import hashlib
+import json
+import os
+import platform
+import time
+
+from loguru import logger
+
+
+def _read(path, default=None):
+    try:
+        with open(path, 'r') as fp:
+            return fp.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return default
+
+
+def os_release(paths=('/etc/os-release', '/usr/lib/os-release')):
+    """
+    Returns the fields of the os-release file (NAME, VERSION, ID, ...)
+    :rtype: dict[str, str]
+    """
+    for path in paths:
+        content = _read(path)
+        if content is None:
+            continue
+
+        result = dict()
+        for line in content.splitlines():
+            key, sep, value = line.partition('=')
+            if sep and not key.startswith('#'):
+                result[key.strip()] = value.strip().strip('"\'')
+        return result
+    return dict()
+
+
+def cpu_info(path='/proc/cpuinfo'):
+    """
+    Returns the model of the cpu, number of logical cpus,
+    physical cores and sockets, the values which cannot be
+    determined are None
+
+    :rtype: dict
+    """
+    blocks = [b for b in (_read(path) or '').split('\n\n') if b.strip()]
+    processors = list()
+    for block in blocks:
+        fields = dict()
+        for line in block.splitlines():
+            key, sep, value = line.partition(':')
+            if sep:
+                fields[key.strip()] = value.strip()
+        processors.append(fields)
+
+    model = None
+    for key in ('model name', 'cpu model', 'Processor', 'Hardware', 'cpu'):
+        model = next((p[key] for p in processors if p.get(key)), None)
+        if model:
+            break
+
+    logical = len([p for p in processors if 'processor' in p]) or os.cpu_count()
+    sockets = set(p['physical id'] for p in processors if 'physical id' in p)
+    cores = set((p['physical id'], p['core id']) for p in processors if 'physical id' in p and 'core id' in p)
+
+    return dict(
+        cpu_model=model or platform.processor() or None,
+        cpu_count=logical,
+        cpu_cores=len(cores) or None,
+        cpu_sockets=len(sockets) or None,
+    )
+
+
+def memory_total(path='/proc/meminfo'):
+    """
+    Returns the size of the memory in bytes or None
+    """
+    for line in (_read(path) or '').splitlines():
+        if line.startswith('MemTotal:'):
+            # the value is in kB
+            return int(line.split()[1]) * 1024
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def cpu_governor(root='/sys/devices/system/cpu'):
+    """
+    Returns the scaling governors of the cpus (usually a single one),
+    or None if the frequency scaling is not available
+    """
+    governors = set(filter(None, (_read(p) for p in glob.glob(os.path.join(root, 'cpu*/cpufreq/scaling_governor')))))
+    return ','.join(sorted(governors)) or None
+
+
+def cpu_turbo(root='/sys/devices/system/cpu'):
+    """
+    Returns True if the turbo boost is enabled, None if unknown
+    """
+    no_turbo = _read(os.path.join(root, 'intel_pstate/no_turbo'))
+    if no_turbo is not None:
+        return no_turbo == '0'
+
+    boost = _read(os.path.join(root, 'cpufreq/boost'))
+    if boost is not None:
+        return boost == '1'
+    return None
+
+
+def username():
+    """
+    Returns the user as name:uid:gid
+    """
+    try:
+        import pwd
+        name = pwd.getpwuid(os.getuid()).pw_name
+    except (ImportError, KeyError):
+        import getpass
+        name = getpass.getuser()
+    return '%s:%d:%d' % (name, os.getuid(), os.getgid())
+
+
+def host_fingerprint():
+    """
+    Returns the information about the host, no processes are started,
+    everything is read from /proc, /sys and /etc/os-release
+
+    The fingerprint field is a hash of the hardware and the kernel,
+    the reports with the same fingerprint were measured
+    on the same machine with the same configuration.
+
+    :rtype: dict
+    """
+    uname = os.uname()
+    release = os_release()
+
+    info = dict(
+        name=uname.sysname,
+        hostname=uname.nodename,
+        # the historical names, os_name is the version
+        os_name=release.get('VERSION', ''),
+        os_version=release.get('NAME', ''),
+        os_id=release.get('ID'),
+        username=username(),
+        kernel=uname.release,
+        machine=uname.machine,
+        python=platform.python_version(),
+        memory_total=memory_total(),
+        cpu_governor=cpu_governor(),
+        cpu_turbo=cpu_turbo(),
+    )
+    info.update(cpu_info())
+
+    fields = ['hostname', 'machine', 'kernel', 'cpu_model', 'cpu_count', 'cpu_cores', 'cpu_sockets', 'memory_total']
+    info['fingerprint'] = hashlib.md5(
+        json.dumps([info[f] for f in fields]).encode()
+    ).hexdigest()
+    return info
+
+
+class HostInfoCache(object):
+    """
+    Class caches the host information on the disk
+
+    The cached value is used until it expires (ttl in seconds)
+    or until the host reboots (different boot id), since the kernel,
+    the memory or the cpu settings may have changed.
+    The file is named after the host, so the cache directory
+    can be shared by the nodes of a cluster.
+
+    Parameters
+    ----------
+    directory: str
+        cache directory, the cache is disabled if None
+    ttl: float
+        number of seconds the value is valid
+    provider: callable
+        function which obtains the value
+    boot_id: str
+        location of the boot id
+    """
+
+    def __init__(self, directory, ttl=24 * 60 * 60, provider=host_fingerprint,
+                 boot_id='/proc/sys/kernel/random/boot_id'):
+        self.directory = directory
+        self.ttl = ttl
+        self.provider = provider
+        self.boot_id = boot_id
+
+    @property
+    def location(self):
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, 'host-%s.json' % os.uname().nodename)
+
+    def _load(self, boot_id):
+        content = _read(self.location) if self.location else None
+        if not content:
+            return None
+
+        try:
+            cached = json.loads(content)
+        except ValueError:
+            return None
+
+        if cached.get('boot_id') != boot_id or time.time() - cached.get('created', 0) > self.ttl:
+            return None
+        return cached.get('info')
+
+    def _save(self, boot_id, info):
+        tmp = '%s.%d.tmp' % (self.location, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, 'w') as fp:
+                json.dump(dict(boot_id=boot_id, created=time.time(), info=info), fp)
+            # other processes see either the old or the new file
+            os.replace(tmp, self.location)
+        except OSError as e:
+            logger.debug(f'could not cache the host info in {self.location}: {e}')
+
+    def get(self):
+        """
+        Returns the cached value or a new one
+        :rtype: dict
+        """
+        boot_id = _read(self.boot_id)
+        info = self._load(boot_id)
+        if info is None:
+            info = self.provider()
+            if self.location:
+                self._save(boot_id, info)
+        return info
@@ -99,7 +99,10 @@ def main(cmd_args=None):
 
     for project_definition in iter_project_definition(args):
         # prepare process
-        project = ProcessProject(project_definition)
+        project = ProcessProject(
+            project_definition,
+            initialize_repository=args.action.enum is not ArgAction.Values.ROLLUP,
+        )
         logger.info(f'processing project {project_definition.name}, action {args.action}')
 
         if args.action.enum is ArgAction.Values.RUN:
@@ -107,6 +110,12 @@ def main(cmd_args=None):
                 if stage and args.action.contains_stage(stage):
                     project.process_stage(stage)
 
+        elif args.action.enum is ArgAction.Values.ROLLUP:
+            from cihpc.core.db import CIHPCMongo
+            from cihpc.core.db.rollup import Rollup
+
+            Rollup(CIHPCMongo.get(project_definition.name)).rebuild()
+
 
 def _init_first_project(args, config_path, variables, project_name, project_dir):
     from cihpc.cfg import cfgutil
@@ -3,7 +3,7 @@
 from loguru import logger
 from collections.__init__ import defaultdict
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING
 
 from cihpc.cfg.cfgutil import Config as cfg
 from cihpc.common.utils import strings, datautils
@@ -20,6 +20,15 @@ class Fields(object):
     DURATION = 'duration'
 
 
+def index_key(index):
+    """
+    Returns a hashable key representing the given index dictionary
+    :type index: dict
+    """
+    return tuple(sorted((str(k), v if isinstance(v, (str, int, float, bool, type(None))) else str(v))
+                        for k, v in (index or dict()).items()))
+
+
 class Mongo(object):
     """
     Class Mongo manages connection and queries
@@ -34,7 +43,7 @@ class Mongo(object):
         self.project_name = project_name
         self._was_warned = defaultdict(lambda: False)
 
-        opts = self._get_database(opts=None)
+        opts = dict(self._get_database(opts=None))
         opts['connect'] = True
         if 'type' in opts:
             opts.pop('type')
@@ -82,6 +91,14 @@ class CIHPCMongo(Mongo):
 
     files : pymongo.database.Collection
         A collection containing all the file logs
+
+    rollup : pymongo.database.Collection
+        A collection containing pre-aggregated statistics of the reports
+        see :class:`cihpc.core.db.rollup.Rollup`
+
+    regressions : pymongo.database.Collection
+        A collection containing the detected performance regressions
+        see :class:`cihpc.core.db.regression.RegressionDetector`
     """
 
     _instances = dict()
@@ -106,6 +123,10 @@ class CIHPCMongo(Mongo):
         self.files = self.db.get_collection(opts.get('col_files_name'))
         self.history = self.db.get_collection(opts.get('col_history_name'))
         self.running = self.db.get_collection(opts.get('col_running_name'))
+        self.rollup = self.db.get_collection(opts.get('col_rollup_name'))
+        self.regressions = self.db.get_collection(opts.get('col_regressions_name'))
+        self._indexed = set()
+        self._server_version = None
 
     def _get_artifacts(self, opts=None):
         if opts:
@@ -211,12 +232,132 @@ class CIHPCMongo(Mongo):
 
         return items
 
+    def server_version(self):
+        """
+        Returns version of the MongoDB server as a tuple of ints,
+        (0, 0) if it cannot be determined
+
+        Returns
+        -------
+        tuple[int]
+        """
+        if self._server_version is None:
+            try:
+                self._server_version = tuple(self.client.server_info().get('versionArray', [0, 0])[:2])
+            except Exception as e:
+                logger.warning(f'could not determine the server version: {e}')
+                self._server_version = (0, 0)
+        return self._server_version
+
+    def data_version(self):
+        """
+        Returns a token which changes whenever reports are inserted
+        or removed, it is composed of the latest report id
+        and the number of the reports
+
+        Returns
+        -------
+        str
+        """
+        latest = self.reports.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+        count = self.reports.estimated_document_count()
+        return '%s-%d' % (latest['_id'] if latest else None, count)
+
+    def ensure_index(self, fields, prefix='index'):
+        """
+        Method will create a compound index on the given fields
+        of the reports collection (only once per instance)
+
+        Parameters
+        ----------
+        fields : list[str]
+            names of the fields
+        prefix : str
+            a prefix for each field name, default is index
+        """
+        keys = tuple(f'{prefix}.{k}' if prefix else k for k in sorted(fields))
+        if not keys or keys in self._indexed:
+            return
+
+        try:
+            name = self.reports.create_index([(k, ASCENDING) for k in keys])
+            logger.debug(f'ensured index {name} on db.{self.reports.name}')
+        except Exception as e:
+            logger.warning(f'could not create index on {keys}: {e}')
+        self._indexed.add(keys)
+
+    def index_stats(self, indices):
+        """
+        Method will compute number of reports and mean duration for
+        each of the given indices in a single aggregation,
+        the warm-up runs are not counted
+
+        Parameters
+        ----------
+        indices : list[dict]
+            list of index dictionaries, all of them should share the same keys
+
+        Returns
+        -------
+        dict[tuple, dict]
+            a dictionary where key is :func:`index_key` of the index and value
+            is a dict with fields count, duration (mean) and std (sample)
+        """
+        indices = [x for x in indices if x]
+        if not indices:
+            return dict()
+
+        keys = sorted(set(k for index in indices for k in index.keys()))
+        values = {k: list() for k in keys}
+        for index in indices:
+            for k in keys:
+                if k in index and index[k] not in values[k]:
+                    values[k].append(index[k])
+
+        pipeline = [
+            {
+                '$match': {
+                    **{f'index.{k}': {'$in': v} for k, v in values.items()},
+                    'result.warm-up': {'$ne': True},
+                }
+            },
+            {
+                '$group': {
+                    '_id'     : {k.replace('.', '_'): f'$index.{k}' for k in keys},
+                    'count'   : {'$sum': 1},
+                    'duration': {'$avg': '$result.duration'},
+                    'std'     : {'$stdDevSamp': '$result.duration'},
+                }
+            },
+        ]
+        logger.debug(f'db.getCollection("{self.reports.name}").aggregate(\n%s\n)' %
+                     strings.pad_lines(strings.to_json(pipeline))
+                     )
+
+        result = dict()
+        with Timer('db aggregate: index stats', log=logger.debug):
+            for item in self.reports.aggregate(pipeline):
+                group = item['_id']
+                index = {k: group.get(k.replace('.', '_')) for k in keys if k.replace('.', '_') in group}
+                result[index_key(index)] = dict(
+                    count=item['count'],
+                    duration=item['duration'],
+                    std=item.get('std'),
+                )
+        return result
+
     def commit_history(self, filters=None, excludes=('config',)):
         exclude = {x: 0 for x in excludes} if excludes else None
 
         return list(self.history.find(filters, exclude))
 
     def timers_stats(self):
+        from cihpc.core.db.rollup import Rollup
+
+        rollup = Rollup(self)
+        if rollup.available():
+            return rollup.timers_stats()
+
         pipeline = [
             {
                 '$group': {
@@ -308,4 +449,6 @@ class CIHPCMongo(Mongo):
             col_files_name='files',
             col_history_name='hist',
             col_running_name='running',
+            col_rollup_name='rollup',
+            col_regressions_name='regressions',
         )
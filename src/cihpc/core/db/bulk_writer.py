@@ -0,0 +1,176 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import threading
+import time
+
+import bson
+from loguru import logger
+from pymongo.errors import BulkWriteError
+
+from cihpc.core.db.rollup import Rollup
+
+
+class BulkWriter(object):
+    """
+    Buffered writer of the collect results
+
+    Documents of many collect results are accumulated and inserted
+    using unordered bulk inserts once the buffer holds batch_docs documents
+    or batch_bytes bytes. The thread which fills the buffer over the limit
+    performs the flush, so the producers are slowed down when the database
+    cannot keep up. Call flush to make sure everything is stored.
+
+    After each flush the rollup collection is updated with the inserted reports.
+    The commits of the inserted reports are tested for performance regressions
+    whenever the owner flushes the writer, not after every batch.
+
+    :type connection:   cihpc.core.db.CIHPCMongo
+    :type batch_docs:   int
+    :type batch_bytes:  int
+    :type rollup:       bool
+    :type detector:     cihpc.core.db.regression.RegressionDetector
+    """
+
+    def __init__(self, connection, batch_docs=1000, batch_bytes=16 * 1024 * 1024, rollup=True, detector=None):
+        self.connection = connection
+        self.batch_docs = max(batch_docs, 1)
+        self.batch_bytes = max(batch_bytes, 1)
+        self.rollup = Rollup(connection) if rollup and connection else None
+        self.detector = detector
+        self._pending_commits = set()
+
+        # metrics
+        self.documents = 0
+        self.logs = 0
+        self.bytes = 0
+        self.batches = 0
+        self.duration = 0.0
+
+        self._buffer = list()
+        self._buffered_docs = 0
+        self._buffered_bytes = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def for_step(cls, step, connection=None):
+        """
+        Creates a writer with batch sizes taken from the collect section
+
+        :type step: cihpc.core.structures.project_stage.ProjectStage
+        :type connection: cihpc.core.db.CIHPCMongo
+        """
+        from cihpc.core.db import CIHPCMongo
+        from cihpc.core.db.regression import RegressionDetector
+
+        connection = connection or CIHPCMongo.get_default()
+        return cls(
+            connection,
+            batch_docs=step.collect.batch_size,
+            batch_bytes=step.collect.batch_bytes,
+            detector=RegressionDetector.for_step(step, connection) if connection else None,
+        )
+
+    @property
+    def throughput(self):
+        """
+        Returns number of inserted documents per second
+        """
+        if self.duration <= 0.0:
+            return 0.0
+        return self.documents / self.duration
+
+    def add(self, collect_results):
+        """
+        Method adds results to the buffer and flushes
+        the buffer if any of the limits is reached
+
+        :type collect_results: list[cihpc.artifacts.base.CollectResult]
+        """
+        with self._lock:
+            for item in collect_results:
+                if not item.items:
+                    continue
+
+                self._buffer.append(item)
+                self._buffered_docs += len(item.items)
+                self._buffered_bytes += sum(len(bson.encode(x)) for x in item.items)
+                self._buffered_bytes += sum(len(x.get('data') or b'') for x in item.logs)
+
+            if self._buffered_docs >= self.batch_docs or self._buffered_bytes >= self.batch_bytes:
+                self.flush(detect=False)
+
+    def flush(self, detect=True):
+        """
+        Method inserts all the buffered results into the database
+
+        :param detect: test the commits inserted so far for the regressions
+        """
+        with self._lock:
+            self._insert()
+            if detect:
+                self._detect()
+
+    def _insert(self):
+        with self._lock:
+            buffer, self._buffer = self._buffer, list()
+            buffered_bytes, self._buffered_bytes, self._buffered_docs = self._buffered_bytes, 0, 0
+
+            if not buffer:
+                return
+
+            start = time.time()
+            try:
+                # save logs first, all at once
+                logs = [log for item in buffer for log in item.logs]
+                if logs:
+                    log_ids = self.connection.files.insert_many(logs, ordered=False).inserted_ids
+                    offset = 0
+                    for item in buffer:
+                        if item.logs:
+                            item.update(log_ids[offset:offset + len(item.logs)])
+                            offset += len(item.logs)
+                    self.logs += len(log_ids)
+
+                documents = [doc for item in buffer for doc in item.items]
+                for i in range(0, len(documents), self.batch_docs):
+                    self.connection.reports.insert_many(documents[i:i + self.batch_docs], ordered=False)
+                    self.batches += 1
+
+            except BulkWriteError as e:
+                logger.error(f'bulk insert failed, inserted {e.details.get("nInserted")} document(s), '
+                             f'{len(e.details.get("writeErrors", []))} error(s)')
+                raise
+
+            self.duration += time.time() - start
+            self.documents += len(documents)
+            self.bytes += buffered_bytes
+            logger.debug(f'inserted {len(documents)} reports and {len(logs)} files')
+
+            # the reports are stored already, the rollup can be rebuilt if this fails
+            if self.rollup:
+                try:
+                    self.rollup.update(documents)
+                except Exception as e:
+                    logger.warning(f'could not update the rollup collection: {e}')
+
+            if self.detector:
+                self._pending_commits.update((doc.get('git') or dict()).get('commit') for doc in documents)
+
+    def _detect(self):
+        commits, self._pending_commits = sorted(self._pending_commits - {None}), set()
+        if not self.detector or not commits:
+            return
+
+        # the reports are stored already, the detection can be repeated later
+        try:
+            self.detector.update(commits)
+        except Exception as e:
+            logger.warning(f'could not detect the performance regressions: {e}')
+
+    def __repr__(self):
+        return '{self.documents} document(s) and {self.logs} file(s) inserted in {self.batches} batch(es), ' \
+               '{mb:1.2f} MB in {self.duration:1.2f} sec ({self.throughput:1.1f} docs/sec)'.format(
+                    self=self,
+                    mb=self.bytes / 1024 / 1024,
+                )
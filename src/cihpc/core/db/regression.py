@@ -0,0 +1,358 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import datetime
+import hashlib
+import json
+import math
+
+import numpy as np
+from loguru import logger
+from pymongo import ASCENDING, DESCENDING, ReplaceOne
+
+from cihpc.common.utils.timer import Timer
+from cihpc.core.db.rollup import Rollup
+
+
+def group_moments(groups, values, size):
+    """
+    Returns count, mean and sample variance of the values
+    for each of the size groups
+
+    Parameters
+    ----------
+    groups: np.ndarray
+        group id of each value
+    values: np.ndarray
+    size: int
+        number of groups
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray, np.ndarray)
+    """
+    count = np.bincount(groups, minlength=size).astype(float)
+    total = np.bincount(groups, weights=values, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        sq = np.bincount(groups, weights=(values - mean[groups]) ** 2, minlength=size)
+        variance = sq / (count - 1)
+    return count, mean, variance
+
+
+def welch_test(n1, mean1, var1, n2, mean2, var2):
+    """
+    One-sided Welch's t-test of all the groups at once,
+    the alternative is that the mean of the second sample is greater
+
+    Returns
+    -------
+    np.ndarray
+        p-values, nan if a group has less than 2 values in any sample
+    """
+    from scipy import stats as st
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a, b = var1 / n1, var2 / n2
+        se = np.sqrt(a + b)
+        t = (mean2 - mean1) / se
+        df = (a + b) ** 2 / (a ** 2 / (n1 - 1) + b ** 2 / (n2 - 1))
+
+        pvalue = st.t.sf(t, df)
+        # identical values in both samples, the difference is exact
+        exact = (se == 0) & (n1 > 1) & (n2 > 1)
+        pvalue[exact] = np.where(mean2[exact] > mean1[exact], 0.0, 1.0)
+    return pvalue
+
+
+def mann_whitney(baseline, current):
+    """
+    One-sided Mann-Whitney U test, the alternative is
+    that the current values are greater
+    """
+    from scipy import stats as st
+
+    try:
+        return st.mannwhitneyu(current, baseline, alternative='greater').pvalue
+    except ValueError:
+        # all the values are identical
+        return 1.0
+
+
+def change_point(series):
+    """
+    Returns the position of the most likely single change
+    of the mean in the series (the first item of the new segment)
+    and the relative magnitude of the change, or (None, 0.0)
+
+    The split maximizes the between-segment sum of squares,
+    which is the first step of the binary segmentation.
+
+    :type series: list[float]
+    :rtype: (int, float)
+    """
+    x = np.asarray(series, dtype=float)
+    n = len(x)
+    if n < 2:
+        return None, 0.0
+
+    k = np.arange(1, n)
+    left = np.cumsum(x)[:-1] / k
+    right = (x.sum() - np.cumsum(x)[:-1]) / (n - k)
+    score = k * (n - k) / n * (right - left) ** 2
+
+    best = int(np.argmax(score))
+    return best + 1, float(np.exp(right[best] - left[best]) - 1.0)
+
+
+class RegressionDetector(object):
+    """
+    Class compares the durations of a commit with a rolling baseline
+    made of the previous commits, for each index and frame
+
+    The durations are log-transformed (the noise of the timings is
+    multiplicative) and tested with one-sided Welch's t-test computed
+    for all the groups at once, or with the Mann-Whitney U test, which
+    does not assume any distribution. A group is flagged if the test
+    is significant and the slowdown of the geometric mean exceeds
+    the threshold. The change-point of the flagged group along the commit
+    history tells whether the slowdown was introduced by the commit itself.
+
+    The flagged regressions are stored in their own collection, the
+    regressions of the commit are replaced whenever it is tested again,
+    so the detection can run after every insert.
+
+    Parameters
+    ----------
+    connection: cihpc.core.db.CIHPCMongo
+    window: int
+        number of previous commits the baseline is made of
+    alpha: float
+        significance level of the test
+    threshold: float
+        minimal relative slowdown which is reported
+    method: str
+        welch or mann-whitney
+    min_samples: int
+        minimal number of values in the current and the baseline sample
+    """
+
+    methods = ('welch', 'mann-whitney')
+
+    def __init__(self, connection, window=10, alpha=0.01, threshold=0.05, method='welch', min_samples=3):
+        if method not in self.methods:
+            raise ValueError(f'unknown method {method}, use one of {", ".join(self.methods)}')
+
+        self.connection = connection
+        self.collection = connection.regressions if connection else None
+        self.window = window
+        self.alpha = alpha
+        self.threshold = threshold
+        self.method = method
+        self.min_samples = max(min_samples, 2)
+
+    @classmethod
+    def for_step(cls, step, connection=None):
+        """
+        Creates a detector configured by the collect section, or None if disabled
+
+        :type step: cihpc.core.structures.project_stage.ProjectStage
+        :type connection: cihpc.core.db.CIHPCMongo
+        """
+        from cihpc.core.db import CIHPCMongo
+
+        regressions = step.collect.regressions
+        if not regressions:
+            return None
+
+        return cls(
+            connection or CIHPCMongo.get_default(),
+            window=regressions.window,
+            alpha=regressions.alpha,
+            threshold=regressions.threshold,
+            method=regressions.method,
+            min_samples=regressions.min_samples,
+        )
+
+    @staticmethod
+    def key(commit, index, frame):
+        return hashlib.md5(
+            json.dumps([commit, index, frame], sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def baseline(self, git):
+        """
+        Returns list of the previous commits with their datetime,
+        the oldest first
+        :type git: dict
+        :rtype: list[(str, datetime.datetime)]
+        """
+        if not git.get('datetime'):
+            return list()
+
+        # rollup is much smaller than the reports, if it is filled
+        rollup = Rollup(self.connection)
+        collection, match = self.connection.reports, dict()
+        if rollup.available():
+            collection, match = self.connection.rollup, dict(frame=None)
+
+        match['git.datetime'] = {'$lt': git['datetime']}
+        pipeline = [
+            {'$match': match},
+            {'$group': {'_id': '$git.commit', 'datetime': {'$max': '$git.datetime'}}},
+            {'$sort': {'datetime': -1}},
+            {'$limit': self.window},
+        ]
+        return [(x['_id'], x['datetime']) for x in reversed(list(collection.aggregate(pipeline)))]
+
+    def samples(self, commits):
+        """
+        Returns the log-transformed durations of the given commits,
+        the warm-up runs are skipped
+
+        Returns
+        -------
+        (list[(dict, str)], np.ndarray, np.ndarray, np.ndarray)
+            list of the groups (index, frame), group id,
+            position of the commit in the commits and value of each sample
+        """
+        position = {commit: i for i, commit in enumerate(commits)}
+        self.connection.ensure_index(['commit'], prefix='git')
+        projection = {'git.commit': 1, 'index': 1, 'result.duration': 1, 'timers.name': 1, 'timers.duration': 1}
+        cursor = self.connection.reports.find(
+            {'git.commit': {'$in': list(commits)}, 'result.warm-up': {'$ne': True}},
+            projection,
+        )
+
+        keys, groups, positions, values = dict(), list(), list(), list()
+        for document in cursor:
+            commit = position[(document.get('git') or dict()).get('commit')]
+            index = {k: v for k, v in (document.get('index') or dict()).items() if k not in Rollup.exclude_index}
+
+            for frame, duration in Rollup.entries(document):
+                if duration <= 0:
+                    continue
+                key = json.dumps([index, frame], sort_keys=True, default=str)
+                if key not in keys:
+                    keys[key] = len(keys)
+                groups.append(keys[key])
+                positions.append(commit)
+                values.append(math.log(duration))
+
+        return (
+            [tuple(json.loads(key)) for key in keys],
+            np.array(groups, dtype=int),
+            np.array(positions, dtype=int),
+            np.array(values, dtype=float),
+        )
+
+    def detect(self, commit):
+        """
+        Tests the given commit against its baseline
+        and returns list of the regressions found
+
+        :type commit: str
+        :rtype: list[dict]
+        """
+        report = self.connection.reports.find_one({'git.commit': commit}, {'git': 1})
+        if not report:
+            return list()
+
+        git = report.get('git') or dict()
+        baseline = self.baseline(git)
+        if not baseline:
+            logger.debug(f'no baseline for the commit {commit}')
+            return list()
+
+        commits = [c for c, _ in baseline] + [commit]
+        dates = [d for _, d in baseline] + [git.get('datetime')]
+        current = len(commits) - 1
+
+        keys, groups, positions, values = self.samples(commits)
+        if not keys:
+            return list()
+
+        size = len(keys)
+        is_current = positions == current
+        n1, mean1, var1 = group_moments(groups[~is_current], values[~is_current], size)
+        n2, mean2, var2 = group_moments(groups[is_current], values[is_current], size)
+
+        with np.errstate(invalid='ignore'):
+            ratio = np.exp(mean2 - mean1)
+            candidates = (n1 >= self.min_samples) & (n2 >= self.min_samples) & (ratio > 1.0 + self.threshold)
+
+        candidates = np.flatnonzero(candidates)
+        if not len(candidates):
+            return list()
+
+        # only the groups which slowed down enough are tested
+        if self.method == 'welch':
+            pvalue = welch_test(n1[candidates], mean1[candidates], var1[candidates],
+                                n2[candidates], mean2[candidates], var2[candidates])
+        else:
+            pvalue = np.array([
+                mann_whitney(values[(groups == g) & ~is_current], values[(groups == g) & is_current])
+                for g in candidates
+            ])
+
+        # mean of each group and commit, for the change-point detection
+        cells = groups * len(commits) + positions
+        cell_count = np.bincount(cells, minlength=size * len(commits)).reshape(size, len(commits))
+        cell_sum = np.bincount(cells, weights=values, minlength=size * len(commits)).reshape(size, len(commits))
+
+        regressions = list()
+        detected = datetime.datetime.now()
+        for g, p in zip(candidates, pvalue):
+            if not p < self.alpha:
+                continue
+
+            index, frame = keys[g]
+            measured = np.flatnonzero(cell_count[g])
+            series = cell_sum[g, measured] / cell_count[g, measured]
+            split, shift = change_point(series)
+            change = measured[split] if split is not None else current
+
+            regressions.append(dict(
+                _id=self.key(commit, index, frame),
+                git=git,
+                index=index,
+                frame=frame,
+                method=self.method,
+                pvalue=float(p),
+                ratio=float(ratio[g]),
+                current=dict(count=int(n2[g]), mean=float(math.exp(mean2[g]))),
+                baseline=dict(count=int(n1[g]), mean=float(math.exp(mean1[g])), commits=len(baseline)),
+                change_point=dict(commit=commits[change], datetime=dates[change], shift=shift),
+                detected=detected,
+            ))
+        return regressions
+
+    def update(self, commits):
+        """
+        Tests the given commits and stores the regressions found,
+        the previously stored regressions of the commits are replaced
+
+        :type commits: list[str]
+        :rtype: int
+        """
+        total = 0
+        for commit in commits:
+            if not commit:
+                continue
+
+            with Timer(f'regression detection {commit}', log=logger.debug):
+                regressions = self.detect(commit)
+
+            self.collection.delete_many({
+                'git.commit': commit,
+                '_id': {'$nin': [x['_id'] for x in regressions]},
+            })
+            if regressions:
+                self.collection.bulk_write([ReplaceOne({'_id': x['_id']}, x, upsert=True) for x in regressions])
+                logger.warning(f'commit {commit}: {len(regressions)} performance regression(s) detected')
+            total += len(regressions)
+        return total
+
+    def ensure_indexes(self):
+        self.collection.create_index([('git.commit', ASCENDING)])
+        self.collection.create_index([('detected', DESCENDING)])
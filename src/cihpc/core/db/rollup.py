@@ -0,0 +1,307 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import datetime
+import hashlib
+import json
+import math
+from collections import defaultdict
+
+from loguru import logger
+from pymongo import ASCENDING, UpdateOne
+
+from cihpc.common.utils import strings
+from cihpc.common.utils.timer import Timer
+
+
+class QuantileSketch(object):
+    """
+    A mergeable quantile sketch with a relative accuracy alpha
+
+    Values are counted in logarithmic buckets, so two sketches are merged
+    simply by adding the counts of the buckets (which MongoDB can do atomically
+    using $inc). A quantile is estimated with the relative error of at most alpha.
+
+    :type buckets: dict[str, int]
+    """
+
+    alpha = 0.01
+    gamma = (1 + alpha) / (1 - alpha)
+    min_value = 1e-9
+
+    def __init__(self, buckets=None):
+        self.buckets = defaultdict(int)
+        if buckets:
+            self.merge(buckets)
+
+    @classmethod
+    def key(cls, value):
+        if value > cls.min_value:
+            return 'p%d' % math.ceil(math.log(value, cls.gamma))
+        if value < -cls.min_value:
+            return 'n%d' % math.ceil(math.log(-value, cls.gamma))
+        return 'z'
+
+    @classmethod
+    def value(cls, key):
+        if key == 'z':
+            return 0.0
+        value = 2 * cls.gamma ** int(key[1:]) / (cls.gamma + 1)
+        return value if key[0] == 'p' else -value
+
+    def add(self, value, count=1):
+        self.buckets[self.key(value)] += count
+        return self
+
+    def merge(self, other):
+        """
+        :type other: QuantileSketch or dict
+        """
+        buckets = other.buckets if isinstance(other, QuantileSketch) else other
+        for key, count in (buckets or dict()).items():
+            self.buckets[key] += count
+        return self
+
+    @property
+    def count(self):
+        return sum(self.buckets.values())
+
+    def quantile(self, q):
+        """
+        Returns an estimate of the q-quantile (0 <= q <= 1)
+        or None if the sketch is empty
+        """
+        count = self.count
+        if not count:
+            return None
+
+        rank = q * (count - 1)
+        total = 0
+        for value, key in sorted((self.value(k), k) for k in self.buckets):
+            total += self.buckets[key]
+            if total > rank:
+                return value
+        return value
+
+
+class Rollup(object):
+    """
+    Class maintains a collection of pre-aggregated statistics of the reports
+
+    For each (commit, index, frame) a document holds the count, sum,
+    sum of squares, min, max and a quantile sketch of the duration.
+    The frame None represents the entire report (result.duration),
+    other frames are the named timers of the report (timers.duration).
+
+    Since all the values are mergeable, the documents are updated
+    incrementally whenever new reports are inserted. The reports inserted
+    before the rollup existed are added only by the rebuild, so the rollup
+    is used (see available) only once the rebuild has finished.
+
+    :type connection: cihpc.core.db.CIHPCMongo
+    """
+
+    # index fields, which are unique for each run and would prevent any aggregation
+    exclude_index = ('run_id',)
+
+    # maximum number of the report ids kept for each rollup document
+    max_ids = 1000
+
+    # version of the rollup documents, the rollup must be rebuilt when it changes
+    version = 1
+
+    # id and frame of the document written once the rebuild is complete,
+    # the frame never matches any of the report frames
+    meta_id = '__meta__'
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.collection = connection.rollup
+
+    @classmethod
+    def key(cls, commit, index, frame):
+        return hashlib.md5(
+            json.dumps([commit, index, frame], sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    @classmethod
+    def entries(cls, document):
+        """
+        Yields tuples (frame, duration) of the given report
+        :type document: dict
+        """
+        duration = (document.get('result') or dict()).get('duration')
+        if isinstance(duration, (int, float)):
+            yield None, duration
+
+        for timer in document.get('timers') or list():
+            if isinstance(timer, dict) and isinstance(timer.get('duration'), (int, float)) and timer.get('name'):
+                yield timer['name'], timer['duration']
+
+    def updates(self, documents):
+        """
+        Returns list of the update operations for the given reports,
+        the warm-up runs are skipped
+        :type documents: list[dict]
+        :rtype: list[UpdateOne]
+        """
+        groups = dict()
+        for document in documents:
+            if (document.get('result') or dict()).get('warm-up'):
+                continue
+
+            git = document.get('git') or dict()
+            index = {k: v for k, v in (document.get('index') or dict()).items() if k not in self.exclude_index}
+
+            for frame, duration in self.entries(document):
+                key = self.key(git.get('commit'), index, frame)
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = dict(
+                        insert=dict(git=git, index=index, problem=document.get('problem') or dict(), frame=frame),
+                        count=0, sum=0.0, sumsq=0.0, min=duration, max=duration,
+                        sketch=QuantileSketch(), ids=list(),
+                    )
+
+                group['count'] += 1
+                group['sum'] += duration
+                group['sumsq'] += duration * duration
+                group['min'] = min(group['min'], duration)
+                group['max'] = max(group['max'], duration)
+                group['sketch'].add(duration)
+                if '_id' in document:
+                    group['ids'].append(document['_id'])
+
+        operations = list()
+        for key, group in groups.items():
+            inc = dict(count=group['count'], sum=group['sum'], sumsq=group['sumsq'])
+            inc.update({'sketch.%s' % k: v for k, v in group['sketch'].buckets.items()})
+
+            update = {
+                '$inc'        : inc,
+                '$min'        : dict(min=group['min']),
+                '$max'        : dict(max=group['max']),
+                '$setOnInsert': group['insert'],
+            }
+            if group['ids']:
+                update['$push'] = dict(ids={'$each': group['ids'], '$slice': -self.max_ids})
+            operations.append(UpdateOne({'_id': key}, update, upsert=True))
+        return operations
+
+    def update(self, documents):
+        """
+        Updates the rollup documents with the given (already inserted) reports
+        :type documents: list[dict]
+        """
+        operations = self.updates(documents)
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+        return len(operations)
+
+    def rebuild(self, batch_size=10000):
+        """
+        Drops the rollup collection and builds it from all the reports
+        """
+        logger.info(f'rebuilding rollup collection db.{self.collection.name}')
+        self.collection.drop()
+        self.ensure_indexes()
+
+        projection = {'git': 1, 'index': 1, 'problem': 1, 'result.duration': 1, 'result.warm-up': 1, 'timers.name': 1, 'timers.duration': 1}
+        total, batch = 0, list()
+        with Timer('rollup rebuild', log=logger.info):
+            for document in self.connection.reports.find({}, projection, batch_size=batch_size):
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    self.update(batch)
+                    total += len(batch)
+                    batch = list()
+                    logger.debug(f'processed {total} reports')
+
+            self.update(batch)
+            total += len(batch)
+
+        # from now on the rollup covers all the reports
+        self.collection.replace_one({'_id': self.meta_id}, dict(
+            _id=self.meta_id,
+            frame=self.meta_id,
+            version=self.version,
+            reports=total,
+            built=datetime.datetime.now(),
+        ), upsert=True)
+
+        logger.info(f'processed {total} reports, rollup has {self.collection.count_documents({})} documents')
+        return total
+
+    def ensure_indexes(self):
+        self.collection.create_index([('git.commit', ASCENDING), ('frame', ASCENDING)])
+
+    def available(self):
+        """
+        Returns True if the rollup was rebuilt with the current version,
+        i.e. it covers all the reports, otherwise the reports must be used
+        """
+        try:
+            meta = self.collection.find_one({'_id': self.meta_id})
+        except Exception as e:
+            logger.warning(f'rollup collection is not available: {e}')
+            return False
+
+        if not meta or meta.get('version') != self.version:
+            logger.debug(f'rollup collection db.{self.collection.name} is not complete, run the rollup action')
+            return False
+        return True
+
+    def timers_stats(self):
+        """
+        Same as the CIHPCMongo.timers_stats but computed from the rollup
+        """
+        pipeline = [
+            {
+                '$match': {'frame': None}
+            },
+            {
+                '$group': {
+                    '_id'    : {
+                        'hash': '$git.commit',
+                        'date': {
+                            '$dateToString': {
+                                'date'  : '$git.datetime',
+                                'format': '%Y-%m-%d %H:%M:%S'
+                            }
+                        }
+                    },
+                    'dur_sum': {'$sum': '$sum'},
+                    'dur_max': {'$max': '$max'},
+                    'dur_min': {'$min': '$min'},
+                    'items'  : {'$sum': '$count'},
+                }
+            },
+            {
+                '$addFields': {
+                    'dur_avg': {'$divide': ['$dur_sum', {'$max': ['$items', 1]}]}
+                }
+            },
+            {
+                '$sort': {
+                    '_id.date': -1
+                }
+            }
+        ]
+        logger.debug(f'db.getCollection("{self.collection.name}").aggregate(\n%s\n)' %
+                     strings.pad_lines(strings.to_json(pipeline))
+                     )
+        return list(self.collection.aggregate(pipeline))
+
+    @staticmethod
+    def moments(count, sum, sumsq):
+        """
+        Returns mean, population std and sample std
+        """
+        if not count:
+            return None, None, None
+
+        mean = sum / count
+        variance = max(sumsq - count * mean * mean, 0.0)
+        std = math.sqrt(variance / count)
+        sample_std = math.sqrt(variance / (count - 1)) if count > 1 else None
+        return mean, std, sample_std
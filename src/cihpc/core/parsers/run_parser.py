@@ -9,6 +9,7 @@ class ArgAction(object):
     class Values(enum.Enum):
         RUN = 'run'
         FOREACH = 'foreach'
+        ROLLUP = 'rollup'
 
     def __init__(self, value):
         parts = str(value).split(':')
@@ -107,6 +108,8 @@ def parse_args(cmd_args=None):
             - git-foreach   will perform installation and testing 
                             for the previous commits in the main repository
                             See Git Foreach option group below for more details
+            - rollup        will rebuild the collection with pre-aggregated
+                            statistics of the reports from scratch
         ''')
 
     # pbs options
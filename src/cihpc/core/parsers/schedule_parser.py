@@ -57,6 +57,70 @@ def parse_args(cmd_args=None):
         help='''R|
         Path to the secret.yaml file which contains db config,
     ''')
+    parser.add_argument(
+        '--parallel-commits',
+        type=int,
+        default=1,
+        help='''R|
+        Number of commits processed at the same time, each
+        commit is checked out to its own git worktree under
+        <workdir>/worktrees and all of them share --cpus cores.
+        Applies to the history policy only.
+    ''')
+    parser.add_argument(
+        '--cpus',
+        type=int,
+        default=None,
+        help='''R|
+        Number of cores shared by the commits processed at the
+        same time, default value is the number of cores
+    ''')
+    parser.add_argument(
+        '--policy',
+        choices=['history', 'bisect'],
+        default='history',
+        help='''R|
+        How the commits are picked:
+          - history: the latest commits of the active branches
+          - bisect: commits between --good and --bad until
+                    the first slow commit is found
+    ''')
+
+    # bisect group
+    bisect_group_parser = parser.add_argument_group(
+        'Bisect option',
+        'when policy is bisect, further specify the commit range and the metric'
+    )
+    bisect_group_parser.add_argument(
+        '--good',
+        type=str,
+        default=None,
+        help='''R|
+        SHA of the last commit with the expected performance
+    ''')
+    bisect_group_parser.add_argument(
+        '--bad',
+        type=str,
+        default=None,
+        help='''R|
+        SHA of a later commit with the worse performance
+    ''')
+    bisect_group_parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.05,
+        help='''R|
+        Relative slowdown which is considered a regression,
+        default value 0.05 stands for 5 percent
+    ''')
+    bisect_group_parser.add_argument(
+        '--frame',
+        type=str,
+        default=None,
+        help='''R|
+        Name of the timer which is compared, if not set
+        the duration of the whole report is used
+    ''')
     parser.add_argument(
         'actions',
         nargs='*',
@@ -89,6 +153,9 @@ def parse_args(cmd_args=None):
     # parse given arguments
     args = parser.parse_args(cmd_args)
 
+    if args.policy == 'bisect' and not (args.good and args.bad):
+        parser.error('policy bisect requires both --good and --bad')
+
     # convert some fields
     args.log_level = getattr(logging, args.log_level.upper())
     if args.debug:
@@ -0,0 +1,325 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import glob
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from loguru import logger
+
+from cihpc.cfg.cfgutil import configure_string
+from cihpc.core.db.bulk_writer import BulkWriter
+from cihpc.core.processing.step_collect import (
+    CollectSummary, convert_method, create_report_context, load_collect_module, move_files, process_file_isolated,
+    process_reports,
+)
+from cihpc.core.processing.step_collect_parse import create_extractor, process_step_collect_parse
+
+
+class CollectWatcher(threading.Thread):
+    """
+    Thread which watches files produced by a single running worker
+    and hands them to the pipeline as soon as they are complete
+
+    A file is considered complete once its size and modification time
+    did not change between two consecutive polls or once the process
+    of the worker has exited.
+
+    :type pipeline: CollectPipeline
+    :type worker:   cihpc.core.processing.stage.ProcessStage
+    :type process_result: cihpc.core.processing.step_shell.ProcessStepResult
+    """
+
+    def __init__(self, pipeline, worker, pattern, interval=1.0, process_result=None):
+        super(CollectWatcher, self).__init__(daemon=True)
+        self.pipeline = pipeline
+        self.worker = worker
+        self.process_result = process_result
+        self.pattern = pattern
+        self.interval = interval
+
+        self.files = list()
+        self.futures = list()
+        self._seen = dict()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.poll()
+
+    def poll(self, final=False):
+        for file in glob.glob(self.pattern, recursive=True):
+            if file in self.files:
+                continue
+
+            try:
+                stat = os.stat(file)
+            except OSError:
+                continue
+
+            signature = stat.st_size, stat.st_mtime
+            if final or self._seen.get(file) == signature:
+                if self.pipeline.claim(file):
+                    self.files.append(file)
+                    self.futures.append(self.pipeline.submit_file(self.worker, file, self.process_result))
+            else:
+                self._seen[file] = signature
+
+    def stop(self):
+        """
+        Method stops the watching and submits all the remaining files
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.poll(final=True)
+
+
+class CollectStream(object):
+    """
+    Extracts the reports from the output of a single running worker
+    and hands them to the pipeline as soon as they are complete
+
+    :type pipeline:  CollectPipeline
+    :type worker:    cihpc.core.processing.stage.ProcessStage
+    :type extractor: cihpc.core.processing.step_collect_parse.ReportExtractor
+    :type process_result: cihpc.core.processing.step_shell.ProcessStepResult
+    """
+
+    def __init__(self, pipeline, worker, extractor, process_result=None):
+        self.pipeline = pipeline
+        self.worker = worker
+        self.extractor = extractor
+        self.process_result = process_result
+        self.futures = list()
+
+        # whether the output is actually captured
+        self.attached = False
+
+    def feed(self, chunk):
+        self._submit(self.extractor.feed(chunk))
+
+    def stop(self):
+        self._submit(self.extractor.close())
+
+    def _submit(self, reports):
+        for report in reports:
+            self.futures.append(self.pipeline.submit_report(self.worker, report, self.process_result))
+
+
+class CollectPipeline(object):
+    """
+    Class collects artifacts of the stage workers in the background
+    on its own bounded thread pool, so the worker can release its cores
+    right after its process has exited
+
+    Report files are parsed one by one as soon as they appear and the results
+    are passed to the buffered writer, which inserts them in batches.
+
+    :type project:  cihpc.core.structures.project.Project
+    :type stage:    cihpc.core.structures.project_stage.ProjectStage
+    :type writer:   cihpc.core.db.bulk_writer.BulkWriter
+    """
+
+    def __init__(self, project, stage, writer=None):
+        self.project = project
+        self.stage = stage
+        self.collect = stage.collect
+
+        self.writer = None
+        if self.collect.save_to_db:
+            self.writer = writer or BulkWriter.for_step(stage)
+
+        self.instance = load_collect_module(project, stage)
+        self.conversion = convert_method(self.collect.type)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(self.collect.workers, self.collect.processes),
+            thread_name_prefix='collect',
+        )
+
+        # report files can be parsed in the worker processes
+        self.process_executor = None
+        if self.collect.processes > 1:
+            self.process_executor = ProcessPoolExecutor(max_workers=self.collect.processes)
+
+        self.documents = 0
+
+        self._claimed = set()
+        self._futures = list()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def claim(self, file):
+        """
+        Method returns True if the file was not yet claimed by other worker
+        """
+        with self._lock:
+            if file in self._claimed:
+                return False
+            self._claimed.add(file)
+            return True
+
+    def watch(self, worker, process_result=None):
+        """
+        Method starts watching the files of the given worker
+
+        Parameters
+        ----------
+        worker: cihpc.core.processing.stage.ProcessStage
+        process_result: cihpc.core.processing.step_shell.ProcessStepResult
+            result of the run, filled in once the process has ended
+
+        Returns
+        -------
+        CollectWatcher or None
+        """
+        if not self.collect.files:
+            return None
+
+        pattern = os.path.join(self.project.workdir, configure_string(self.collect.files, worker.variables))
+        watcher = CollectWatcher(self, worker, pattern, self.collect.poll_interval, process_result)
+        watcher.start()
+        return watcher
+
+    def stream(self, worker, process_result=None):
+        """
+        Method returns a stream, which processes the reports
+        in the output of the given worker while it is running
+
+        Parameters
+        ----------
+        worker: cihpc.core.processing.stage.ProcessStage
+        process_result: cihpc.core.processing.step_shell.ProcessStepResult
+            result of the run, filled in once the process has ended
+
+        Returns
+        -------
+        CollectStream or None
+        """
+        if not self.collect.parse:
+            return None
+
+        return CollectStream(self, worker, create_extractor(self.collect.parse), process_result)
+
+    def submit_file(self, worker, file, process_result=None):
+        return self._submit(self._process, worker, [file], True, process_result)
+
+    def submit_report(self, worker, report, process_result=None):
+        return self._submit(self._process, worker, [report], False, process_result)
+
+    def submit(self, worker, process_result, watcher=None, stream=None):
+        """
+        Method schedules the rest of the collection of the given worker,
+        the result is stored in the worker.collect_result once done
+
+        Parameters
+        ----------
+        worker: cihpc.core.processing.stage.ProcessStage
+        process_result: cihpc.core.processing.step_shell.ProcessStepResult
+        watcher: CollectWatcher
+            watcher of the worker files created by the method watch
+        stream: CollectStream
+            stream of the worker output created by the method stream
+        """
+        if watcher:
+            watcher.stop()
+        if stream:
+            stream.stop()
+
+        return self._submit(self._finish, worker, process_result, watcher, stream)
+
+    def close(self):
+        """
+        Method waits for all the scheduled collections and flushes
+        the writer
+        """
+        while True:
+            with self._lock:
+                futures, self._futures = self._futures, list()
+            if not futures:
+                break
+            wait(futures)
+
+        self.executor.shutdown(wait=True)
+        if self.process_executor:
+            self.process_executor.shutdown(wait=True)
+        logger.info(f'collected {self.documents} document(s)')
+
+        if self.writer:
+            self.writer.flush()
+
+    def _submit(self, fn, *args):
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(self._log_error)
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    @staticmethod
+    def _log_error(future):
+        if future.exception():
+            logger.opt(exception=future.exception()).error('artifact collection failed')
+
+    def _process(self, worker, reports, is_file, process_result=None):
+        # the resources of the result are set once the process has ended
+        process_result = process_result or getattr(worker, '_shell_result', None)
+        context = create_report_context(self.stage, worker.variables, process_result, self.project.report_git)
+
+        if is_file and self.process_executor:
+            results, timers_info, timers_total = self.process_executor.submit(
+                process_file_isolated,
+                self.project.name, self.collect.module, self.collect.type, context, reports[0]
+            ).result()
+            self._store(results)
+            return timers_total, timers_info
+
+        results, timers_info, timers_total = process_reports(
+            self.instance, reports, self.conversion, is_file=is_file, context=context
+        )
+        self._store(results)
+        return timers_total, timers_info
+
+    def _finish(self, worker, process_result, watcher, stream=None):
+        result = CollectSummary(total=[], items=[])
+        if stream and not stream.attached:
+            stream = None
+
+        for futures in [stream.futures if stream else None, watcher.futures if watcher else None]:
+            if futures:
+                wait(futures)
+                totals = [f.result() for f in futures if not f.exception()]
+                result.add(sum(x[0] for x in totals), [i for x in totals for i in x[1]])
+
+        if stream:
+            logger.debug(f'artifacts: processed {len(stream.futures)} reports from the output')
+
+        elif self.collect.parse:
+            reports = process_step_collect_parse(self.project, self.stage, process_result, worker.variables)
+            logger.debug(f'artifacts: found {len(reports)} reports to process')
+            result.add(*self._process(worker, reports, False, process_result))
+
+        if watcher:
+            move_files(self.stage, watcher.files, worker.variables, self.project.workdir)
+
+        # a job with several repetitions submits each of them
+        with self._lock:
+            if worker.collect_result:
+                worker.collect_result.total.extend(result.total)
+                worker.collect_result.items.extend(result.items)
+            else:
+                worker.collect_result = result
+        return result
+
+    def _store(self, results):
+        with self._lock:
+            self.documents += sum(len(x.items) for x in results)
+
+        if self.writer:
+            self.instance.save_to_db(results, self.writer)
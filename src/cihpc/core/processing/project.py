@@ -1,20 +1,20 @@
 #!/usr/bin/python
 # author: Jan Hybs
-from typing import List
+from typing import Iterable
 
 from loguru import logger
 import os
 import threading
 
 from cihpc.common.processing.pool import LogStatusFormat, WorkerPool
-from cihpc.common.utils.datautils import merge_dict
 from cihpc.common.utils.parallels import extract_cpus_from_worker
 from cihpc.common.utils.timer import Timer
+from cihpc.core.db.bulk_writer import BulkWriter
+from cihpc.core.processing.collect_pipeline import CollectPipeline
 from cihpc.core.processing.stage import ProcessStage
 import cihpc.common.utils.progress as progress
 
-import cihpc.artifacts.base as artifacts_base
-from cihpc.core.structures.project_stage import ProjectStage
+from cihpc.core.structures.project_stage import ProjectStage, StageOrder
 import cihpc.core.db as db
 from cihpc.exceptions.exec_error import OnError
 
@@ -24,11 +24,15 @@ class ProcessProject(object):
     :type project:  cihpc.core.structures.project.Project
     """
 
-    def __init__(self, project, initialize_repository=True):
+    def __init__(self, project, initialize_repository=True, budget=None):
+        """
+        :type budget: cihpc.common.processing.pool.CoreBudget
+        :param budget: cores shared with the other projects running at the same time
+        """
         self.project = project
         self.definition = project
+        self.budget = budget
         os.makedirs(self.project.workdir, exist_ok=True)
-        os.chdir(self.project.workdir)
 
         if self.project.use_database:
             db.CIHPCMongo.set_default(
@@ -41,8 +45,7 @@ class ProcessProject(object):
                 main_repo.initialize()
                 logger.info(f'Repo {main_repo.name} currently at {main_repo.index_info()}')
                 # register info about git to report
-
-                artifacts_base.CIHPCReport.global_git.update(
+                self.project.report_git = dict(
                     name=main_repo.name,
                     branch=main_repo.branch,
                     commit=main_repo.commit,
@@ -70,21 +73,18 @@ class ProcessProject(object):
         """
         for stage in self.project.stages:
             if stage:
-                threads = ProcessStage.create(self.project, stage)
+                threads = self.create_process_stage_threads(stage)
                 self._process_stage_threads(stage, threads)
 
     def get_stage_variable_stats(self, stage: ProjectStage):
-        variables = self.project.global_args
-        variables['__stage__'] = stage.stage_args
-
-        for i, v in enumerate(stage.variables.expand()):
-            vars = merge_dict(variables, v)
-            index: dict = ProcessStage.expand_index(stage.index, vars)
-            repeat = ProcessStage.determine_number_of_repetitions(index, stage.smart_repeat)
+        for vars, index, repeat in ProcessStage.plan_repetitions(self.project, stage):
             yield repeat, index
 
-    def create_process_stage_threads(self, stage:ProjectStage) -> List[ProcessStage]:
-        return ProcessStage.create(self.project, stage)
+    def create_process_stage_threads(self, stage:ProjectStage) -> Iterable[ProcessStage]:
+        # workers are created on demand unless they must be sorted first
+        if stage.order is StageOrder.LONGEST_FIRST:
+            return ProcessStage.create(self.project, stage)
+        return ProcessStage.iter_create(self.project, stage)
 
     def process_stage(self, stage: ProjectStage):
         return self._process_stage_threads(
@@ -92,19 +92,47 @@ class ProcessProject(object):
             self.create_process_stage_threads(stage)
         )
 
-    def _process_stage_threads(self, stage: ProjectStage, threads: List[ProcessStage]):
+    @staticmethod
+    def _bind_threads(threads, pipeline, writer):
+        for thread in threads:
+            thread.collect_pipeline = pipeline
+            thread.collect_writer = writer
+            yield thread
+
+    def _process_stage_threads(self, stage: ProjectStage, threads: Iterable[ProcessStage]):
         with Timer(stage.ord_name) as timer:
-            pool = WorkerPool(cpu_count=stage.parallel.cpus, threads=threads)
+            # all the collected results of the stage are inserted using a single writer
+            writer = None
+            if stage.collect and stage.collect.save_to_db and self.project.use_database:
+                writer = BulkWriter.for_step(stage)
+
+            # collect artifacts in the background if requested
+            pipeline = None
+            if stage.collect and stage.collect.background:
+                pipeline = CollectPipeline(self.project, stage, writer)
+
+            if isinstance(threads, list):
+                total = len(threads)
+                jobs = '%d job(s)' % total
+                threads = list(self._bind_threads(threads, pipeline, writer))
+            else:
+                # the exact number of jobs is known once all of them are created
+                total = stage.variables.estimate() * max(stage.smart_repeat.value or 1, 1)
+                jobs = 'up to %d job(s)' % total
+                threads = self._bind_threads(threads, pipeline, writer)
+
+            pool = WorkerPool(cpu_count=stage.parallel.cpus, threads=threads, pin=stage.parallel.pin, budget=self.budget)
             pool.update_cpu_values(extract_cpus_from_worker)
 
             if stage.parallel:
-                logger.info(f'{len(threads)} job(s) will be now executed in parallel\n'
+                logger.info(f'{jobs} will be now executed in parallel\n'
                             'allocated cores: {stage.parallel.cpus}')
             else:
-                logger.info(f'{len(threads)} job(s) will be now executed in serial')
+                logger.info(f'{jobs} will be now executed in serial')
 
             default_status = pool.get_statuses(LogStatusFormat.ONELINE)
-            progress_line = progress.Line(total=len(threads), desc='%s: %s' % (stage.ord_name, default_status), tty=False)
+            progress_line = progress.Line(total=total, desc='%s: %s' % (stage.ord_name, default_status), tty=False)
+            finished = dict(jobs=0, documents=0)
 
             def update_status_enter(worker: ProcessStage):
                 progress_line.desc = '%02d-%s: %s ' % (
@@ -115,6 +143,10 @@ class ProcessProject(object):
                 progress_line.update(0)
 
             def update_status_exit(worker: ProcessStage):
+                finished['jobs'] += 1
+                if worker and worker.collect_result:
+                    finished['documents'] += sum(worker.collect_result.total)
+
                 progress_line.desc = '%02d-%s: %s ' % (
                     stage.ord,
                     worker.debug_name if worker else '?',
@@ -127,8 +159,18 @@ class ProcessProject(object):
 
             # run in serial or parallel
             progress_line.start()
-            pool.start()
-            progress_line.close()
+            try:
+                pool.start()
+            finally:
+                progress_line.close()
+
+                if pipeline:
+                    pipeline.close()
+
+                if writer:
+                    writer.flush()
+                    logger.info(f'stage {stage.ord_name}: {writer}')
+            logger.info(f'stage {stage.ord_name}: {pool.stats}')
 
             if pool.terminate:
                 logger.error('Caught pool terminate signal!')
@@ -139,8 +181,9 @@ class ProcessProject(object):
                 if pool.exception.on_error is OnError.BREAK:
                     return False
 
-        timers_total = sum([sum(x.collect_result.total) for x in threads if x.collect_result])
-        logger.info(f'{len(threads)} processes finished, found {timers_total} documents')
+        # background collection finishes after the workers
+        timers_total = pipeline.documents if pipeline else finished['documents']
+        logger.info(f'{finished["jobs"]} processes finished, found {timers_total} documents')
         return True
 
     @classmethod
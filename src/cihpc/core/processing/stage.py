@@ -2,22 +2,28 @@
 # author: Jan Hybs
 
 from loguru import logger
+import itertools
 import os
+import time
 import subprocess as sp
 
 from cihpc.core.processing.step_collect import process_step_collect
+from cihpc.core.processing.step_collect_parse import create_extractor
 from cihpc.core.processing.step_shell import ProcessStepResult
 
 from cihpc.common.utils.files.dynamic_io import DynamicIO
 
 
+from cihpc.common.processing.accounting import CgroupScope, wait_with_usage
+from cihpc.common.processing.affinity import available_cores, format_cpulist, pinned
 from cihpc.common.processing.pool import SimpleWorker
 from cihpc.common.utils.datautils import merge_dict
 from cihpc.core.processing.step_cache import ProcessStepCache
 from cihpc.cfg.cfgutil import configure_string, configure_object
 from cihpc.common.utils.files.temp_file import TempFile
-from cihpc.common.utils.parallels import parse_cpu_property
+from cihpc.common.utils.parallels import parse_cpu_property, extract_cpus_from_worker
 import cihpc.core.db as db
+from cihpc.core.structures.project_stage import StageOrder
 from cihpc.exceptions.exec_error import ExecError, OnError
 
 
@@ -34,6 +40,9 @@ class ProcessStage(SimpleWorker):
     _cache: ProcessStepCache
     """
 
+    # number of configurations planned at once
+    plan_chunk_size = 1000
+
     @classmethod
     def create(cls, project, stage, variables=None):
         """
@@ -45,22 +54,44 @@ class ProcessStage(SimpleWorker):
         variables: dict
             optional variables for the sub stage
 
+        Returns
+        -------
+        list[ProcessStage]
         """
 
         if not stage:
             return []
 
-        variables = variables or project.global_args
-        variables['__stage__'] = stage.stage_args
-        result = list()
+        result = list(cls.iter_create(project, stage, variables))
+
+        if stage.order is StageOrder.LONGEST_FIRST:
+            cls.sort_by_expected_duration(result)
+
+        return result
+
+    @classmethod
+    def iter_create(cls, project, stage, variables=None):
+        """
+        Lazily yields workers of the given stage, configurations
+        are expanded and planned only when more workers are needed
+
+        Parameters
+        ----------
+        stage: cihpc.core.structures.project_stage.ProjectStage
+            stage which is this instance bound to
+
+        variables: dict
+            optional variables for the sub stage
 
-        items = list(stage.variables.expand())
-        total = len(items)
-        for i, v in enumerate(items):
-            vars = merge_dict(variables, v)
-            current_index = cls.expand_index(stage.index, vars)
-            repeat = cls.determine_number_of_repetitions(current_index, stage.smart_repeat)
+        Yields
+        ------
+        ProcessStage
+        """
+        if not stage:
+            return
 
+        plan = cls.plan_repetitions(project, stage, variables, history=True)
+        for i, (vars, current_index, repeat, history) in enumerate(plan):
             for j in range(repeat):
                 prefixes = [
                     'conf-%02d--reps-%02d-' % (i + 1, j + 1),
@@ -68,9 +99,74 @@ class ProcessStage(SimpleWorker):
 
                 worker = ProcessStage(project, stage, vars)
                 worker.name_prefix = os.path.join(*prefixes)
-                result.append(worker)
+                worker.history = history
+                # the warm-up runs precede the first job of the configuration only
+                if j > 0:
+                    worker.warmup = 0
+                yield worker
 
-        return result
+    @classmethod
+    def plan_repetitions(cls, project, stage, variables=None, history=False):
+        """
+        Method will lazily expand the configurations of the given stage
+        and determine how many repetitions each of them still needs.
+        When smart or adaptive repeat is used, the existing results are
+        counted using a single aggregation for each chunk of configurations.
+
+        Parameters
+        ----------
+        project: cihpc.core.structures.project.Project
+        stage: cihpc.core.structures.project_stage.ProjectStage
+        variables: dict
+            optional variables for the sub stage
+        history: bool
+            if True, the statistics of the existing results
+            (see index_stats, None if unknown) are yielded as well
+
+        Yields
+        ------
+        (dict, dict, int)
+            tuples (variables, index, repetitions)
+            or (variables, index, repetitions, history)
+        """
+        variables = variables or project.global_args
+        variables['__stage__'] = stage.stage_args
+
+        spec = stage.smart_repeat
+        connection = db.CIHPCMongo.get_default()
+        use_stats = bool(connection and stage.index and (spec.is_complex() or spec.is_adaptive()))
+        if use_stats:
+            connection.ensure_index(stage.index.keys())
+
+        configurations, required, found = 0, 0, 0
+        expanded = stage.variables.expand()
+        while True:
+            items = list()
+            for v in itertools.islice(expanded, cls.plan_chunk_size):
+                vars = merge_dict(variables, v)
+                items.append((vars, cls.expand_index(stage.index, vars)))
+
+            if not items:
+                break
+
+            stats = connection.index_stats([index for _, index in items]) if use_stats else dict()
+            for vars, index in items:
+                stat = stats.get(db.index_key(index)) if index else None
+                total = stat['count'] if stat else 0
+                repeat = spec.remaining(total, stat)
+                logger.debug(f'index: {index}, found: {total}, repetition: {repeat}')
+
+                configurations += 1
+                required += repeat
+                found += total
+                yield (vars, index, repeat, stat) if history else (vars, index, repeat)
+
+        if spec.is_complex():
+            logger.info(f'{configurations} configuration(s), required: {spec.value} each, '
+                        f'found: {found} in total, repetitions: {required}')
+        elif spec.is_adaptive() and use_stats:
+            logger.info(f'{configurations} configuration(s), found: {found} results in total, '
+                        f'{configurations - required} configuration(s) already converged')
 
     @staticmethod
     def expand_index(index, variables):
@@ -79,54 +175,48 @@ class ProcessStage(SimpleWorker):
         return dict()
 
     @staticmethod
-    def get_number_of_repetitions(index) -> int:
-        connection = db.CIHPCMongo.get_default()
-        if connection:
-            query = {f'index.{key}': value for key, value in index.items()}
-            total = connection.reports.find(query).count()
-            return total
-        return 0
-
-    @staticmethod
-    def determine_number_of_repetitions(index, spec):
+    def sort_by_expected_duration(workers):
         """
+        Method will estimate duration of each worker based on the reports
+        with the same index and sorts the workers in place, longest first.
+
+        Configurations which were never seen are estimated by the mean
+        duration per core of the known configurations times the number
+        of cores the worker will use.
 
         Parameters
         ----------
-        index: dict
-        spec: cihpc.core.structures.project_step_repeat.ProjectStepRepeat
-
-        Returns
-        -------
-        int
+        workers: list[ProcessStage]
         """
+        connection = db.CIHPCMongo.get_default()
+        if not connection or not workers:
+            return workers
 
-        min_repeat = spec.value if spec else 1
-        if not min_repeat or min_repeat < 1:
-            min_repeat = 1
-
-        if not index or not spec.is_complex():
-            return min_repeat
+        stats = connection.index_stats([w.current_index for w in workers])
 
-        connection = db.CIHPCMongo.get_default()
-        if connection:
-            query = {f'index.{key}': value for key, value in index.items()}
-            total = connection.reports.find(query).count()
-
-            if total == 0:
-                repeat = min_repeat
-            elif total < min_repeat:
-                repeat = min_repeat - total
+        known, unknown = list(), list()
+        for worker in workers:
+            stat = stats.get(db.index_key(worker.current_index)) if worker.current_index else None
+            if stat and stat.get('duration') is not None:
+                worker.expected_duration = stat['duration']
+                known.append(worker)
             else:
-                repeat = 0
+                unknown.append(worker)
 
-            # logger.debug(f'index: {index}')
-            # logger.debug(f'query: db.{connection.reports.name}.find({query})')
-            logger.info(f'required: {min_repeat}, found: {total}, repetition: {repeat}')
+        if known and unknown:
+            total_cpus = sum(extract_cpus_from_worker(w) for w in known)
+            per_cpu = sum(w.expected_duration for w in known) / max(total_cpus, 1)
+            for worker in unknown:
+                worker.expected_duration = per_cpu * extract_cpus_from_worker(worker)
 
-            return repeat
+        logger.info(f'estimated duration of {len(known)} configuration(s) from history, '
+                    f'{len(unknown)} configuration(s) were never seen')
 
-        return min_repeat
+        workers.sort(key=lambda w: (-(w.expected_duration or 0.0), -extract_cpus_from_worker(w)))
+        return workers
+
+    # variables which differ between the jobs of the same configuration
+    _job_variables = ('__cpuset__', '__unique__', '__current__')
 
     def __init__(self, project, stage, variables):
         """
@@ -153,8 +243,15 @@ class ProcessStage(SimpleWorker):
         self._shell_result = None
         self._cache = None
         self.collect_result = None
+        self.collect_pipeline = None
+        self.collect_writer = None
         self.current_index = None
 
+        # number of the discarded runs before the measured ones
+        self.warmup = self.stage.smart_repeat.warmup
+        # statistics of the results of the configuration already in the database
+        self.history = None
+
         if self.stage.index:
             self.current_index = configure_object(self.stage.index, self.variables)
 
@@ -194,6 +291,13 @@ class ProcessStage(SimpleWorker):
     def _run(self):
         project = self.project
         step = self.stage
+        start = time.time()
+
+        # the variables are shared by the repetitions of the configuration
+        self.variables = dict(
+            self.variables,
+            __cpuset__=self.cpuset.cpulist if self.cpuset else format_cpulist(available_cores()),
+        )
 
         if self._cache_init():
             return True
@@ -225,28 +329,76 @@ class ProcessStage(SimpleWorker):
             # ---------------------------------------------------------------------
 
             args = self._generate_files(self.variables, tmp_sh, tmp_cont)
-            self._shell_result = self._run_script(args)
-
-            if self._shell_result.returncode != 0:
-                if self.stage.on_error in (OnError.EXIT, OnError.BREAK):
-                    logger.error(f'Process ended with {self._shell_result.returncode} and on-error is set to {self.stage.on_error}')
-                    raise ExecError(
-                        reason=ExecError.EXECUTION_FAILED,
-                        on_error=self.stage.on_error,
-                        details=dict(
-                            returncode = self._shell_result.returncode,
-                            duration = self._shell_result.duration
-                        )
-                    )
+
+            # warm-up runs first, then the measured runs until
+            # the repetition spec is satisfied
+            spec = step.smart_repeat
+            durations = list()
+            repetition = 0
+            while repetition < self.warmup or spec.more_runs(durations, self.history):
+                warmup = repetition < self.warmup
+                result = self._run_repetition(args, repetition, warmup)
+                if not warmup:
+                    durations.append(result.duration)
+                repetition += 1
+
+            if spec.is_adaptive():
+                logger.info(f'{self.ord_name}: {len(durations)} measured run(s), '
+                            f'relative width of the interval: {spec.adaptive.width(durations, self.history):1.3f}')
 
         if self._cache:
-            self._cache_save()
+            self._cache_save(time.time() - start)
 
-        if self.stage.collect:
+        if self.stage.collect and not step.shell:
             self.collect_result = self._collect()
 
         return True
 
+    def _run_repetition(self, args, repetition=0, warmup=False):
+        """
+        Runs the script once and collects its reports,
+        the reports of the warm-up runs are marked as such
+        :rtype: ProcessStepResult
+        """
+        watcher = None
+        stream = None
+        result = ProcessStepResult()
+        result.repetition = repetition
+        result.warmup = warmup
+        result.cpuset = self.cpuset
+
+        # watch the report files and the output while the process is running
+        if self.collect_pipeline:
+            watcher = self.collect_pipeline.watch(self, result)
+            stream = self.collect_pipeline.stream(self, result)
+
+        try:
+            self._shell_result = self._run_script(args, stream, result)
+        finally:
+            if watcher:
+                watcher.stop()
+
+        if result.returncode != 0:
+            if self.stage.on_error in (OnError.EXIT, OnError.BREAK):
+                logger.error(f'Process ended with {result.returncode} and on-error is set to {self.stage.on_error}')
+                raise ExecError(
+                    reason=ExecError.EXECUTION_FAILED,
+                    on_error=self.stage.on_error,
+                    details=dict(
+                        returncode = result.returncode,
+                        duration = result.duration
+                    )
+                )
+
+        if self.stage.collect:
+            # release the cores right away, the pipeline will collect the results
+            if self.collect_pipeline:
+                self.collect_pipeline.submit(self, result, watcher, stream)
+            else:
+                self.collect_result = self._collect(self.collect_result)
+
+        return result
+
     def _generate_files(self, format_args, tmp_sh, tmp_cont):
         project = self.project
         step = self.stage
@@ -263,12 +415,8 @@ class ProcessStage(SimpleWorker):
 
                 tmp_sh.write_section('CONFIGURATION', '\n'.join(['# ' + x for x in vars_json.splitlines()]))
 
-            if project.init_shell:
-                configured = configure_string(project.init_shell, format_args)
-                tmp_sh.write_section('INIT SHELL', configured)
-
-            configured = configure_string(step.shell, format_args)
-            tmp_sh.write_section('STEP SHELL', configured)
+            for section, configured in self._configured_shell(format_args):
+                tmp_sh.write_section(section, configured)
             args = ['bash', tmp_sh.path]
         # logger.warning(tmp_sh.content)
 
@@ -279,11 +427,41 @@ class ProcessStage(SimpleWorker):
             args = ['bash', tmp_cont.path]
         return args
 
-    def _run_script(self, args):
-        io = DynamicIO(self.stage.output)
-        result = ProcessStepResult()
+    def _configured_shell(self, format_args):
+        """
+        Returns sections of the script as a list of tuples (name, content)
+        :type format_args: dict
+        :rtype: list[(str, str)]
+        """
+        sections = list()
+        if self.project.init_shell:
+            sections.append(('INIT SHELL', configure_string(self.project.init_shell, format_args)))
+        if self.stage.shell:
+            sections.append(('STEP SHELL', configure_string(self.stage.shell, format_args)))
+        return sections
+
+    def _run_script(self, args, stream=None, result=None):
+        # relative paths are resolved against the workdir, not the current dir
+        output = self.stage.output
+        if output and output not in DynamicIO.TYPES:
+            output = os.path.join(self.project.workdir, output)
+
+        io = DynamicIO(output)
+        result = result or ProcessStepResult()
+
+        # extract the reports from the output while the process is running,
+        # either directly by the collect pipeline or to the result
+        extractor = None
+        if stream:
+            stream.attached = io.listen(stream.feed)
+        elif self.stage.collect and self.stage.collect.parse:
+            extractor = create_extractor(self.stage.collect.parse)
+            if io.listen(lambda chunk: result.reports.extend(extractor.feed(chunk))):
+                result.reports = list()
+            else:
+                extractor = None
 
-        with io:
+        with io, CgroupScope() as cgroup:
             if io.is_writable():
                 io.fp.write('=' * 80 + '\n')
                 io.fp.write(' '.join(args) + '\n')
@@ -291,11 +469,17 @@ class ProcessStage(SimpleWorker):
                 io.fp.flush()
 
             logger.debug(f'running ' + ' '.join(args))
-            process = sp.Popen(args, stdout=io.fp, stderr=sp.STDOUT)
+            start = time.perf_counter()
+            # the process inherits the affinity of this thread
+            with pinned(self.cpuset):
+                process = sp.Popen(args, stdout=io.fp, stderr=sp.STDOUT, cwd=self.project.workdir)
+            cgroup.attach(process.pid)
             result.process = process
+            result.cpuset = self.cpuset
 
-            with process:
-                result.returncode = process.wait()
+            with process, result:
+                result.returncode, result.resources = wait_with_usage(process, start, cgroup)
+                logger.debug(f'process [{process.pid}] used {result.resources}')
                 if result.returncode == 0:
                     logger.debug(f'ok [{process.pid}] ended with {result.returncode}')
                 else:
@@ -305,28 +489,51 @@ class ProcessStage(SimpleWorker):
                 io.fp.write('-' * 80 + '\n')
                 io.fp.flush()
         result.output = getattr(io.opener, 'output', None)
+        if extractor:
+            result.reports.extend(extractor.close())
         return result
 
-    def _cache_save(self):
+    def _cache_save(self, duration=None):
         if not self._cache.exists():
             logger.debug(f'saving cache {self.stage} to {self._cache.location}')
-            self._cache.save()
+            self._cache.save(duration)
+
+    def _cache_shell(self):
+        """
+        Returns the script the cache key is computed from, the variables
+        which differ between the jobs are kept as placeholders,
+        so the jobs of the same configuration share the cache
+        :rtype: str
+        """
+        variables = dict(self.variables, **{k: '<%s>' % k for k in self._job_variables})
+        return '\n'.join(content for _, content in self._configured_shell(variables))
 
     def _cache_init(self):
         # try to use cache if possible
         if self.stage.cache:
-            self._cache = ProcessStepCache(self.stage.cache, self.stage.gits, self.variables)
+            self._cache = ProcessStepCache(
+                self.stage.cache, self.stage.gits, self.variables, cwd=self.project.workdir, shell=self._cache_shell()
+            )
 
-        if self._cache and self._cache.exists():
-            logger.debug(f'skipped stage {self.stage}, using cache {self._cache.location}')
-            self._cache.restore()
-            return True
-
-    def _collect(self):
+        if self._cache:
+            if self._cache.exists():
+                if self._cache.restore():
+                    logger.debug(f'skipped stage {self.stage}, using cache {self._cache.location}')
+                    return True
+                logger.warning(f'could not restore cache {self._cache.location}, will run the stage')
+            self._cache.miss()
+
+    def _collect(self, previous=None):
         collect_result = process_step_collect(
-            self.project, self.stage, self._shell_result, self.variables
+            self.project, self.stage, self._shell_result, self.variables, self.collect_writer
         )
         for i in range(len(collect_result.total)):
             if collect_result.total[i] > 0:
                 logger.debug(f'found {collect_result.total[i]} timer(s) in {len(collect_result.items[i])} file(s)')
+
+        # results of the previous repetitions of the job
+        if previous:
+            previous.total.extend(collect_result.total)
+            previous.items.extend(collect_result.items)
+            return previous
         return collect_result
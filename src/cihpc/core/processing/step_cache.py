@@ -8,9 +8,13 @@ from cihpc.common.utils.git import Git
 from cihpc.core.processing.step_git import configure_git
 
 
+import glob
+import hashlib
+import json
 import os
-import shutil
+import time
 from cihpc.common.utils.datautils import recursive_get
+from cihpc.common.utils.files.cache_store import CacheStore, file_digest
 from cihpc.cfg.cfgutil import configure_object, configure_string
 
 
@@ -20,13 +24,14 @@ class ProcessStepCache(object):
         '<git.commit>'
     ]
 
-    def __init__(self, step_cache, step_git, global_args=None, cwd='.'):
+    def __init__(self, step_cache, step_git, global_args=None, cwd='.', shell=None):
         """
-        Function will clone given git
-        and will checkout to a given branch and commit
+        Function will compute the cache key of the step
+        from the configured inputs
         :type step_cache: cihpc.core.structures.project_step_cache.ProjectStepCache
         :type step_git: list[cihpc.core.structures.project_step_git.ProjectStepGit]
         :type global_args: dict
+        :type shell: str
         """
 
         self.global_args = global_args
@@ -34,6 +39,7 @@ class ProcessStepCache(object):
         self.step_git = step_git
         self.value = None
         self.cwd = os.path.abspath(cwd)
+        self.shell = shell
 
         self.storage = configure_string(
             self.step_cache.storage,
@@ -48,38 +54,89 @@ class ProcessStepCache(object):
             self._cache_folder_format,
             global_args
         )
-        cache_folder_name = '-'.join(self.cache_folder_props)
+        self.inputs = self._inputs()
+        self.key = hashlib.sha1(
+            json.dumps(self.inputs, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        self.name = '%s-%s' % (self.cache_folder_props[0], self.key)
 
-        self.location = os.path.join(self.storage, cache_folder_name)
+        self.store = CacheStore(self.storage, self.step_cache.max_size, self.step_cache.link)
+        self.location = self.store.snapshot_path(self.name)
+
+    def _inputs(self):
+        """
+        Returns everything the cached directories depend on
+        :rtype: dict
+        """
+        fields = self.step_cache.fields or dict()
+        if isinstance(fields, list):
+            fields = {field: '<%s>' % field for field in fields}
+
+        deps = dict()
+        for name, spec in sorted((self.global_args.get('deps') or dict()).items()):
+            try:
+                deps[name] = spec.commit
+            except Exception:
+                # repository is not initialized, use the requested commit
+                deps[name] = spec._commit
+
+        return dict(
+            commit=self.cache_folder_props[1],
+            deps=deps,
+            gits=[configure_string(git.commit, self.global_args) for git in self.step_git or list()],
+            fields=configure_object(fields, self.global_args),
+            shell=self.shell,
+            files=self._input_files(),
+        )
+
+    def _input_files(self):
+        files = dict()
+        for pattern in self.step_cache.inputs or list():
+            pattern = configure_string(pattern, self.global_args)
+            for path in sorted(glob.glob(os.path.join(self.cwd, pattern), recursive=True)):
+                if os.path.isfile(path):
+                    files[os.path.relpath(path, self.cwd)] = file_digest(path)
+        return files
 
     def exists(self):
-        if os.path.exists(self.location) and os.path.isdir(self.location):
-            return True
-        return False
+        return self.store.exists(self.name)
 
-    @log_duration()
     def restore(self):
-        for dirname in self.directories:
-            from_dir = os.path.join(self.location, dirname)
-            to_dir = os.path.join(self.cwd, dirname)
-            logger.debug(f'restoring cache dir {dirname}')
+        """
+        Restores the cached directories, returns False
+        if the cache cannot be used
+        """
+        logger.debug(f'restoring cache dirs {self.directories}')
+        start = time.time()
+        restored = self.store.restore(self.name, self.cwd, self.directories)
+        duration = time.time() - start
 
-            if os.path.exists(to_dir):
-                logger.debug(f'rm tree {to_dir}')
-                shutil.rmtree(to_dir)
-            shutil.copytree(from_dir, to_dir)
+        if restored:
+            self.store.record(self.name, hits=1, restore_time=duration)
+            self._log_statistics()
+        logger.debug(f'restoring cache {self.name} took {duration:1.3f} sec')
+        return restored
 
-    @log_duration()
-    def save(self):
-        for dirname in self.directories:
-            from_dir = os.path.join(self.cwd, dirname)
-            to_dir = os.path.join(self.location, dirname)
-            logger.debug(f'saving cache dir {dirname}')
+    def miss(self):
+        self.store.record(self.name, misses=1)
 
-            if os.path.exists(to_dir):
-                logger.debug(f'rm tree {to_dir}')
-                shutil.rmtree(to_dir)
-            shutil.copytree(from_dir, to_dir)
+    @log_duration()
+    def save(self, duration=None):
+        """
+        Stores the cached directories
+        :param duration: how long it took to produce the directories
+        """
+        logger.debug(f'saving cache dirs {self.directories}')
+        start = time.time()
+        self.store.save(self.name, self.cwd, self.directories, meta=self.inputs)
+        self.store.record(self.name, saves=1, build_time=duration or 0.0, save_time=time.time() - start)
+
+    def _log_statistics(self):
+        stats = self.store.statistics(self.name)
+        build_time = stats.get('build_time', 0.0) / max(stats.get('saves', 1), 1)
+        saved = build_time * stats.get('hits', 0) - stats.get('restore_time', 0.0)
+        logger.info(f'cache {self.name}: {stats.get("hits", 0)} hit(s), {stats.get("misses", 0)} miss(es), '
+                    f'saved approx. {saved:1.1f} sec')
 
     def __repr__(self):
-        return f'ProcessStepCache({self.value})' 
+        return f'ProcessStepCache({self.name})'
@@ -8,12 +8,31 @@ import json
 from loguru import logger
 import os
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import yaml
 
 from cihpc.cfg.cfgutil import configure_object, configure_string
 from cihpc.core.processing.step_collect_parse import process_step_collect_parse
 import cihpc.artifacts.base as artifacts_base
+from cihpc.core.db.bulk_writer import BulkWriter
+
+
+# CollectModule instances living in the worker processes
+_process_instances = dict()
+
+
+class CollectSummary(namedtuple('CollectResult', ['total', 'items'])):
+    """
+    Summary of the collection, list of totals and list of (file, timers) infos
+    """
+
+    def add(self, timers_total, timers_info):
+        if timers_total:
+            self.total.append(timers_total)
+
+        if timers_info:
+            self.items.append(timers_info)
 
 
 def convert_method(type):
@@ -39,140 +58,289 @@ def iter_reports(reports, conversion, is_file):
                 continue
 
 
-def process_step_collect(project, step, process_result, format_args=None):
+def load_collect_module(project, step):
     """
-    Function will collect artifacts for the given step
+    Function will import the module set in the collect section
+    and will create an instance of its CollectModule
     :type step:           cihpc.core.structures.project_stage.ProjectStage
     :type project:        structures.project.Project
-    :type process_result: proc.step.step_shell.ProcessStepResult
+    :rtype: artifacts_base.AbstractCollectModule
     """
-    logger.debug(f'collecting artifacts')
-    result = namedtuple('CollectResult', ['total', 'items'])(total=[], items=[])
-
     logger.info(f'loading module {step.collect.module}')
     module = importlib.import_module(step.collect.module)
     CollectModule = module.CollectModule
 
-    # obtain git information
-    artifacts_base.CIHPCReport.init(step.collect.repo)
+    # create instance of the CollectModule
+    return CollectModule(project.name)
+
+
+def create_report_context(step, format_args=None, process_result=None, git=None):
+    """
+    Function creates the report fields (git, extra, index, resources,
+    cores and repetition) shared by the reports of a single job
+    :type step:           cihpc.core.structures.project_stage.ProjectStage
+    :type process_result: cihpc.core.processing.step_shell.ProcessStepResult
+    :type git:            dict
+    :param git:           git info of the project (project.report_git)
+    :rtype: artifacts_base.ReportContext
+    """
+    resources = getattr(process_result, 'resources', None)
+    cpuset = getattr(process_result, 'cpuset', None)
+    context = artifacts_base.ReportContext(git=git)
 
     # enrich result section
     if step.collect.extra:
-        extra = configure_object(step.collect.extra, format_args)
-        artifacts_base.CIHPCReport.global_problem.update(extra)
+        context.problem.update(configure_object(step.collect.extra, format_args))
 
     # if ord is set
     if step.index:
-        index = configure_object(step.index, format_args)
-        artifacts_base.CIHPCReport.global_index.update(index)
+        context.index.update(configure_object(step.index, format_args))
 
-    # create instance of the CollectModule
-    instance = CollectModule(project.name)  # type: artifacts_base.AbstractCollectModule
+    # resources consumed by the job, unknown while the job is running
+    if resources:
+        context.result['resources'] = resources.to_json()
 
-    # get either yaml or json
-    conversion = convert_method(step.collect.type)
+    # cores the job was pinned to
+    if cpuset:
+        context.result['cpuset'] = list(cpuset)
+        context.result['numa-nodes'] = list(cpuset.nodes)
 
-    # --------------------------------------------------
+    # warm-up runs are stored as well, but must be filtered out from the statistics
+    if getattr(process_result, 'repetition', None) is not None:
+        context.result['repetition'] = process_result.repetition
+        context.result['warm-up'] = bool(process_result.warmup)
 
+    return context
+
+
+def process_reports(instance, reports, conversion, is_file, context=None):
+    """
+    Function will process the given reports (files or parsed strings)
+    using the CollectModule instance, the reports are created
+    from the given context
+
+    Returns
+    -------
+    (list[artifacts_base.CollectResult], list[(str, int)], int)
+        results, list of tuples (file, number of timers) and total number of timers
+    """
     results = list()
     timers_info = []
     timers_total = 0
 
-    if step.collect.parse:
-        reports = process_step_collect_parse(project, step, process_result, format_args)
-        logger.debug(f'artifacts: found {len(reports)} reports to process')
+    for report, file in iter_reports(reports, conversion, is_file=is_file):
+        try:
+            collect_result = instance.process(report, file, context=context)
+            timers_total += len(collect_result.items)
+            timers_info.append((os.path.basename(file), len(collect_result.items)))
+            results.append(collect_result)
+        except Exception as e:
+            logger.exception(
+                f'artifact processing failed ({"files" if is_file else "parse"} method) \n'
+                f'module: {instance.__class__}\n'
+                f'file: {file}\n'
+            )
+            logger.debug(str(report))
+
+    for file, timers in timers_info:
+        logger.debug(f'%20s: %5d timers found' % (file, timers))
+    logger.debug(f'artifacts: found {timers_total} timer(s) in {len(reports)} file(s)')
+
+    return results, timers_info, timers_total
 
-        for report, file in iter_reports(reports, conversion, is_file=False):
+
+def process_file_isolated(project_name, module, type, context, file):
+    """
+    Function processes a single report file, it is meant to be executed
+    in a worker process of the ProcessPoolExecutor
+
+    Parameters
+    ----------
+    project_name : str
+        name of the project
+    module : str
+        name of the collect module
+    type : str
+        type of the report file (json or yaml)
+    context : artifacts_base.ReportContext
+        report fields of the job, see :func:`create_report_context`
+    file : str
+        location of the report file
+
+    Returns
+    -------
+    (list[artifacts_base.CollectResult], list[(str, int)], int)
+        the same values as :func:`process_reports`
+    """
+    instance = _process_instances.get((project_name, module))
+    if instance is None:
+        instance = importlib.import_module(module).CollectModule(project_name)
+        _process_instances[(project_name, module)] = instance
+
+    results, timers_info, timers_total = process_reports(
+        instance, [file], convert_method(type), is_file=True, context=context
+    )
+
+    # send plain dicts back to the main process
+    for result in results:
+        result.items = [dict(item) for item in result.items]
+    return results, timers_info, timers_total
+
+
+def process_files_parallel(project, step, files, executor=None, context=None):
+    """
+    Function processes report files in the worker processes
+    and yields the results as soon as they are done
+    :type step:           cihpc.core.structures.project_stage.ProjectStage
+    :type project:        structures.project.Project
+    :type executor:       concurrent.futures.ProcessPoolExecutor
+    :type context:        artifacts_base.ReportContext
+    """
+    context = context or artifacts_base.ReportContext(git=getattr(project, 'report_git', None))
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=step.collect.processes)
+
+    try:
+        futures = [
+            executor.submit(process_file_isolated, project.name, step.collect.module, step.collect.type, context, file)
+            for file in files
+        ]
+        for future in as_completed(futures):
             try:
-                collect_result = instance.process(report, file)
-                timers_total += len(collect_result.items)
-                timers_info.append((os.path.basename(file), len(collect_result.items)))
-                results.append(collect_result)
+                yield future.result()
             except Exception as e:
-                logger.exception(
-                    f'artifact processing failed (parse method) \n'
-                    f'module: {CollectModule}\n'
-                    f'file: {file}\n'
-                )
-                logger.debug(str(report))
+                logger.exception(f'artifact processing failed in the worker process')
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
 
-        for file, timers in timers_info:
-            logger.debug(f'%20s: %5d timers found' % (file, timers))
-        logger.debug(f'artifacts: found {timers_total} timer(s) in {len(reports)} file(s)')
 
-        # insert artifacts into db
-        if step.collect.save_to_db:
-            instance.save_to_db(results)
+def find_files(step, format_args=None, cwd='.'):
+    """
+    Function returns list of files matching the collect files glob
+    :type step:           cihpc.core.structures.project_stage.ProjectStage
+    :param cwd:           relative glob is resolved against this directory
+    """
+    if not step.collect.files:
+        return []
+
+    files_glob = configure_string(step.collect.files, format_args)
+    return glob.glob(os.path.join(cwd, files_glob), recursive=True)
+
+
+def move_files(step, files, format_args=None, cwd='.'):
+    """
+    Function will move the processed files, so they are not processed twice
+    :type step:           cihpc.core.structures.project_stage.ProjectStage
+    :param cwd:           relative target is resolved against this directory
+    """
+    if not step.collect.move_to or not files:
+        return
+
+    move_to = os.path.join(cwd, configure_string(step.collect.move_to, format_args))
+    logger.debug(f'artifacts: moving {len(files)} files to {move_to}')
+
+    for file in files:
+        old_filepath = os.path.abspath(file)
+
+        # customize location and prefix of the dir structure if set
+        if step.collect.cut_prefix:
+            new_rel_filepath = old_filepath.replace(step.collect.cut_prefix, '').lstrip('/')
+            new_dirname = os.path.join(
+                move_to,
+                os.path.dirname(new_rel_filepath),
+            )
+            new_filepath = os.path.join(new_dirname, os.path.basename(file))
+            os.makedirs(new_dirname, exist_ok=True)
+            os.rename(old_filepath, new_filepath)
+        else:
+            new_filepath = os.path.join(
+                move_to,
+                os.path.basename(file)
+            )
+            os.makedirs(move_to, exist_ok=True)
+            os.rename(old_filepath, new_filepath)
+
 
-    if timers_total:
-        result.total.append(timers_total)
+def process_step_collect(project, step, process_result, format_args=None, writer=None):
+    """
+    Function will collect artifacts for the given step
+    :type step:           cihpc.core.structures.project_stage.ProjectStage
+    :type project:        structures.project.Project
+    :type process_result: proc.step.step_shell.ProcessStepResult
+    :type writer:         cihpc.core.db.bulk_writer.BulkWriter
+    :param writer:        a shared buffered writer, flushed by the owner,
+                          if not set the results are inserted before returning
+    """
+    logger.debug(f'collecting artifacts')
+    result = CollectSummary(total=[], items=[])
+
+    instance = load_collect_module(project, step)
+    context = create_report_context(step, format_args, process_result, project.report_git)
+
+    # get either yaml or json
+    conversion = convert_method(step.collect.type)
 
-    if timers_info:
-        result.items.append(timers_info)
+    own_writer = step.collect.save_to_db and writer is None
+    if own_writer:
+        writer = BulkWriter.for_step(step)
+    elif not step.collect.save_to_db:
+        writer = None
 
     # --------------------------------------------------
 
-    results = list()
-    timers_info = []
-    timers_total = 0
+    if step.collect.parse:
+        reports = process_step_collect_parse(project, step, process_result, format_args)
+        logger.debug(f'artifacts: found {len(reports)} reports to process')
+
+        results, timers_info, timers_total = process_reports(
+            instance, reports, conversion, is_file=False, context=context
+        )
+
+        # insert artifacts into db
+        if writer:
+            instance.save_to_db(results, writer)
+
+        result.add(timers_total, timers_info)
+
+    # --------------------------------------------------
 
     if step.collect.files:
-        files_glob = configure_string(step.collect.files, format_args)
-        files = glob.glob(files_glob, recursive=True)
+        files = find_files(step, format_args, project.workdir)
         logger.debug(f'artifacts: found {len(files)} files to process')
 
-        for report, file in iter_reports(files, conversion, is_file=True):
-            try:
-                collect_result = instance.process(report, file)
-                timers_total += len(collect_result.items)
-                timers_info.append((os.path.basename(file), len(collect_result.items)))
-                results.append(collect_result)
-            except Exception as e:
-                logger.warning(
-                    f'artifact processing failed (files method) \n'
-                    f'module: {CollectModule}\n'
-                    f'file: {file}\n'
-                )
-                logger.debug(str(report))
+        if step.collect.processes > 1 and len(files) > 1:
+            timers_info, timers_total = list(), 0
 
-        for file, timers in timers_info:
-            logger.debug(f'%20s: %5d timers found' % (file, timers))
-        logger.debug(f'artifacts: found {timers_total} timer(s) in {len(reports)} file(s)')
+            # insert the results as they are coming from the workers
+            for results, file_info, file_total in process_files_parallel(project, step, files, context=context):
+                timers_info.extend(file_info)
+                timers_total += file_total
 
-        # insert artifacts into db
-        if step.collect.save_to_db:
-            instance.save_to_db(results)
+                if writer:
+                    instance.save_to_db(results, writer)
+
+            logger.debug(f'artifacts: found {timers_total} timer(s) in {len(files)} file(s)')
+        else:
+            results, timers_info, timers_total = process_reports(
+                instance, files, conversion, is_file=True, context=context
+            )
+
+            # insert artifacts into db
+            if writer:
+                instance.save_to_db(results, writer)
+
+        # make sure the results are stored before the files are moved
+        if own_writer:
+            writer.flush()
 
         # move results to they are not processed twice
-        if step.collect.move_to:
-            move_to = configure_string(step.collect.move_to, format_args)
-            logger.debug(f'artifacts: moving {len(files)} files to {move_to}')
-
-            for file in files:
-                old_filepath = os.path.abspath(file)
-
-                # customize location and prefix of the dir structure if set
-                if step.collect.cut_prefix:
-                    new_rel_filepath = old_filepath.replace(step.collect.cut_prefix, '').lstrip('/')
-                    new_dirname = os.path.join(
-                        move_to,
-                        os.path.dirname(new_rel_filepath),
-                    )
-                    new_filepath = os.path.join(new_dirname, os.path.basename(file))
-                    os.makedirs(new_dirname, exist_ok=True)
-                    os.rename(old_filepath, new_filepath)
-                else:
-                    new_filepath = os.path.join(
-                        move_to,
-                        os.path.basename(file)
-                    )
-                    os.makedirs(move_to, exist_ok=True)
-                    os.rename(old_filepath, new_filepath)
-
-    if timers_total:
-        result.total.append(timers_total)
-
-    if timers_info:
-        result.items.append(timers_info)
+        move_files(step, files, format_args, project.workdir)
+
+        result.add(timers_total, timers_info)
+
+    if own_writer:
+        writer.flush()
 
     return result
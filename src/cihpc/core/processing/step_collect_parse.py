@@ -1,9 +1,231 @@
 #!/usr/bin/python
 # author: Jan Hybs
 
+import re
+
 from loguru import logger
 
 
+class ReportExtractor(object):
+    """
+    State machine extracting reports enclosed in the start and stop markers
+    from the output, which is fed in chunks
+
+    Only the open reports and a few characters which may contain a part
+    of a marker are kept in the memory, every report is returned as soon
+    as its stop marker arrives.
+
+    If the markers differ, the reports can be nested (e.g. output of several
+    processes), a start marker inside an open report opens a new one and
+    a stop marker closes the innermost report. A report longer than max_size
+    characters is discarded.
+
+    :type start: str
+    :type stop: str
+    :type max_size: int
+    """
+
+    def __init__(self, start, stop=None, max_size=None):
+        self.start = start
+        self.stop = stop or start
+        self.max_size = max_size
+        self.nested = self.start != self.stop
+
+        # metrics
+        self.reports = 0
+        self.discarded = 0
+
+        # stack of the open reports [parts, size]
+        self._open = list()
+        self._tail = ''
+        self._keep = max(len(self.start), len(self.stop)) - 1
+
+    def feed(self, chunk):
+        """
+        Processes the next chunk of the output and returns list
+        of the reports completed in this chunk
+        :type chunk: str
+        :rtype: list[str]
+        """
+        reports = list()
+        # the tail of the previous chunk may contain a part of the marker
+        text = self._tail + chunk
+        index = 0
+
+        # positions of the next markers, which are still valid
+        # since the index only grows
+        s, e = None, None
+
+        while True:
+            if s is None or -1 < s < index:
+                s = text.find(self.start, index)
+
+            if not self._open:
+                if s == -1:
+                    self._tail = text[max(index, len(text) - self._keep):]
+                    return reports
+
+                self._open.append([list(), 0])
+                index = s + len(self.start)
+                continue
+
+            if e is None or -1 < e < index:
+                e = text.find(self.stop, index)
+
+            if self.nested and s != -1 and (e == -1 or s < e):
+                self._append(text, index, s)
+                self._open.append([list(), 0])
+                index = s + len(self.start)
+
+            elif e != -1:
+                self._append(text, index, e)
+                parts, size = self._open.pop()
+                if parts is not None:
+                    reports.append(''.join(parts).strip())
+                    self.reports += 1
+                index = e + len(self.stop)
+
+            else:
+                keep = max(index, len(text) - self._keep)
+                self._append(text, index, keep)
+                self._tail = text[keep:]
+                return reports
+
+    def _append(self, text, start, end):
+        report = self._open[-1]
+        if report[0] is None or start >= end:
+            return
+
+        report[1] += end - start
+        if self.max_size and report[1] > self.max_size:
+            logger.warning(f'report exceeds the size limit of {self.max_size} chars and will be discarded')
+            report[0] = None
+            self.discarded += 1
+        else:
+            report[0].append(text[start:end])
+
+    def close(self):
+        """
+        Ends the extraction, unfinished reports are discarded
+        :rtype: list[str]
+        """
+        if self._open:
+            logger.debug(f'could not find end of {len(self._open)} report(s) while parsing the output')
+        self._open = list()
+        self._tail = ''
+        return list()
+
+
+class InterleavedReportExtractor(object):
+    """
+    Extracts reports from the output of the parallel processes (e.g. MPI
+    ranks), whose lines are interleaved and prefixed with the process id
+    (e.g. mpirun --tag-output or srun --label)
+
+    The lines are split by the prefix, which is removed, and the output
+    of each process is passed to its own ReportExtractor. The first group
+    of the prefix pattern (or the whole match) identifies the process,
+    the lines without the prefix are processed together.
+
+    :type prefix: str
+    """
+
+    # matches "[1,0]<stdout>:" (mpirun --tag-output) and "  1: " (srun --label)
+    default_prefix = r'^\s*\[?(\d+(?:,\d+)?)\]?(?:<std(?:out|err)>)?:\s?'
+
+    def __init__(self, start, stop=None, max_size=None, prefix=None):
+        self.start = start
+        self.stop = stop
+        self.max_size = max_size
+        self.prefix = re.compile(prefix or self.default_prefix)
+        self.extractors = dict()
+        self._line = ''
+
+    @property
+    def reports(self):
+        return sum(e.reports for e in self.extractors.values())
+
+    @property
+    def discarded(self):
+        return sum(e.discarded for e in self.extractors.values())
+
+    def feed(self, chunk):
+        """
+        Processes the next chunk of the output and returns list
+        of the reports completed in this chunk
+        :type chunk: str
+        :rtype: list[str]
+        """
+        text = self._line + chunk
+        end = text.rfind('\n') + 1
+        self._line = text[end:]
+        return self._feed_lines(text[:end])
+
+    def _feed_lines(self, text):
+        reports = list()
+        key, lines = None, list()
+
+        # consecutive lines of the same process are processed at once
+        for line in text.splitlines(keepends=True):
+            match = self.prefix.match(line)
+            if match:
+                line_key = match.group(1) if match.groups() else match.group(0)
+                line = line[match.end():]
+            else:
+                line_key = None
+
+            if line_key != key and lines:
+                reports.extend(self._extractor(key).feed(''.join(lines)))
+                lines = list()
+            key = line_key
+            lines.append(line)
+
+        if lines:
+            reports.extend(self._extractor(key).feed(''.join(lines)))
+        return reports
+
+    def _extractor(self, key):
+        extractor = self.extractors.get(key)
+        if extractor is None:
+            extractor = self.extractors[key] = ReportExtractor(self.start, self.stop, self.max_size)
+        return extractor
+
+    def close(self):
+        """
+        Ends the extraction, returns the reports completed by the last line
+        :rtype: list[str]
+        """
+        reports = self._feed_lines(self._line)
+        self._line = ''
+        for extractor in self.extractors.values():
+            extractor.close()
+        return reports
+
+
+def create_extractor(parse):
+    """
+    Returns the report extractor for the given settings
+    :type parse: cihpc.core.structures.project_step_collect_parse.ProjectStepContainerParse
+    :rtype: ReportExtractor or InterleavedReportExtractor
+    """
+    if parse.prefix:
+        prefix = parse.prefix if isinstance(parse.prefix, str) else None
+        return InterleavedReportExtractor(parse.start, parse.stop, parse.max_size, prefix)
+    return ReportExtractor(parse.start, parse.stop, parse.max_size)
+
+
+def extract_reports(chunks, extractor):
+    """
+    Yields the reports from the given chunks of the output
+    as soon as they are complete
+    :type chunks: collections.Iterable[str]
+    :type extractor: ReportExtractor or InterleavedReportExtractor
+    """
+    for chunk in chunks:
+        yield from extractor.feed(chunk)
+    yield from extractor.close()
+
+
 def process_step_collect_parse(project, step, process_result, format_args=None):
     """
     Function will parse the file from an output
@@ -13,35 +235,15 @@ def process_step_collect_parse(project, step, process_result, format_args=None):
     """
 
     logger.debug(f'parsing output artifacts')
+
+    # reports were already extracted while the process was running
+    if process_result.reports is not None:
+        return process_result.reports
+
     if not process_result.output:
         logger.warning(f'Empty output received, make sure the field ouutput is set to \n'
                        f'output: log+stdout \n'
                        f'in order to capture output of the shell step')
         return []
 
-    index = 0
-    output = process_result.output
-    start = step.collect.parse.start
-    stop = step.collect.parse.start
-    ls, le = len(start), len(stop)
-
-    length = len(output)
-    reports = list()
-
-    while True:
-        # no more reports found
-        s = output.find(start, index, length)
-        if s == -1:
-            break
-
-        # broken report
-        e = output.find(stop, s + 1, length)
-        if e == -1:
-            logger.debug(f'could not find end of the report file while parsing the output')
-            break
-
-        index = e + le + 1
-        # try to parse the data or skip it
-        reports.append(output[s + ls:e].strip())
-
-    return reports
+    return list(extract_reports([process_result.output], create_extractor(step.collect.parse)))
@@ -3,8 +3,9 @@
 
 from loguru import logger
 import subprocess as sp
-from time import time
+from time import time, perf_counter
 
+from cihpc.common.processing.accounting import CgroupScope, wait_with_usage
 from cihpc.common.utils.files.dynamic_io import DynamicIO
 
 
@@ -12,6 +13,11 @@ class ProcessStepResult(object):
     """
     :type process: subprocess.Popen
     :type output:  str
+    :type reports: list[str]
+    :type resources: cihpc.common.processing.accounting.ResourceUsage
+    :type cpuset: cihpc.common.processing.affinity.CoreSet
+    :type repetition: int
+    :type warmup: bool
     """
 
     def __init__(self):
@@ -25,6 +31,15 @@ class ProcessStepResult(object):
         self.output = None
         self.error = None
 
+        # reports extracted from the output while the process was running
+        self.reports = None
+        self.resources = None
+        self.cpuset = None
+
+        # order of the run within the job and whether it is a discarded warm-up run
+        self.repetition = None
+        self.warmup = False
+
     def __enter__(self):
         self.start_time = time()
         return self
@@ -46,6 +61,10 @@ class ProcessStepResult(object):
             output=self.output,
             error=self.error,
             shell_duration=self.shell_duration,
+            resources=self.resources.to_json() if self.resources else None,
+            cpuset=list(self.cpuset) if self.cpuset else None,
+            repetition=self.repetition,
+            warmup=self.warmup,
         )
 
 
@@ -57,12 +76,14 @@ def process_popen(worker):
     crate = worker.crate
     io = DynamicIO(crate.output)
     result = ProcessStepResult()
-    with io as fp:
+    with io as fp, CgroupScope() as cgroup:
+        start = perf_counter()
         process = sp.Popen(crate.args, stdout=fp, stderr=sp.STDOUT)
+        cgroup.attach(process.pid)
 
         result.process = process
         with result:
-            result.returncode = process.wait()
+            result.returncode, result.resources = wait_with_usage(process, start, cgroup)
             if result.returncode == 0:
                 logger.debug(f'ok [{process.pid}] ended with {result.returncode}')
             else:
@@ -3,7 +3,6 @@
 
 
 import os
-import copy
 import time
 import datetime as dt
 import cihpc.common.utils.strings as strings
@@ -127,6 +126,14 @@ class Project(object):
             configure_object(kwargs.get('git'), self.global_args)
         )
 
+        # repositories are cloned into the workdir
+        for repo in [self.git.main_repo] + list(self.git.deps.values()):
+            if repo and not repo.root:
+                repo.root = self.workdir
+
+        # git info stored in the reports, set once the repository is initialized
+        self.report_git = dict()
+
         self._global_args['git'] = self.git.main_repo
         self._global_args['deps'] = self.git.deps
 
@@ -146,10 +153,19 @@ class Project(object):
 
     @property
     def global_args(self):
-        cp = copy.deepcopy(self._global_args)
-        cp['__project__']['counter'] = self._counter  # restore counter
-        cp['__project__']['current'] = DatePoint()
-        return cp
+        """
+        Returns a new dictionary with the global arguments
+
+        Only the top level and the __project__ section are new,
+        the values themselves are shared with the project, so the result
+        can be extended with other variables but its values
+        should not be modified in place.
+
+        :rtype: dict
+        """
+        args = dict(self._global_args)
+        args['__project__'] = dict(self._global_args['__project__'], current=DatePoint())
+        return args
 
     @property
     def tmp_workdir(self):
@@ -3,6 +3,7 @@
 # author: Jan Hybs
 
 import os
+import threading
 from typing import Dict
 from git import Repo
 from loguru import logger
@@ -53,8 +54,12 @@ class ProjectGit:
 class GitSpec:
     """
     :type repo: git.Repo
+    :type root: str
     """
 
+    # git does not allow concurrent changes of the worktree list
+    _worktree_lock = threading.Lock()
+
     def __init__(self, url, branch=_default_branch, commit=_default_commit, **kwargs):
         self.url = url
         self.name = str(os.path.basename(url).split('.')[0])
@@ -64,10 +69,49 @@ class GitSpec:
         self.clean_before_checkout = kwargs.get('clean-before-checkout', False)
         self.repo = None
         self._dir = kwargs.get('dir', None)
+        # directory the repository is cloned into, the project workdir
+        self.root = kwargs.get('root', None)
 
     @property
     def dir(self):
-        return self._dir or os.path.abspath(os.path.join(os.getcwd(), self.name))
+        return self._dir or os.path.abspath(os.path.join(self.root or os.getcwd(), self.name))
+
+    def worktree(self, path, commit):
+        """
+        Checks out the commit (detached) to a separate worktree
+        of this repository, so several commits can be built at the same time
+
+        The repository must be initialized, the worktree is reused
+        if it already exists.
+
+        :type path: str
+        :type commit: str
+        :rtype: git.Repo
+        """
+        path = os.path.abspath(path)
+        with self._worktree_lock:
+            if os.path.exists(os.path.join(path, '.git')):
+                logger.info(f'Checking out {commit} in the existing worktree {path}')
+                Repo(path).git.checkout('--detach', '--force', commit)
+            else:
+                logger.info(f'Adding worktree {path} at {commit}')
+                self.repo.git.worktree('prune')
+                self.repo.git.worktree('add', '--force', '--detach', path, commit)
+        return Repo(path)
+
+    def remove_worktree(self, path):
+        """
+        Removes the worktree created by the worktree method,
+        local changes and the build files in it are discarded
+
+        :type path: str
+        """
+        path = os.path.abspath(path)
+        with self._worktree_lock:
+            if os.path.exists(os.path.join(path, '.git')):
+                logger.info(f'Removing worktree {path}')
+                self.repo.git.worktree('remove', '--force', path)
+            self.repo.git.worktree('prune')
 
     def initialize(self):
         logger.info(f'Initializing repo {self.name}')
@@ -115,6 +159,9 @@ class GitSpec:
         try:
             return str(self.repo.active_branch.name)
         except:
+            # worktrees are always detached, the requested branch is reported
+            if self._branch and not self.checkout:
+                return self._branch
             return f'detached-at-{self.commit[:8]}'
 
     @property
@@ -29,6 +29,14 @@ class Props(object):
     COLLECT = 'collect'
     MEASURE = 'measure'
     CONTAINER = 'container'
+    ORDER = 'order'
+
+
+class StageOrder(enum.Enum):
+    # jobs are started in the order of the variables expansion
+    DEFAULT = 'default'
+    # jobs are sorted by their historical duration, longest first
+    LONGEST_FIRST = 'longest-first'
 
 
 class ProjectStages(list):
@@ -92,6 +100,11 @@ class ProjectStage(ComplexClass):
                 kwargs.get('on-error', 'continue')
             )
 
+            # order in which the jobs are started
+            self.order = StageOrder(
+                kwargs.get(Props.ORDER) or StageOrder.DEFAULT.value
+            )
+
             # artifact collection
             self.collect = ProjectStepCollect(kwargs.get(Props.COLLECT))
             # artifact generation
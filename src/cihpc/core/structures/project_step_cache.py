@@ -3,37 +3,72 @@
 
 from loguru import logger
 
+from cihpc.common.utils.files.cache_store import LinkMode, parse_size
 from cihpc.core.structures.a_project import ComplexClass
 
 
 class ProjectStepCache(ComplexClass):
     """
     A class which handles project caching
+
+    The cache is reused only if all the inputs are the same, the key is
+    computed from the commits of the main and dependency repositories,
+    the rendered shell script, values of the selected fields
+    and content of the files matching the input globs.
+
+    .. code-block:: yaml
+
+        cache:
+          directories: [build-<git.branch>]
+          fields: [compiler, flags]     # or a dict name: <template>
+          inputs: [config/*.cmake]      # globs relative to the workdir
+
+    :type directories: list[str]
+    :type storage: str
+    :type fields: list[str] or dict
+    :type inputs: list[str]
+    :type max_size: int
+    :type link: cihpc.common.utils.files.cache_store.LinkMode
     """
 
+    default_storage = '<os.HOME>/.cache/cihpc'
+    default_max_size = '20G'
+
     def __init__(self, kwargs):
         super(ProjectStepCache, self).__init__(kwargs)
+        opts = dict()
 
         if not kwargs:
             self.directories = None
             self.storage = None
             self.fields = None
+            self.inputs = None
 
         elif isinstance(kwargs, dict):
             self.directories = kwargs['directories']  # required
-            self.storage = kwargs.get('storage', '<os.HOME>/.cache/cihpc')  # default is home .cache dir
+            self.storage = kwargs.get('storage', self.default_storage)  # default is home .cache dir
             self.fields = kwargs.get('fields', dict())
+            self.inputs = kwargs.get('inputs', list())
+            opts = kwargs
 
         elif isinstance(kwargs, list):
-            self.storage = '<os.HOME>/.cache/cihpc'
+            self.storage = self.default_storage
             self.directories = kwargs
             self.fields = dict()
+            self.inputs = list()
 
         elif isinstance(kwargs, str):
             self.enabled = True
-            self.storage = '<os.HOME>/.cache/cihpc'
+            self.storage = self.default_storage
             self.directories = [kwargs]
             self.fields = dict()
+            self.inputs = list()
 
         else:
             raise ValueError('kwargs must be dictionary, string or list')
+
+        # size limit of the storage (e.g. 500M, 20G), the least recently used
+        # caches are removed first, null means unlimited
+        self.max_size = parse_size(opts.get('max-size', self.default_max_size))
+        # how the cached files are restored (auto, reflink, hardlink or copy)
+        self.link = LinkMode(opts.get('link', LinkMode.AUTO.value))
@@ -5,6 +5,7 @@
 import cihpc.core.structures
 from cihpc.core.structures.a_project import ComplexClass
 from cihpc.core.structures.project_step_collect_parse import ProjectStepContainerParse
+from cihpc.core.structures.project_step_collect_regressions import ProjectStepCollectRegressions
 
 
 class ProjectStepCollect(ComplexClass):
@@ -19,6 +20,13 @@ class ProjectStepCollect(ComplexClass):
     :type repo:         str
     :type type:         str
     :type save_to_db:   bool
+    :type background:   bool
+    :type workers:      int
+    :type batch_size:   int
+    :type batch_bytes:  int
+    :type poll_interval: float
+    :type processes:    int
+    :type regressions:  ProjectStepCollectRegressions
     """
 
     def __init__(self, kwargs):
@@ -35,3 +43,16 @@ class ProjectStepCollect(ComplexClass):
         self.repo = kwargs.get('repo', None)
         self.save_to_db = kwargs.get('save-to-db', True)
         self.type = kwargs.get('type', 'json')
+
+        # collect artifacts in the background while other jobs are running
+        self.background = kwargs.get('background', False)
+        self.workers = max(int(kwargs.get('workers', 1)), 1)
+        self.batch_size = max(int(kwargs.get('batch-size', 1000)), 1)
+        self.batch_bytes = max(int(kwargs.get('batch-bytes', 16 * 1024 * 1024)), 1)
+        self.poll_interval = float(kwargs.get('poll-interval', 1.0))
+
+        # parse report files in the worker processes
+        self.processes = max(int(kwargs.get('processes', 0)), 0)
+
+        # detect performance regressions once the reports are saved
+        self.regressions = ProjectStepCollectRegressions(kwargs.get('regressions', True))
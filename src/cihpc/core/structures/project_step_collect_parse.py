@@ -4,7 +4,18 @@
 
 class ProjectStepContainerParse(object):
     """
-    Helper class which holds information about singularity/docker
+    Helper class which holds information about reports
+    printed to the output
+
+    .. code-block:: yaml
+
+        parse:
+          start: '<report>'
+          stop: '</report>'         # same as start if not set
+          max-size: 67108864        # reports longer than this are discarded
+          prefix: true              # lines are prefixed with mpi rank, either
+                                    # true (mpirun --tag-output, srun --label)
+                                    # or a regex with the rank as the first group
     """
 
     def __init__(self, **kwargs):
@@ -17,4 +28,6 @@ class ProjectStepContainerParse(object):
 
         self.type = kwargs.get('type', 'json')
         self.start = kwargs.get('start', None)
-        self.stop = kwargs.get('start', None)
+        self.stop = kwargs.get('stop', self.start)
+        self.max_size = int(kwargs.get('max-size', 64 * 1024 * 1024))
+        self.prefix = kwargs.get('prefix', None)
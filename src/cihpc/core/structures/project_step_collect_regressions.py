@@ -0,0 +1,38 @@
+#!/usr/bin/python
+# author: Jan Hybs
+
+from cihpc.core.structures.a_project import ComplexClass
+
+
+class ProjectStepCollectRegressions(ComplexClass):
+    """
+    Settings of the performance regression detection, which runs
+    after the collected reports are saved to the database
+
+    .. code-block:: yaml
+
+        regressions:
+          window: 10            # number of previous commits in the baseline
+          alpha: 0.01           # significance level of the test
+          threshold: 0.05       # report slowdowns of 5% and more
+          method: welch         # welch (log-transformed) or mann-whitney
+          min-samples: 3        # minimal number of values in each sample
+
+    The detection is enabled by default, set regressions: false to disable it.
+
+    :type window: int
+    :type alpha: float
+    :type threshold: float
+    :type method: str
+    :type min_samples: int
+    """
+
+    def __init__(self, kwargs):
+        super(ProjectStepCollectRegressions, self).__init__(kwargs)
+        opts = kwargs if isinstance(kwargs, dict) else dict()
+
+        self.window = max(int(opts.get('window', 10)), 1)
+        self.alpha = float(opts.get('alpha', 0.01))
+        self.threshold = float(opts.get('threshold', 0.05))
+        self.method = opts.get('method', 'welch')
+        self.min_samples = max(int(opts.get('min-samples', 3)), 2)
@@ -11,8 +11,14 @@ from cihpc.core.structures.a_project import ComplexClass
 class ProjectStepParallel(ComplexClass):
     """
     A class containing information about parallel mode
+
+    Parallel jobs are pinned to disjoint sets of cores (grouped by numa
+    nodes), unless pin is set to false. The assigned cores are available
+    in the variable __cpuset__ (e.g. 0-3,8).
+
     :type cpus: int
     :type prop: any
+    :type pin: bool
     """
 
     def __init__(self, kwargs=False):
@@ -21,11 +27,14 @@ class ProjectStepParallel(ComplexClass):
         if not kwargs or kwargs in (None, False):
             self.cpus = 1
             self.prop = None
+            self.pin = False
 
         elif kwargs is True:
             self.cpus = determine_cpus('51%')
             self.prop = None
+            self.pin = True
         elif isinstance(kwargs, dict):
+            self.pin = bool(kwargs.get('pin', True))
             try:
                 self.cpus = determine_cpus(kwargs.get('cpus', 1))
                 self.prop = kwargs.get('prop', None)
@@ -39,6 +48,6 @@ class ProjectStepParallel(ComplexClass):
             raise ValueError('ProjectStepParallel: expected None, bool or dict')
 
     def __repr__(self):
-        return 'Parallel(cpus={self.cpus}, prop={self.prop})'.format(
+        return 'Parallel(cpus={self.cpus}, prop={self.prop}, pin={self.pin})'.format(
             self=self
         )
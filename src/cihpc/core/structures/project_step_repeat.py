@@ -1,18 +1,128 @@
 #!/usr/bin/python
 # author: Jan Hybs
 
+import math
+
 from loguru import logger
 
 
+class ProjectStepRepeatAdaptive(object):
+    """
+    Adaptive repetition, the configuration is repeated until the
+    confidence interval of the duration is narrow enough
+
+    Parameters
+    ----------
+    min: int
+        minimum number of measured runs, at least 2
+    max: int
+        maximum number of measured runs
+    relative-width: float
+        target width of the confidence interval relative to the mean duration
+    confidence: float
+        confidence level of the interval
+    """
+
+    def __init__(self, kwargs):
+        kwargs = kwargs if isinstance(kwargs, dict) else dict()
+        self.min = max(int(kwargs.get('min', 3)), 2)
+        self.max = max(int(kwargs.get('max', 30)), self.min)
+        self.relative_width = float(kwargs.get('relative-width', 0.05))
+        self.confidence = float(kwargs.get('confidence', 0.95))
+
+    @staticmethod
+    def moments(durations, history=None):
+        """
+        Returns count, mean and sample std of the given durations merged
+        with the history (dict with count, duration (mean) and std
+        of the runs already stored in the database, see index_stats)
+        :type durations: list[float]
+        :type history: dict
+        :rtype: (int, float, float)
+        """
+        count = len(durations)
+        total = sum(durations)
+        squares = sum(d * d for d in durations)
+
+        if history and history.get('count'):
+            n, mean, std = history['count'], history.get('duration') or 0.0, history.get('std') or 0.0
+            count += n
+            total += n * mean
+            squares += (n - 1) * std * std + n * mean * mean
+
+        if not count:
+            return 0, None, None
+
+        mean = total / count
+        if count < 2:
+            return count, mean, None
+        return count, mean, math.sqrt(max(squares - count * mean * mean, 0.0) / (count - 1))
+
+    def width(self, durations, history=None):
+        """
+        Returns width of the confidence interval of the given
+        durations (and the history) relative to their mean
+        :type durations: list[float]
+        :type history: dict
+        :rtype: float
+        """
+        from scipy import stats as st
+
+        count, mean, std = self.moments(durations, history)
+        if count < 2:
+            return float('inf')
+        if mean <= 0:
+            return 0.0
+        return 2 * std / math.sqrt(count) * st.t.ppf((1 + self.confidence) / 2., count - 1) / mean
+
+    def done(self, durations, history=None):
+        """
+        Returns True if no more runs are needed
+        :type durations: list[float]
+        :type history: dict
+        """
+        count = self.moments(durations, history)[0]
+        if count >= self.max:
+            return True
+        if count < self.min:
+            return False
+        return self.width(durations, history) <= self.relative_width
+
+    def __repr__(self):
+        return 'Adaptive(min={self.min}, max={self.max}, width={self.relative_width})'.format(
+            self=self
+        )
+
+    def to_json(self):
+        return dict(
+            min=self.min,
+            max=self.max,
+            relative_width=self.relative_width,
+            confidence=self.confidence,
+        )
+
+
 class ProjectStepRepeat(object):
     """
     A class which holds information about repetition value for a ProjectStep
+
+    The warm-up runs are made once per configuration by its first job,
+    e.g. exactly: 5 and warm-up: 2 make 2 discarded and 5 measured runs.
+    The adaptive configurations which already converged in the database
+    are skipped, the others continue the series stored in the database.
+
     :type fixed_value: int
     :type dynamic_value: int
+    :type warmup: int
+    :type adaptive: ProjectStepRepeatAdaptive
     """
 
     def __init__(self, kwargs):
 
+        # number of discarded runs before the measured ones of a configuration
+        self.warmup = 0
+        self.adaptive = None
+
         if kwargs is None:
             self.fixed_value = 1
             self.dynamic_value = None
@@ -24,9 +134,18 @@ class ProjectStepRepeat(object):
         elif isinstance(kwargs, dict):
             self.dynamic_value = kwargs.get('no-less-than', None)
             self.fixed_value = kwargs.get('exactly', self.dynamic_value)
+            self.warmup = int(kwargs.get('warm-up', 0))
+
+            if 'adaptive' in kwargs:
+                if self.dynamic_value is not None or self.fixed_value is not None:
+                    raise ValueError('"adaptive" cannot be combined with "exactly" or "no-less-than"')
+
+                # a single job repeats the configuration
+                self.adaptive = ProjectStepRepeatAdaptive(kwargs.get('adaptive'))
+                self.fixed_value = 1
 
             if self.dynamic_value is None and self.fixed_value is None:
-                raise ValueError('Specify either "exactly" and/or "no-less-than" values')
+                raise ValueError('Specify either "exactly", "no-less-than" and/or "adaptive" values')
 
         else:
             raise ValueError('kwargs must be int or dictionary')
@@ -103,7 +222,45 @@ class ProjectStepRepeat(object):
     def is_complex(self):
         return self.dynamic_value is not None
 
+    def is_adaptive(self):
+        return self.adaptive is not None
+
+    def more_runs(self, durations, history=None):
+        """
+        Returns True if the job should run its script again,
+        durations contains the duration of each measured run so far,
+        the warm-up runs are handled by the caller. The adaptive series
+        continues from the history of the configuration (see index_stats)
+        :type durations: list[float]
+        :type history: dict
+        """
+        if self.adaptive:
+            return not self.adaptive.done(durations, history)
+        return not durations
+
+    def remaining(self, total=0, history=None):
+        """
+        Returns number of repetitions which are still required
+        when there already are total results in the database,
+        the adaptive configurations which already converged
+        (according to the history) are not repeated
+        :type total: int
+        :type history: dict
+        """
+        if self.adaptive:
+            return 0 if history and self.adaptive.done(list(), history) else 1
+
+        min_repeat = self.value
+        if not min_repeat or min_repeat < 1:
+            min_repeat = 1
+
+        if not self.is_complex():
+            return min_repeat
+        return max(min_repeat - (total or 0), 0)
+
     def __repr__(self):
+        if self.adaptive:
+            return 'Repeat(warmup={self.warmup}, {self.adaptive})'.format(self=self)
         return 'Repeat(fixed={self.fixed_value}, dynamic={self.dynamic_value})'.format(
             self=self
         )
@@ -114,4 +271,6 @@ class ProjectStepRepeat(object):
             fixed=self.fixed_value,
             dynamic=self.dynamic_value,
             remains=self._remains,
+            warmup=self.warmup,
+            adaptive=self.adaptive.to_json() if self.adaptive else None,
         )
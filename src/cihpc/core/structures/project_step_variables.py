@@ -1,12 +1,255 @@
 #!/bin/python3
 # author: Jan Hybs
 
+import enum
+import functools
+import operator
+import random
+
 from loguru import logger
-import itertools
 
 from cihpc.core.structures.a_project import ComplexClass
 
 
+class SamplingMethod(enum.Enum):
+    RANDOM = 'random'
+    LHS = 'lhs'
+
+
+class VariableConstraint(object):
+    """
+    Single include/exclude constraint of the variable section
+
+    A constraint is either a python expression evaluated with the variables
+    of the configuration (e.g. "cpu * mesh <= 64 and mesh != 'big'")
+    or a dictionary, which matches if all its values are equal
+    to the values of the configuration.
+
+    :type definition: str or dict
+    """
+
+    _builtins = dict(
+        abs=abs, min=min, max=max, len=len, round=round, any=any, all=all,
+        int=int, float=float, str=str, bool=bool,
+    )
+
+    def __init__(self, definition):
+        self.definition = definition
+        self.code = None
+
+        if isinstance(definition, str):
+            try:
+                self.code = compile(definition, '<constraint>', 'eval')
+            except SyntaxError as e:
+                raise ValueError(f'invalid constraint "{definition}": {e}')
+
+        elif not isinstance(definition, dict):
+            raise ValueError(f'constraint must be str or dict, got {definition}')
+
+    def __call__(self, variables):
+        if self.code is None:
+            return all(k in variables and variables[k] == v for k, v in self.definition.items())
+
+        try:
+            return bool(eval(self.code, {'__builtins__': self._builtins}, variables))
+        except Exception as e:
+            raise ValueError(f'could not evaluate constraint "{self.definition}" with {variables}: {e}')
+
+    def __repr__(self):
+        return 'Constraint(%s)' % str(self.definition)
+
+
+class VariableSection(object):
+    """
+    A lazy definition of a single matrix or table of the variables
+
+    The configurations are never stored, each one is decoded from its
+    ordinal number when needed, so the memory does not depend on the size
+    of the matrix. Configurations are filtered using the exclude and include
+    constraints and optionally a deterministic sample of the given size
+    is picked either randomly or using the Latin hypercube sampling.
+
+    .. code-block:: yaml
+
+        variables:
+          - matrix:
+              - cpu: [1, 2, 4, 8]
+              - mesh: [small, medium, big]
+            exclude:
+              - cpu == 1 and mesh == 'big'
+              - {cpu: 8, mesh: small}
+            include:
+              - cpu <= 4 or mesh == 'big'
+            sample: 5           # optional number of configurations
+            sampling: lhs       # random (default) or lhs
+            seed: 1             # seed of the sampling, default 0
+
+    :type names: list[str]
+    :type values: list[list]
+    :type exclude: list[VariableConstraint]
+    :type include: list[VariableConstraint]
+    """
+
+    _kinds = ('matrix', 'values', 'table')
+
+    # number of consecutive Latin hypercube batches without new configuration
+    _lhs_attempts = 10
+
+    def __init__(self, section):
+        def ensure_list(o):
+            if isinstance(o, list):
+                return o
+            return [o]
+
+        kinds = [k for k in self._kinds if k in section]
+        if len(kinds) != 1:
+            raise ValueError(f'Invalid variable type {list(section.keys())}')
+
+        self.kind = kinds[0]
+        variables = section[self.kind]
+        self.names = [next(iter(y.keys())) for y in variables]
+        self.values = [ensure_list(next(iter(y.values()))) for y in variables]
+
+        if self.kind == 'matrix':
+            self.shape = [len(v) for v in self.values]
+            self.size = functools.reduce(operator.mul, self.shape, 1)
+        else:
+            self.size = max(len(v) for v in self.values) if self.values else 0
+            self.values = [v if len(v) > 1 else v * self.size for v in self.values]
+            self.shape = [self.size]
+
+        self.exclude = [VariableConstraint(x) for x in ensure_list(section.get('exclude') or list())]
+        self.include = [VariableConstraint(x) for x in ensure_list(section.get('include') or list())]
+        self.sample = section.get('sample', None)
+        self.sampling = SamplingMethod(section.get('sampling', SamplingMethod.RANDOM.value))
+        self.seed = section.get('seed', 0)
+        self._count = None
+
+        if self.sample is not None and (not isinstance(self.sample, int) or self.sample < 1):
+            raise ValueError(f'sample must be a positive integer, got {self.sample}')
+
+    def point(self, index):
+        """
+        Returns the configuration with the given ordinal number
+        :type index: int
+        :rtype: dict
+        """
+        if self.kind != 'matrix':
+            return {name: values[index] for name, values in zip(self.names, self.values)}
+
+        result = dict()
+        for name, values, size in reversed(list(zip(self.names, self.values, self.shape))):
+            index, i = divmod(index, size)
+            result[name] = values[i]
+        return {name: result[name] for name in self.names}
+
+    def accepts(self, variables):
+        """
+        Returns True if the configuration passes all the constraints
+        :type variables: dict
+        """
+        if any(c(variables) for c in self.exclude):
+            return False
+        return all(c(variables) for c in self.include)
+
+    def _indices(self):
+        if not self.sample:
+            return iter(range(self.size))
+
+        rng = random.Random(self.seed)
+        if self.sampling is SamplingMethod.LHS:
+            return self._lhs_indices(rng)
+        return self._random_indices(rng)
+
+    def _random_indices(self, rng):
+        # small spaces are shuffled, otherwise indices are drawn until
+        # the sample is complete, only the drawn indices are remembered
+        if self.size <= 2 * self.sample:
+            yield from rng.sample(range(self.size), self.size)
+            return
+
+        drawn = set()
+        while len(drawn) < self.size:
+            index = rng.randrange(self.size)
+            if index not in drawn:
+                drawn.add(index)
+                yield index
+
+    def _lhs_indices(self, rng):
+        # each dimension is split into sample strata and every stratum is used
+        # exactly once, duplicates (when a dimension has less values
+        # than the sample size) are skipped and new batches are generated
+        drawn = set()
+        attempts = 0
+        while attempts < self._lhs_attempts and len(drawn) < self.size:
+            permutations = [rng.sample(range(self.sample), self.sample) for _ in self.shape]
+            new = 0
+            for i in range(self.sample):
+                index = 0
+                for size, permutation in zip(self.shape, permutations):
+                    stratum = (permutation[i] + rng.random()) / self.sample
+                    index = index * size + min(int(stratum * size), size - 1)
+
+                if index not in drawn:
+                    drawn.add(index)
+                    new += 1
+                    yield index
+            attempts = 0 if new else attempts + 1
+
+    def _accepted(self):
+        # yields tuples (index, variables), the number of the configurations
+        # is remembered once all of them were yielded
+        found = 0
+        for index in self._indices():
+            variables = self.point(index)
+            if self.accepts(variables):
+                yield index, variables
+                found += 1
+                if self.sample and found >= self.sample:
+                    break
+        self._count = found
+
+    def __iter__(self):
+        for index, variables in self._accepted():
+            yield variables
+
+    def count(self):
+        """
+        Returns number of the configurations this section yields,
+        the configurations are streamed (not stored) if any constraints are used
+        """
+        if self._count is None:
+            if not self.exclude and not self.include:
+                self._count = min(self.size, self.sample or self.size)
+            else:
+                self._count = sum(1 for _ in self._accepted())
+        return self._count
+
+    def estimate(self):
+        """
+        Returns the upper bound of the number of the configurations,
+        the constraints are not evaluated
+        """
+        if self._count is not None:
+            return self._count
+        return min(self.size, self.sample or self.size)
+
+    def expand(self):
+        """
+        Returns the number of the configurations and an iterator over them
+
+        If the count is not known yet, it is computed by a streaming pass
+        before the configurations are enumerated again, so nothing is stored
+        :rtype: (int, collections.Iterator[dict])
+        """
+        return self.count(), iter(self)
+
+    def __repr__(self):
+        if self._count is None:
+            return '{self.kind}(up to {n} of {self.size} configurations)'.format(self=self, n=self.estimate())
+        return '{self.kind}({self._count} of {self.size} configurations)'.format(self=self)
+
+
 class ProjectStepVariables(ComplexClass):
     def __init__(self, kwargs):
         super(ProjectStepVariables, self).__init__(kwargs)
@@ -24,51 +267,39 @@ class ProjectStepVariables(ComplexClass):
             raise ValueError('kwargs must be list or dict')
 
         self.values = values.copy()
+        self.sections = [VariableSection(section) for section in self.values]
 
     @staticmethod
     def _expand_variables(section):
-        def extract_first(iterator):
-            return next(iter(iterator))
-
-        def ensure_list(o):
-            if isinstance(o, list):
-                return o
-            return [o]
-
-        section_name = extract_first(section.keys())
-        variables = extract_first(section.values())
-        names = [extract_first(y.keys()) for y in variables]
-
-        if section_name in ('values', 'table'):
-            total = max([len(ensure_list(extract_first(y.values()))) for y in variables])
-            values = list()
-            for y in variables:
-                value = extract_first(y.values())
-                if isinstance(value, list):
-                    values.append(value)
-                else:
-                    values.append(list(itertools.repeat(value, total)))
-
-            product = [{names[v_j]: values[v_j][v_i] for v_j in range(len(names))} for v_i in range(total)]
-            logger.debug(f'created value matrix with {len(product)} configurations')
-
-        elif section_name == 'matrix':
-            values = [ensure_list(extract_first(y.values())) for y in variables]
-            product = list(dict(zip(names, x)) for x in itertools.product(*values))
-            logger.debug(f'created build matrix with {len(product)} configurations')
-            
-        else:
-            raise Exception(f'Invalid variable type {section_name}')
-
-        return product
+        return list(VariableSection(section))
 
     def unique(self):
         import uuid
         return uuid.uuid4().hex
 
+    def count(self):
+        """
+        Returns total number of the configurations
+        """
+        if not self.sections:
+            return 1
+        return sum(section.count() for section in self.sections)
+
+    def estimate(self):
+        """
+        Returns the upper bound of the total number of the configurations,
+        the constraints are not evaluated
+        """
+        if not self.sections:
+            return 1
+        return sum(section.estimate() for section in self.sections)
+
     def expand(self):
+        """
+        Lazily yields all the configurations
+        """
         # empty matrix will yield single variables
-        if not self.values:
+        if not self.sections:
             yield dict(
                 __total__=1,
                 __current__=1,
@@ -76,10 +307,10 @@ class ProjectStepVariables(ComplexClass):
             )
 
         else:
-            for section in self.values:
-                var_list = self._expand_variables(section)
-                total = len(var_list)
-                for i, variables in enumerate(var_list):
+            for section in self.sections:
+                logger.debug(f'expanding {section}')
+                total, configurations = section.expand()
+                for i, variables in enumerate(configurations):
                     variables.update(dict(
                         __total__=total,
                         __current__=i + 1,
@@ -1,15 +1,26 @@
 #!/bin/python3
 # author: Jan Hybs
+import copy
+import enum
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
 from loguru import logger
 from pathlib import Path
 import cihpc.core.db as db
+from cihpc.common.processing.pool import CoreBudget
 from cihpc.core.parsers.schedule_parser import parse_args
 from cihpc.core.processing.project import ProcessProject
 from cihpc.core.utils import iter_project_definition
 from cihpc.common.utils.vcs import HistoryBrowser, GitHistory
+from cihpc.scheduler.bisect import Bisection, commit_ratios
+
+
+class SchedulePolicy(enum.Enum):
+    HISTORY = 'history'
+    BISECT = 'bisect'
 
 
 def main(cmd_args=None):
@@ -31,15 +42,21 @@ def main(cmd_args=None):
         # prepare process
         project = ProcessProject(project_definition, initialize_repository=False)
         logger.info(f'processing project {project_definition.name}')
-        scheduler = ProjectScheduler(project_definition, actions)
+        scheduler = ProjectScheduler(project_definition, actions, args.parallel_commits, args.cpus)
 
-        scheduler.run()
+        if SchedulePolicy(args.policy) is SchedulePolicy.BISECT:
+            scheduler.bisect(args.good, args.bad, args.threshold, args.frame)
+        else:
+            scheduler.run()
 
 
 class ProjectScheduler:
-    def __init__(self, project, actions: List[str] = None):
+    def __init__(self, project, actions: List[str] = None, parallel_commits: int = 1, cpus: int = None):
         """
         :type project: cihpc.core.structures.project.Project
+        :param parallel_commits: number of commits processed at the same time,
+                                 each commit is checked out to its own worktree
+        :param cpus: number of cores shared by the commits processed at the same time
         """
         self.project = project
         if not self.project.use_database:
@@ -62,47 +79,177 @@ class ProjectScheduler:
         self.test_action = actions[-1]
         logger.info(f'Git repo dir: {self.project.git.main_repo.dir}')
 
+        # the stages of all the commits share the cores
+        self.parallel_commits = max(parallel_commits or 1, 1)
+        self.budget = CoreBudget(cpus, pin=True) if self.parallel_commits > 1 else None
+
     def run(self):
-        os.chdir(self.project.git.main_repo.dir)
         hist = list(self.browser.git_history(limit=10))
         self.history= sorted(list(set([h for h in hist])), reverse=True)
         logger.info(f'Found {len(hist)} commits, {len(self.history)} of which are unique')
         total = len(self.history)
 
+        if self.parallel_commits > 1:
+            self.process_commits([str(gh.commit.hexsha) for gh in self.history])
+            return
+
         for i, gh in enumerate(self.history):
             logger.critical(f'[{i+1}/{total}] Running commit {gh.short_hexsha}')
-            self.project.git.main_repo._commit = str(gh.commit.hexsha)
-            self.project.git.main_repo._branch = 'master'  # sadly a single commit can be in several branches
-
-            pp = ProcessProject(self.project, initialize_repository=True)
-            test_stage = pp.get_stage_by_name(self.test_action)
-            if not test_stage:
-                continue
-
-            threads = pp.get_stage_variable_stats(test_stage)
-            need_to_run = False
-            for need_repeats, db_index in threads:
-                if need_repeats > 0:
-                    need_to_run = True
-                    break
-
-            failed = False
-            if not need_to_run:
-                logger.warning(f'no need to process this commit')
+            self.process_commit(str(gh.commit.hexsha))
+
+    def process_commits(self, commits: List[str]):
+        """
+        Processes at most parallel_commits commits at the same time,
+        each commit in its own workdir with the repository checked out
+        to a separate worktree, so the builds do not interfere
+        """
+        total = len(commits)
+        logger.info(f'processing {total} commits, {self.parallel_commits} at a time, cores: {self.budget}')
+
+        def target(i, commit):
+            logger.critical(f'[{i+1}/{total}] Running commit {commit[:8]}')
+            project = self.commit_project(commit)
+            try:
+                self.process_commit(commit, project=project)
+            finally:
+                self.remove_commit_project(project)
+
+        with ThreadPoolExecutor(max_workers=self.parallel_commits, thread_name_prefix='commit') as executor:
+            futures = [executor.submit(target, i, commit) for i, commit in enumerate(commits)]
+            for future in futures:
+                future.result()
+
+    def commit_project(self, commit: str):
+        """
+        Returns a copy of the project, which works in <workdir>/worktrees/<commit>
+        with the main repository checked out to a worktree of the original repository,
+        the dependencies are cloned to the new workdir as well
+
+        :rtype: cihpc.core.structures.project.Project
+        """
+        project = copy.deepcopy(self.project)
+        project.workdir = os.path.join(self.project.workdir, 'worktrees', commit[:12])
+
+        main_repo = project.git.main_repo
+        main_repo.root = project.workdir
+        main_repo._dir = os.path.join(project.workdir, main_repo.name)
+        main_repo.checkout = False
+        self.browser.git.worktree(main_repo.dir, commit)
+
+        for dep in project.git.deps.values():
+            if dep and not dep._dir:
+                dep.root = project.workdir
+        return project
+
+    def remove_commit_project(self, project):
+        """
+        Removes the worktree and the workdir of the project made by commit_project,
+        the results are in the database already, so only the build files are lost
+
+        :type project: cihpc.core.structures.project.Project
+        """
+        self.browser.git.remove_worktree(project.git.main_repo.dir)
+        shutil.rmtree(project.workdir, ignore_errors=True)
+
+    def process_commit(self, commit: str, branch: str = 'master', project=None):
+        """
+        Runs the configured stages and the test stage on the given commit,
+        unless the test stage has enough results already
+
+        :type project: cihpc.core.structures.project.Project
+        :param project: the project to run, a copy made by commit_project
+                        when several commits are processed at the same time
+        """
+        project = project or self.project
+        project.git.main_repo._commit = commit
+        project.git.main_repo._branch = branch  # sadly a single commit can be in several branches
+
+        pp = ProcessProject(project, initialize_repository=True, budget=self.budget)
+        test_stage = pp.get_stage_by_name(self.test_action)
+        if not test_stage:
+            return
+
+        threads = pp.get_stage_variable_stats(test_stage)
+        need_to_run = False
+        for need_repeats, db_index in threads:
+            if need_repeats > 0:
+                need_to_run = True
+                break
+
+        failed = False
+        if not need_to_run:
+            logger.warning(f'no need to process this commit')
+        else:
+            for action in self.actions:
+                logger.info(f'running stage {action}')
+                stage = pp.get_stage_by_name(action)
+
+                if stage:
+                    if not pp.process_stage(stage):
+                        # terminate the current build on error
+                        logger.error(f"stage {stage.name} failed, breaking")
+                        failed = True
+                        break
+
+            if not failed:
+                pp.process_stage(test_stage)
+
+    def bisect(self, good: str, bad: str, threshold: float = 0.05, frame: str = None):
+        """
+        Finds the first commit between the good and the bad commit (first parents only)
+        whose duration is worse than the good one by more than the threshold
+
+        The existing results narrow the range first, then only the commits
+        in the middle of the range are built and tested. The stages run through
+        the ProcessProject as usual, so the step cache is used for the commits
+        (or inputs) which were built already.
+
+        Returns
+        -------
+        str
+            sha of the first slow commit or None
+        """
+        repo = self.browser.git.repo
+        good = repo.commit(good).hexsha
+        bad = repo.commit(bad).hexsha
+        between = [c.hexsha for c in repo.iter_commits(f'{good}..{bad}', first_parent=True)]
+        commits = [good] + list(reversed(between))
+        if commits[-1] != bad:
+            raise ValueError(f'commit {bad} is not a descendant of {good}')
+
+        connection = db.CIHPCMongo.get_default()
+        bisection = Bisection(commits, threshold)
+        logger.info(f'bisecting {len(commits)} commits, threshold {threshold:.1%}, frame: {frame or "result"}')
+
+        for commit in [good, bad]:
+            if commit not in commit_ratios(connection, good, [commit], frame):
+                self.process_commit(commit)
+
+        bisection.update(commit_ratios(connection, good, commits, frame))
+        if not bisection.is_regression():
+            logger.warning(f'commit {bad[:8]} is not slower than {good[:8]} by more than {threshold:.1%}, '
+                           f'nothing to bisect')
+            return None
+
+        while True:
+            commit = bisection.next()
+            if commit is None:
+                break
+
+            logger.critical(f'{bisection}: testing commit {commit[:8]}, about {bisection.steps} step(s) left')
+            self.process_commit(commit)
+
+            ratios = commit_ratios(connection, good, [commit], frame)
+            if commit in ratios:
+                logger.info(f'commit {commit[:8]} is {ratios[commit]:.3f} times slower than {good[:8]}')
+                bisection.update(ratios)
             else:
-                for action in self.actions:
-                    logger.info(f'running stage {action}')
-                    stage = pp.get_stage_by_name(action)
-
-                    if stage:
-                        if not pp.process_stage(stage):
-                            # terminate the current build on error
-                            logger.error(f"stage {stage.name} failed, breaking")
-                            failed = True
-                            break
-
-                if not failed:
-                    pp.process_stage(test_stage)
+                bisection.skip(commit)
+
+        culprit = bisection.culprit
+        logger.critical(f'first slow commit: {culprit} '
+                        f'({bisection.ratios[culprit]:.3f} times slower than {good[:8]})')
+        return culprit
 
     def check_for_new_commits(self, min_reps: int = 0):
         pass
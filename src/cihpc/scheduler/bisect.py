@@ -0,0 +1,155 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import math
+from collections import defaultdict
+
+import numpy as np
+from loguru import logger
+
+from cihpc.core.db.rollup import Rollup
+
+
+def commit_ratios(connection, good, commits, frame=None):
+    """
+    Returns the slowdown of each commit relative to the good commit
+
+    For each index the median duration of the commit is divided by the median
+    duration of the good commit, the slowdown of the commit is the geometric
+    mean of these ratios over the indices measured in both commits.
+    The warm-up runs are skipped.
+
+    Parameters
+    ----------
+    connection: cihpc.core.db.CIHPCMongo
+    good: str
+        the reference commit
+    commits: list[str]
+        commits to compare with the good one
+    frame: str
+        name of the timer, the whole report (result.duration) if not set
+
+    Returns
+    -------
+    dict[str, float]
+        slowdown of the commits which have any results, 1.0 for the good commit
+    """
+    connection.ensure_index(['commit'], prefix='git')
+    projection = {'git.commit': 1, 'index': 1, 'result.duration': 1, 'timers.name': 1, 'timers.duration': 1}
+    cursor = connection.reports.find(
+        {'git.commit': {'$in': list(set(commits) | {good})}, 'result.warm-up': {'$ne': True}},
+        projection,
+    )
+
+    values = defaultdict(lambda: defaultdict(list))
+    for document in cursor:
+        commit = (document.get('git') or dict()).get('commit')
+        index = {k: v for k, v in (document.get('index') or dict()).items() if k not in Rollup.exclude_index}
+        key = str(sorted(index.items()))
+        for name, duration in Rollup.entries(document):
+            if name == frame and duration > 0:
+                values[commit][key].append(duration)
+
+    reference = {key: np.median(v) for key, v in values.get(good, dict()).items()}
+    ratios = dict()
+    for commit in commits:
+        logs = [
+            math.log(np.median(v) / reference[key])
+            for key, v in values.get(commit, dict()).items() if key in reference
+        ]
+        if logs:
+            ratios[commit] = math.exp(sum(logs) / len(logs))
+    return ratios
+
+
+class Bisection(object):
+    """
+    Finds the first commit which is slower than the good commit
+    by more than the threshold
+
+    The results which already exist are used first to narrow the range,
+    then the commit closest to the middle of the range is tested,
+    so the culprit is found in about log2(N) builds. The commits which
+    cannot be measured (e.g. the build fails) are skipped.
+
+    Parameters
+    ----------
+    commits: list[str]
+        the good commit, the commits between and the bad commit, oldest first
+    threshold: float
+        relative slowdown which is considered a regression
+    """
+
+    def __init__(self, commits, threshold=0.05):
+        self.commits = list(commits)
+        self.threshold = threshold
+        self.ratios = dict()
+        self.skipped = set()
+
+        self.good = 0
+        self.bad = len(self.commits) - 1
+
+    def is_slow(self, commit):
+        return self.ratios[commit] > 1.0 + self.threshold
+
+    def update(self, ratios):
+        """
+        Records the measured slowdowns and narrows the range
+        :type ratios: dict[str, float]
+        """
+        self.ratios.update({k: v for k, v in ratios.items() if k in self.commits})
+
+        measured = [i for i in range(self.good + 1, self.bad) if self.commits[i] in self.ratios]
+        slow = [i for i in measured if self.is_slow(self.commits[i])]
+        if slow:
+            self.bad = slow[0]
+        fast = [i for i in measured if i < self.bad and not self.is_slow(self.commits[i])]
+        if fast:
+            self.good = fast[-1]
+
+    def skip(self, commit):
+        logger.warning(f'commit {commit} could not be measured, skipping it')
+        self.skipped.add(commit)
+
+    def is_regression(self):
+        """
+        Returns True if the bad commit is slower than the good one
+        """
+        bad = self.commits[-1]
+        return bad in self.ratios and self.is_slow(bad)
+
+    def next(self):
+        """
+        Returns the commit which should be tested next or None if done
+        :rtype: str
+        """
+        middle = (self.good + self.bad) / 2
+        candidates = [
+            i for i in range(self.good + 1, self.bad)
+            if self.commits[i] not in self.skipped and self.commits[i] not in self.ratios
+        ]
+        if not candidates:
+            return None
+        return self.commits[min(candidates, key=lambda i: (abs(i - middle), i))]
+
+    @property
+    def steps(self):
+        """
+        Estimated number of the builds left
+        """
+        return int(math.ceil(math.log2(max(self.bad - self.good, 1))))
+
+    @property
+    def culprit(self):
+        """
+        The first slow commit, if the range cannot be narrowed any more
+        some of the skipped commits right before it may be the culprit
+        """
+        return self.commits[self.bad]
+
+    def __repr__(self):
+        return 'Bisection({good}..{bad}, {n} commit(s) between)'.format(
+            good=self.commits[self.good][:8],
+            bad=self.commits[self.bad][:8],
+            n=self.bad - self.good - 1,
+        )
@@ -51,6 +51,11 @@ def parse_args(cmd_args=None):
     parser.add_argument('-p', '--port', default=5000, type=int, help='''R|
                             The port of the webserver. Defaults to 5000.
                             ''')
+    parser.add_argument('--cache-dir', default=None, help='''R|
+                            A directory of the on-disk tier of the response cache.
+                            Cached responses in this directory survive restarts
+                            of the server. By default only the memory tier is used.
+                            ''')
     parser.add_argument('action', choices=['start', 'stop', 'restart', 'status', 'debug'], help='''R|
                             Perform given action
                             ''')
@@ -118,6 +123,7 @@ class WWWServer(Daemon):
         from cihpc.www.rest.frame_view import FrameView
         from cihpc.www.rest.config_view import ConfigView
         from cihpc.www.rest.commit_history_view import CommitHistoryView
+        from cihpc.www.rest.regressions_view import RegressionsView
         from flask import redirect
 
         api, app = init_flask_server()
@@ -145,6 +151,12 @@ class WWWServer(Daemon):
             '/<string:project>/commit-history',
         )
 
+        api.add_resource(
+            RegressionsView,
+            '/<string:project>/regressions/<string:commit>',
+            '/<string:project>/regressions',
+        )
+
         @app.route('/')
         def hello_world():
             return 'Your server is running!'
@@ -184,6 +196,10 @@ def main(cmd_args=None):
 
     logger.info(f'using config dir {global_configuration.home}')
 
+    if args.cache_dir and global_configuration.view_cache_opts is not None:
+        global_configuration.view_cache_opts['disk'] = os.path.abspath(args.cache_dir)
+        logger.info(f'using cache dir {global_configuration.view_cache_opts["disk"]}')
+
     if args.action == 'debug':
         args.debug = True
 
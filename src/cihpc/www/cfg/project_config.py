@@ -1,6 +1,8 @@
 #!/bin/python3
 # author: Jan Hybs
 
+import ast
+import hashlib
 import itertools
 from loguru import logger
 import os
@@ -8,6 +10,8 @@ import sys
 from collections import namedtuple
 from enum import Enum
 
+import numpy as np
+import pandas as pd
 import yaml
 
 from cihpc.cfg.cfgutil import find_valid_configuration
@@ -98,8 +102,26 @@ class ProjectConfig(object):
             )
         return cls._instances[project_name]
 
+    @classmethod
+    def version(cls, project_name):
+        """
+        Returns a hash of the www.yaml configuration of the given project,
+        which changes whenever the configuration is edited
+
+        Parameters
+        ----------
+        project_name : str
+            a name of the project
+
+        Returns
+        -------
+        str
+        """
+        with open(cls._get_project_config_path(project_name), 'rb') as fp:
+            return hashlib.md5(fp.read()).hexdigest()
+
     @staticmethod
-    def _get_project_config(project_name):
+    def _get_project_config_path(project_name):
         cfg_dir = find_valid_configuration(
             os.path.join(global_configuration.home, project_name),
             global_configuration.home,
@@ -110,9 +132,11 @@ class ProjectConfig(object):
             logger.error('termination execution')
             raise Exception('configuration not found')
 
-        cfg_path = os.path.join(cfg_dir, 'www.yaml')
+        return os.path.join(cfg_dir, 'www.yaml')
 
-        with open(cfg_path, 'r') as fp:
+    @classmethod
+    def _get_project_config(cls, project_name):
+        with open(cls._get_project_config_path(project_name), 'r') as fp:
             return yaml.load(fp)
 
     def __init__(self, config):
@@ -142,6 +166,9 @@ class ProjectConfig(object):
 
         self.fields = ProjectConfigFields(config.get('fields', {}))
 
+        # compute chart statistics in the database if possible
+        self.pushdown = config.get('pushdown', True)
+
     def get_test_view_groupby(self):
         """
         a method will generate section for grouping and renaming when
@@ -190,9 +217,23 @@ class ViewMode(Enum):
 class FieldExpression(object):
     _operators = list('+-*/')
 
+    # functions which can be used in the compiled expressions
+    _vector_functions = dict(
+        abs=np.abs,
+        round=np.round,
+        float=lambda x: x.astype(float) if hasattr(x, 'astype') else float(x),
+        int=lambda x: x.astype(int) if hasattr(x, 'astype') else int(x),
+    )
+
+    _vector_nodes = tuple(getattr(ast, x) for x in [
+        'Expression', 'BinOp', 'UnaryOp', 'Add', 'Sub', 'Mult', 'Div', 'FloorDiv', 'Mod', 'Pow',
+        'USub', 'UAdd', 'Subscript', 'Index', 'Name', 'Load', 'Call',
+    ] + (['Constant'] if hasattr(ast, 'Constant') else ['Num', 'Str']) if hasattr(ast, x))
+
     def __init__(self, conf, name):
         self.name = name
         self.expression = conf.get(self.name, None)
+        self.vector_func = None
 
         if not self.expression:
             self.is_complex = False
@@ -207,11 +248,79 @@ class FieldExpression(object):
         if self.expression.startswith('='):
             self.is_complex = True
             self.func = eval('lambda row: ' + self.expression[1:])
+            self.vector_func = self._compile(self.expression[1:])
         else:
             self.is_complex = False
             self.func = lambda row: row[self.expression]
             self.fields.add(self.expression)
 
+    @classmethod
+    def _compile(cls, expression):
+        """
+        Compiles the expression so it can be evaluated on the entire DataFrame at once,
+        which is possible only if the expression consists of column references (row['name']),
+        constants, arithmetic operators and a few functions (see _vector_functions)
+
+        Returns
+        -------
+        callable or None
+            a function which accepts a DataFrame or None if the expression cannot be compiled
+        """
+        try:
+            tree = ast.parse(expression.strip(), mode='eval')
+        except SyntaxError:
+            return None
+
+        for node in ast.walk(tree):
+            if not isinstance(node, cls._vector_nodes):
+                return None
+
+            if isinstance(node, ast.Name) and node.id != 'row' and node.id not in cls._vector_functions:
+                return None
+
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in cls._vector_functions or node.keywords:
+                    return None
+
+            if isinstance(node, ast.Subscript):
+                key = node.slice.value if isinstance(node.slice, getattr(ast, 'Index', ())) else node.slice
+                key = getattr(key, 'value', getattr(key, 's', None))
+                if not isinstance(node.value, ast.Name) or node.value.id != 'row' or not isinstance(key, str):
+                    return None
+
+        code = compile(tree, '<field-expression>', 'eval')
+        functions = dict(cls._vector_functions, __builtins__=dict())
+        return lambda df: eval(code, functions, dict(row=df))
+
+    def evaluate(self, df):
+        """
+        Evaluates the expression on the entire DataFrame
+
+        Plain fields are simply copied, compiled expressions are evaluated
+        column-wise and the rest is evaluated row by row
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+
+        Returns
+        -------
+        pd.Series
+        """
+        if not self.is_complex:
+            return df[self.expression]
+
+        if self.vector_func and not df.empty:
+            try:
+                result = self.vector_func(df)
+                if isinstance(result, pd.Series):
+                    return result
+                return pd.Series(result, index=df.index)
+            except Exception as e:
+                logger.debug(f'could not evaluate {self.name} column-wise ({e}), using row-wise evaluation')
+
+        return df.apply(self.func, axis=1)
+
     def __bool__(self):
         return self.valid
 
@@ -254,11 +363,27 @@ class ProjectConfigFields(object):
 
         return result
 
+    def resolve(self, name):
+        """
+        Returns a path in the document of the given column name or None
+        if the column is computed by a complex expression
+
+        Parameters
+        ----------
+        name : str
+            a name of the column after apply_to_df
+        """
+        for field_group in [self.result, self.git, self.problem]:
+            for field in field_group:
+                if field and field.name == name:
+                    return None if field.is_complex else field.expression
+        return name
+
     def apply_to_df(self, df):
         for field_group in [self.result, self.git, self.problem]:
             for field in field_group:
                 if field:
-                    df[field.name] = df.apply(field.func, axis=1)
+                    df[field.name] = field.evaluate(df)
         return df
 
     def __repr__(self):
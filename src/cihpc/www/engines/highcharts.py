@@ -163,7 +163,9 @@ class ChartGroup(object):
         'median': np.median,
         'min'   : np.min,
         'max'   : np.max,
-        'std'   : np.std,
+        # population std, same as the $stdDevPop of the pushdown
+        # (Series.std and older pandas agg(np.std) use ddof=1)
+        'std'   : lambda x: np.std(x, ddof=0),
         '25%'   : lambda x: np.percentile(x, 25),
         '50%'   : np.median,
         '75%'   : lambda x: np.percentile(x, 75),
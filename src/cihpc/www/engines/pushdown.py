@@ -0,0 +1,280 @@
+#!/bin/python3
+# author: Jan Hybs
+
+from loguru import logger
+
+import numpy as np
+import pandas as pd
+
+from cihpc.common.utils import strings
+from cihpc.common.utils.timer import Timer
+from cihpc.core.db.rollup import QuantileSketch, Rollup
+
+
+class GroupPushdown(object):
+    """
+    Class translates the y metrics of the ChartGroup into a MongoDB $group
+    stage, so only the aggregated chart points are fetched from the database
+
+    Percentiles are computed by the server if it supports them (MongoDB 7.0+),
+    otherwise only the y values of each point are fetched and
+    the percentiles are computed here.
+
+    If the rollup collection is available and all the fields are stored in it,
+    the statistics are merged from the rollup documents instead of the reports.
+
+    Parameters
+    ----------
+    y : (str, str)
+        a name of the y column and its path in the document
+    x : (str, str)
+        a name of the x column and its path in the document
+    c : (str, str)
+        a name of the commit column and its path in the document
+    keys : list[(str, str)]
+        names of the group and color columns and their paths in the document
+    y_metrics : dict
+        metrics of the ChartGroup
+    percentiles : bool
+        whether the server supports $percentile and $median accumulators
+    rollup : bool
+        whether to read from the rollup collection
+    """
+
+    # sections of the report, which are stored in the rollup documents
+    _rollup_sections = ('git', 'index', 'problem')
+    _rollup_y = 'result.duration'
+
+    _percentiles = {
+        '25%'   : 0.25,
+        '50%'   : 0.50,
+        'median': 0.50,
+        '75%'   : 0.75,
+    }
+
+    def __init__(self, y, x, c, keys, y_metrics, percentiles=False, rollup=False):
+        self.y, self.y_path = y
+        self.x, self.x_path = x
+        self.c, self.c_path = c
+        self.keys = list(keys)
+        self.metrics = list(y_metrics.keys())
+        self.percentiles = percentiles
+        self.rollup = rollup
+
+        self.group_keys = [(self.x, self.x_path)] + [k for k in self.keys if k[0] != self.x]
+        self._ids = {name: 'k%d' % i for i, (name, _) in enumerate(self.group_keys)}
+
+    @classmethod
+    def create(cls, config, chart_options, chart_group, mongo, match=None):
+        """
+        Creates a GroupPushdown instance or returns None if any of the fields
+        cannot be read directly from the documents (e.g. complex expressions)
+
+        Parameters
+        ----------
+        config : cihpc.www.cfg.project_config.ProjectConfig
+        chart_options : dict
+        chart_group : cihpc.www.engines.highcharts.ChartGroup
+        mongo : cihpc.core.db.CIHPCMongo
+        match : dict
+            filters which will be used
+        """
+        if not config.pushdown:
+            return None
+
+        names = [chart_options.y, chart_options.x, chart_options.c]
+        names.extend(chart_options.groupby.keys())
+        names.extend(chart_options.colorby.keys())
+
+        paths = {name: config.fields.resolve(name) for name in names}
+        unresolved = [k for k, v in paths.items() if not v]
+        if unresolved:
+            logger.debug(f'pushdown disabled, fields {unresolved} are not plain document fields')
+            return None
+
+        keys = [(k, paths[k]) for k in list(chart_options.groupby.keys()) + list(chart_options.colorby.keys())]
+
+        used = [v for k, v in paths.items() if k != chart_options.y] + list((match or dict()).keys())
+        rollup = paths[chart_options.y] == cls._rollup_y \
+                 and all(path.split('.')[0] in cls._rollup_sections for path in used) \
+                 and Rollup(mongo).available()
+
+        return cls(
+            y=(chart_options.y, paths[chart_options.y]),
+            x=(chart_options.x, paths[chart_options.x]),
+            c=(chart_options.c, paths[chart_options.c]),
+            keys=keys,
+            y_metrics=chart_group.y_metrics,
+            percentiles=mongo.server_version() >= (7, 0),
+            rollup=rollup,
+        )
+
+    @property
+    def requested_percentiles(self):
+        return sorted(set(self._percentiles[m] for m in self.metrics if m in self._percentiles))
+
+    def accumulators(self):
+        """
+        Returns accumulators of the $group stage
+        :rtype: dict
+        """
+        if self.rollup:
+            result = dict(
+                _count={'$sum': '$count'},
+                _sum={'$sum': '$sum'},
+                _sumsq={'$sum': '$sumsq'},
+                _commits={'$addToSet': '$' + self.c_path},
+                _ids={'$push': '$ids'},
+                min={'$min': '$min'},
+                max={'$max': '$max'},
+            )
+            if self.requested_percentiles:
+                result['_sketches'] = {'$push': '$sketch'}
+            return result
+
+        y = '$' + self.y_path
+        result = dict(
+            _count={'$sum': {'$cond': [{'$isNumber': y}, 1, 0]}},
+            _commits={'$addToSet': '$' + self.c_path},
+            _ids={'$addToSet': '$_id'},
+        )
+
+        percentiles = self.requested_percentiles
+        for metric in self.metrics:
+            if metric == 'mean':
+                result['mean'] = {'$avg': y}
+            elif metric == 'min':
+                result['min'] = {'$min': y}
+            elif metric == 'max':
+                result['max'] = {'$max': y}
+            elif metric == 'std':
+                result['std'] = {'$stdDevPop': y}
+            elif metric == 'ci':
+                result['_sample_std'] = {'$stdDevSamp': y}
+
+        if percentiles:
+            if self.percentiles:
+                result['_percentiles'] = {'$percentile': {'input': y, 'p': percentiles, 'method': 'approximate'}}
+            else:
+                result['_values'] = {'$push': y}
+
+        return result
+
+    def pipeline(self, match):
+        """
+        Returns the aggregation pipeline
+        :type match: dict
+        :rtype: list[dict]
+        """
+        pipeline = list()
+        if self.rollup:
+            # only the statistics of the entire reports
+            match = dict(match or dict(), frame=None)
+
+        if match:
+            pipeline.append({'$match': match})
+
+        group = {'_id': {self._ids[name]: '$' + path for name, path in self.group_keys}}
+        group.update(self.accumulators())
+        pipeline.append({'$group': group})
+        return pipeline
+
+    def aggregate(self, mongo, match):
+        """
+        Runs the aggregation and returns a DataFrame with a row for each
+        chart point, the columns are the key names and internal columns
+        _commits, _ids and _y_<metric> for each y metric
+
+        :type mongo: cihpc.core.db.CIHPCMongo
+        :rtype: pd.DataFrame
+        """
+        pipeline = self.pipeline(match)
+        collection = mongo.rollup if self.rollup else mongo.reports
+        logger.debug(f'db.getCollection("{collection.name}").aggregate(\n%s\n)' %
+                     strings.pad_lines(strings.to_json(pipeline)))
+
+        with Timer('db aggregate: pushdown', log=logger.debug):
+            items = list(collection.aggregate(pipeline, allowDiskUse=True))
+
+        rows = list()
+        percentiles = self.requested_percentiles
+        for item in items:
+            group = item['_id']
+
+            # rows with missing keys are dropped, same as in the pandas groupby
+            if any(group.get(self._ids[name]) is None for name, _ in self.group_keys):
+                continue
+
+            if self.rollup:
+                item = self._from_rollup(item)
+
+            row = {name: group[self._ids[name]] for name, _ in self.group_keys}
+            row['_commits'] = item['_commits']
+            row['_ids'] = item['_ids']
+
+            for metric in ('mean', 'min', 'max', 'std'):
+                if metric in self.metrics:
+                    row['_y_' + metric] = item.get(metric)
+
+            if 'ci' in self.metrics:
+                row['_y_ci'] = self.confidence_interval(item.get('_sample_std'), item['_count'])
+
+            if percentiles:
+                if '_sketch' in item:
+                    values = {p: item['_sketch'].quantile(p) for p in percentiles}
+                elif '_percentiles' in item:
+                    values = dict(zip(percentiles, item['_percentiles']))
+                else:
+                    data = [v for v in item['_values'] if v is not None]
+                    values = dict(zip(percentiles, np.percentile(data, [p * 100 for p in percentiles])
+                                      if data else [None] * len(percentiles)))
+                for metric in self.metrics:
+                    if metric in self._percentiles:
+                        row['_y_' + metric] = values[self._percentiles[metric]]
+
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def _from_rollup(self, item):
+        """
+        Converts merged rollup documents to the same values the $group
+        stage on the reports produces
+        """
+        mean, std, sample_std = Rollup.moments(item['_count'], item['_sum'], item['_sumsq'])
+        item.update(mean=mean, std=std, _sample_std=sample_std)
+        item['_ids'] = [x for ids in item['_ids'] for x in ids or []]
+
+        if '_sketches' in item:
+            item['_sketch'] = QuantileSketch()
+            for sketch in item['_sketches']:
+                item['_sketch'].merge(sketch)
+        return item
+
+    def points(self, df):
+        """
+        Converts the rows of the aggregated DataFrame into the same structure
+        the pandas groupby aggregation on the x column would produce
+
+        :type df: pd.DataFrame
+        :rtype: pd.DataFrame
+        """
+        df = df.set_index(self.x).sort_index()
+
+        columns = dict()
+        columns[(self.c, '<lambda>')] = df['_commits']
+        for metric in self.metrics:
+            columns[(self.y, metric)] = df['_y_' + metric].astype(float)
+        columns[('_id', '<lambda>')] = df['_ids']
+        return pd.DataFrame(columns, index=df.index)
+
+    @staticmethod
+    def confidence_interval(std, count, confidence=0.95):
+        """
+        Computes the same value as mean_confidence_interval
+        from the sample standard deviation and the number of values
+        """
+        from scipy import stats as st
+
+        if std is None or count < 2:
+            return np.nan
+        return std / np.sqrt(count) * st.t.ppf((1 + confidence) / 2., count - 1)
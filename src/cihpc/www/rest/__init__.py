@@ -9,6 +9,16 @@ from cihpc.common.utils import strings
 from cihpc.common.utils import datautils as du
 
 
+def data_version(project):
+    """
+    Returns version token of the reports and of the www.yaml configuration
+    of the given project, used as a part of the response cache key
+    """
+    from cihpc.core.db import CIHPCMongo
+    from cihpc.www.cfg.project_config import ProjectConfig
+    return '%s-%s' % (CIHPCMongo.get(project).data_version(), ProjectConfig.version(project))
+
+
 class ConfigurableView(Resource):
     def __init__(self):
         super(ConfigurableView, self).__init__()
@@ -11,12 +11,13 @@ import numpy as np
 import pandas as pd
 from bson import objectid
 
+from cihpc.cfg.config import global_configuration
 from cihpc.common.utils import datautils as du, strings
-from cihpc.common.utils.caching import cached
+from cihpc.common.utils.caching import cached_view, response_cache
 from cihpc.common.utils.timer import Timer
 from cihpc.core.db import CIHPCMongo
 from cihpc.www.cfg.project_config import ProjectConfig
-from cihpc.www.rest import ConfigurableView
+from cihpc.www.rest import ConfigurableView, data_version
 
 
 
@@ -53,8 +54,8 @@ class FrameView(ConfigurableView):
         return frame_view(project, base64data)
 
 
-# cache the charts
-@cached()
+# cache the charts until new reports are inserted
+@cached_view(data_version, response_cache, global_configuration.view_cache_version_ttl)
 def frame_view(project, base64data=''):
     if base64data:
         options = json.loads(
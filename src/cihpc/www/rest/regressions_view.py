@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+# author: Jan Hybs
+
+from loguru import logger
+
+from flask import request
+from flask_restful import Resource
+from pymongo import DESCENDING
+
+from cihpc.common.utils.timer import Timer
+from cihpc.core.db import CIHPCMongo
+
+
+class RegressionsView(Resource):
+    """
+    a view which returns the detected performance regressions,
+    the most recent first
+
+    query arguments:
+        limit:  maximum number of the regressions (default 100)
+        frame:  only regressions of the given frame, use "null" for the whole report
+        origin: only regressions introduced by the commit itself (change-point equals the commit)
+    """
+
+    default_limit = 100
+
+    @Timer.decorate('Regressions: get', logger.info)
+    def get(self, project, commit=None):
+        mongo = CIHPCMongo.get(project)
+
+        filters = dict()
+        if commit:
+            filters['git.commit'] = commit
+
+        if 'frame' in request.args:
+            frame = request.args['frame']
+            filters['frame'] = None if frame == 'null' else frame
+
+        if request.args.get('origin'):
+            filters['$expr'] = {'$eq': ['$change_point.commit', '$git.commit']}
+
+        cursor = mongo.regressions.find(filters).sort([('detected', DESCENDING), ('ratio', DESCENDING)])
+        return list(cursor.limit(request.args.get('limit', self.default_limit, type=int)))
@@ -12,14 +12,16 @@ from collections import namedtuple
 import numpy as np
 import pandas as pd
 
+from cihpc.cfg.config import global_configuration
 from cihpc.common.utils import datautils as du, dateutils, strings
-from cihpc.common.utils.caching import cached
+from cihpc.common.utils.caching import cached_view, response_cache
 from cihpc.common.utils.strings import str2bool
 from cihpc.common.utils.timer import Timer
 from cihpc.core.db import CIHPCMongo
 from cihpc.www.cfg.project_config import ProjectConfig, ViewMode
 from cihpc.www.engines.highcharts import ChartGroup
-from cihpc.www.rest import ConfigurableView
+from cihpc.www.engines.pushdown import GroupPushdown
+from cihpc.www.rest import ConfigurableView, data_version
 
 
 
@@ -66,8 +68,8 @@ class SparklineView(ConfigurableView):
         return sparkline_view(project, base64data)
 
 
-# cache the charts
-@cached()
+# cache the charts until new reports are inserted
+@cached_view(data_version, response_cache, global_configuration.view_cache_version_ttl)
 def sparkline_view(project, base64data=''):
     options, config, mongo = SparklineView.prepare(project, base64data)
 
@@ -92,23 +94,6 @@ def sparkline_view(project, base64data=''):
         forbidden=("", None, "*")
     )
 
-    with Timer('db find & apply', log=logger.debug):
-        data_frame = pd.DataFrame(
-            mongo.find_all(
-                db_find_filters,
-                db_find_fields,
-            )
-        )
-
-        if data_frame.empty:
-            return SparklineView.error_empty_df(db_find_filters)
-
-        sort_field = config.fields.git.datetime.name
-        data_frame = data_frame.sort_values(by=sort_field, ascending=False).reset_index(drop=True)
-
-        config.fields.apply_to_df(data_frame)
-        data_frame[':merged:'] = 'g(?)'
-
     if mode is ViewMode.SCALE_VIEW:
         # split charts based on commit when in scale-view mode
         # if config.fields.git.datetime:
@@ -128,7 +113,6 @@ def sparkline_view(project, base64data=''):
             colorby={k: v for k, v in config.test_view.groupby.items() if
                      not options['groupby'].get(k, False)},
         )
-        data_frame[chart_options.x] = data_frame[chart_options.x].apply(str)
 
     elif mode is ViewMode.TIME_SERIES:
 
@@ -175,6 +159,37 @@ def sparkline_view(project, base64data=''):
                         '<a class="btn btn-warning" data-toggle="modal" data-target="#modal-options">Click here to open configuration.</a>'
         )
 
+    # compute the chart points in the database if possible
+    pushdown = None
+    if squeeze <= 1:
+        pushdown = GroupPushdown.create(config, chart_options, chart_group, mongo, db_find_filters)
+
+    if pushdown:
+        data_frame = pushdown.aggregate(mongo, db_find_filters)
+
+        if data_frame.empty:
+            return SparklineView.error_empty_df(db_find_filters)
+    else:
+        with Timer('db find & apply', log=logger.debug):
+            data_frame = pd.DataFrame(
+                mongo.find_all(
+                    db_find_filters,
+                    db_find_fields,
+                )
+            )
+
+            if data_frame.empty:
+                return SparklineView.error_empty_df(db_find_filters)
+
+            sort_field = config.fields.git.datetime.name
+            data_frame = data_frame.sort_values(by=sort_field, ascending=False).reset_index(drop=True)
+
+            config.fields.apply_to_df(data_frame)
+            data_frame[':merged:'] = 'g(?)'
+
+    if mode is ViewMode.SCALE_VIEW:
+        data_frame[chart_options.x] = data_frame[chart_options.x].apply(str)
+
     charts = list()
     for group_values, group_keys, group_names, group_data in SparklineView.group_by(data_frame, chart_options.groupby):
         group_title = du.join_lists(group_names, group_values, '<dt>{}</dt><dd>{}</dd>', '')
@@ -216,11 +231,14 @@ def sparkline_view(project, base64data=''):
                 # chart_options.x = ':merged:'
 
             with Timer('agg ' + color_title, log=logger.info):
-                cd_group = color_data.groupby(chart_options.x, sort=True).aggregate({
-                    chart_options.c: lambda x: list(set(x)),
-                    chart_options.y: chart_group.y_metrics.items(),
-                    '_id'          : lambda x: list(set(x)),
-                })
+                if pushdown:
+                    cd_group = pushdown.points(color_data)
+                else:
+                    cd_group = color_data.groupby(chart_options.x, sort=True).aggregate({
+                        chart_options.c: lambda x: list(set(x)),
+                        chart_options.y: chart_group.y_metrics.items(),
+                        '_id'          : lambda x: list(set(x)),
+                    })
 
             if chart_group.boxplot_chart:
                 series.append(chart_group.boxplot_chart.get_chart(
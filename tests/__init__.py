@@ -15,3 +15,171 @@ def fix_paths(verbose=False):
     sys.path = [__root__, __tests__] + sys.path
     if verbose:
         print('\n'.join(sys.path))
+
+
+def get_field(document, field):
+    """
+    Returns value of the dotted field of the document, None if missing
+    """
+    for key in field.split('.'):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(key)
+    return document
+
+
+def matches(document, filter):
+    """
+    Returns True if the document passes the mongo filter,
+    supports equality and the $in, $nin, $ne, $lt, $lte, $gt and $gte operators
+    """
+    operators = {
+        '$in' : lambda v, x: v in x,
+        '$nin': lambda v, x: v not in x,
+        '$ne' : lambda v, x: v != x,
+        '$lt' : lambda v, x: v is not None and v < x,
+        '$lte': lambda v, x: v is not None and v <= x,
+        '$gt' : lambda v, x: v is not None and v > x,
+        '$gte': lambda v, x: v is not None and v >= x,
+    }
+    for field, condition in (filter or dict()).items():
+        value = get_field(document, field)
+        if isinstance(condition, dict) and condition and all(k in operators for k in condition):
+            if not all(operators[k](value, x) for k, x in condition.items()):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class Collection(object):
+    """
+    In-memory collection which applies the filters and the aggregation
+    pipelines ($match, $group, $sort and $limit) it is given
+    """
+
+    def __init__(self, documents=(), name='timers'):
+        self.documents = list(documents)
+        self.name = name
+        self.pipelines = list()
+        self.operations = list()
+
+    @property
+    def pipeline(self):
+        return self.pipelines[-1] if self.pipelines else None
+
+    def find(self, filter=None, projection=None, **kwargs):
+        return [d for d in self.documents if matches(d, filter)]
+
+    def find_one(self, filter=None, projection=None, **kwargs):
+        return next(iter(self.find(filter)), None)
+
+    def count_documents(self, filter):
+        return len(self.find(filter))
+
+    def estimated_document_count(self):
+        return len(self.documents)
+
+    def replace_one(self, filter, document, upsert=False):
+        self.documents = [d for d in self.documents if not matches(d, filter)] + [document]
+
+    def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+
+    def drop(self):
+        self.documents = list()
+
+    def create_index(self, keys, **kwargs):
+        return 'index'
+
+    @staticmethod
+    def _group(documents, group):
+        import math
+
+        def key(document, spec):
+            if isinstance(spec, str) and spec.startswith('$'):
+                return get_field(document, spec[1:])
+            if isinstance(spec, dict):
+                return {k: key(document, v) for k, v in spec.items()}
+            return spec
+
+        def accumulate(operator, values):
+            present = [v for v in values if v is not None]
+            if operator == '$push':
+                return values
+            if operator == '$sum':
+                return sum(present)
+            if operator == '$min':
+                return min(present) if present else None
+            if operator == '$max':
+                return max(present) if present else None
+            if not present:
+                return None
+            mean = sum(present) / len(present)
+            if operator == '$avg':
+                return mean
+            ddof = 1 if operator == '$stdDevSamp' else 0
+            if len(present) <= ddof:
+                return None
+            return math.sqrt(sum((v - mean) ** 2 for v in present) / (len(present) - ddof))
+
+        groups = dict()
+        for document in documents:
+            _id = key(document, group['_id'])
+            groups.setdefault(repr(_id), (_id, list()))[1].append(document)
+
+        for _id, items in groups.values():
+            result = dict(_id=_id)
+            for name, spec in group.items():
+                if name != '_id':
+                    (operator, expression), = spec.items()
+                    result[name] = accumulate(operator, [key(d, expression) for d in items])
+            yield result
+
+    def aggregate(self, pipeline, **kwargs):
+        self.pipelines.append(pipeline)
+        documents = self.documents
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == '$match':
+                documents = [d for d in documents if matches(d, spec)]
+            elif operator == '$group':
+                documents = list(self._group(documents, spec))
+            elif operator == '$sort':
+                for field, direction in reversed(list(spec.items())):
+                    documents = sorted(documents, key=lambda d: get_field(d, field), reverse=direction < 0)
+            elif operator == '$limit':
+                documents = documents[:spec]
+            else:
+                raise NotImplementedError(operator)
+        return iter(documents)
+
+
+class Connection(object):
+    """
+    Connection with in-memory collections of the reports and the rollup
+    """
+
+    def __init__(self, reports=(), rollup=()):
+        self.reports = Collection(reports, 'timers')
+        self.rollup = Collection(rollup, 'rollup')
+        self.regressions = Collection(name='regressions')
+
+    def ensure_index(self, fields, prefix='index'):
+        pass
+
+
+def mongo(reports=(), rollup=()):
+    """
+    Returns CIHPCMongo instance using the in-memory collections
+    :rtype: cihpc.core.db.CIHPCMongo
+    """
+    from cihpc.core.db import CIHPCMongo
+
+    connection = Connection(reports, rollup)
+    instance = object.__new__(CIHPCMongo)
+    instance.reports = connection.reports
+    instance.rollup = connection.rollup
+    instance.regressions = connection.regressions
+    instance._indexed = set()
+    return instance
@@ -0,0 +1,113 @@
+#!/bin/python3
+# author: Jan Hybs
+"""
+Benchmark comparing the serial collection of the flow123d profiler
+reports with the collection in the worker processes
+
+usage: PYTHONPATH=src:. python tests/bench_collect.py [--files 500] [--depth 5] [--width 4] [--processes 4]
+"""
+
+import tests
+
+
+tests.fix_paths()
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from loguru import logger
+
+from cihpc.core.processing.step_collect import (
+    convert_method, load_collect_module, process_files_parallel, process_reports,
+)
+from cihpc.core.structures.project_stage import ProjectStage
+
+
+MODULE = 'cihpc.artifacts.modules.flow123d_profiler_module_flatten'
+
+
+class Project(object):
+    name = 'bench-collect'
+
+
+def generate_timer(tag, depth, width):
+    duration = random.random()
+    timer = {
+        'tag'                      : tag,
+        'file-path'                : '/src/%s.cc' % tag,
+        'function'                 : tag,
+        'file-line'                : str(random.randint(1, 1000)),
+        'cumul-time-sum'           : str(duration * 4),
+        'cumul-time-min'           : str(duration * 0.9),
+        'cumul-time-max'           : str(duration * 1.1),
+        'call-count-sum'           : str(random.randint(1, 100)),
+        'memory-alloc-called-sum'  : '10',
+        'memory-dealloc-called-sum': '10',
+        'memory-alloc-sum'         : '1024',
+        'memory-dealloc-sum'       : '1024',
+    }
+    if depth > 0:
+        timer['children'] = [
+            generate_timer('%sChild%d' % (tag, i), depth - 1, width)
+            for i in range(width)
+        ]
+    return timer
+
+
+def generate_files(root, files, depth, width):
+    result = list()
+    for i in range(files):
+        path = os.path.join(root, 'profiler_info_%05d.log.json' % i)
+        with open(path, 'w') as fp:
+            json.dump({
+                'program-version'  : '3.0.0',
+                'task-size'        : '1000',
+                'run-process-count': '4',
+                'children'         : [generate_timer('WholeProgram', depth, width)],
+            }, fp)
+        result.append(path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=500)
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--width', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    logger.remove()
+
+    root = tempfile.mkdtemp()
+    try:
+        files = generate_files(root, args.files, args.depth, args.width)
+        stage = ProjectStage(dict(
+            name='bench',
+            collect=dict(module=MODULE, files=root, processes=args.processes),
+        ))
+        instance = load_collect_module(Project(), stage)
+
+        start = time.time()
+        results, _, serial_total = process_reports(instance, files, convert_method('json'), is_file=True)
+        serial = time.time() - start
+
+        start = time.time()
+        parallel_total = sum(total for _, _, total in process_files_parallel(Project(), stage, files))
+        parallel = time.time() - start
+
+        assert serial_total == parallel_total
+
+        print('files: %d, documents: %d' % (len(files), serial_total))
+        print('serial:   %8.1f files/sec (%1.2f sec)' % (len(files) / serial, serial))
+        print('parallel: %8.1f files/sec (%1.2f sec, %d processes)' % (len(files) / parallel, parallel, args.processes))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/bin/python3
+# author: Jan Hybs
+"""
+Benchmark of the report extraction from a synthetic solver log,
+the log is read in chunks as it would be read from the pipe
+
+usage: PYTHONPATH=src:. python tests/bench_collect_parse.py [--size 1024] [--report 16] [--ranks 0] [--legacy]
+
+--size   size of the log in MB
+--report size of each report in KB, reports are separated by ~50 KB of solver output
+--ranks  number of interleaved ranks with mpirun --tag-output prefixes
+--legacy also measure reading the whole log and scanning it with str.find
+"""
+
+import tests
+
+
+tests.fix_paths()
+
+import argparse
+import json
+import os
+import resource
+import tempfile
+import time
+
+from loguru import logger
+
+from cihpc.core.processing.step_collect_parse import create_extractor, extract_reports
+from cihpc.core.structures.project_step_collect_parse import ProjectStepContainerParse
+
+
+MB = 1024 * 1024
+START, STOP = '<report>', '</report>'
+
+
+def generate_log(path, size, report_size, ranks):
+    noise = ''.join('iteration %6d residual 1.234567e-08 time 0.001234\n' % i for i in range(1000))
+    report = json.dumps(dict(timers=['x' * 64] * max(report_size * 1024 // 68, 1)))
+    reports = 0
+
+    with open(path, 'w') as fp:
+        written = 0
+        while written < size * MB:
+            block = noise + START + report + STOP + '\n' + noise[:MB - len(noise) - len(report)]
+            if ranks:
+                block = ''.join(
+                    '[1,%d]<stdout>:%s\n' % (i % ranks, line)
+                    for i, line in enumerate(block.splitlines())
+                )
+            fp.write(block)
+            written += len(block)
+            reports += 1
+    return reports
+
+
+def read_chunks(path, chunk_size=64 * 1024):
+    with open(path, 'r') as fp:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def legacy(path):
+    with open(path, 'r') as fp:
+        output = fp.read()
+
+    index, reports = 0, list()
+    while True:
+        s = output.find(START, index)
+        if s == -1:
+            break
+        e = output.find(STOP, s + 1)
+        if e == -1:
+            break
+        index = e + len(STOP) + 1
+        reports.append(output[s + len(START):e].strip())
+    return reports
+
+
+def maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--report', type=int, default=16)
+    parser.add_argument('--ranks', type=int, default=0)
+    parser.add_argument('--legacy', action='store_true')
+    args = parser.parse_args()
+    logger.remove()
+
+    fd, path = tempfile.mkstemp(suffix='.log')
+    os.close(fd)
+    try:
+        expected = generate_log(path, args.size, args.report, args.ranks)
+        size = os.path.getsize(path) / MB
+        print('log: %1.0f MB, %d reports, ranks: %d' % (size, expected, args.ranks))
+
+        parse = ProjectStepContainerParse(start=START, stop=STOP, prefix=bool(args.ranks))
+
+        rss = maxrss()
+        start = time.time()
+        reports = sum(1 for _ in extract_reports(read_chunks(path), create_extractor(parse)))
+        duration = time.time() - start
+        print('streaming: %8.1f MB/s (%1.2f sec, %d reports, max rss +%1.0f MB)'
+              % (size / duration, duration, reports, maxrss() - rss))
+
+        if args.legacy and not args.ranks:
+            rss = maxrss()
+            start = time.time()
+            reports = len(legacy(path))
+            duration = time.time() - start
+            print('legacy:    %8.1f MB/s (%1.2f sec, %d reports, max rss +%1.0f MB)'
+                  % (size / duration, duration, reports, maxrss() - rss))
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/bin/python3
+# author: Jan Hybs
+"""
+Benchmark of the configuration lookups and of the creation
+of the workers for a stage with a large configuration matrix
+
+usage: PYTHONPATH=src:. python tests/bench_stage_create.py [--size 10] [--lookups 10000]
+"""
+
+import tests
+
+
+tests.fix_paths()
+
+import argparse
+import copy
+import os
+import tempfile
+import time
+
+import yaml
+from loguru import logger
+
+from cihpc.cfg.cfgutil import Config, thaw
+from cihpc.core.processing.stage import ProcessStage
+from cihpc.core.structures.project import Project
+
+
+def measure(name, func, repeat=1):
+    start = time.time()
+    for i in range(repeat):
+        func()
+    duration = time.time() - start
+    print('%-32s %10.1f us/call (%1.3f sec total)' % (name, duration / repeat * 1e6, duration))
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=10, help='size of each of the 3 matrix dimensions')
+    parser.add_argument('--lookups', type=int, default=10000)
+    args = parser.parse_args()
+    logger.remove()
+
+    fd, secret = tempfile.mkstemp(suffix='.yaml')
+    with os.fdopen(fd, 'w') as fp:
+        yaml.dump({
+            'project-%d' % i: dict(
+                database=dict(host='localhost', port=27017, username='user', password='password'),
+                artifacts=dict(db_name='db', col_timers_name='timers', col_files_name='files'),
+                options=dict(values=list(range(100))),
+            ) for i in range(100)
+        }, fp)
+
+    try:
+        Config.init(secret)
+        measure('Config.get(project.database)', lambda: Config.get('project-50.database'), args.lookups)
+        legacy = thaw(Config._cfg)
+        measure('deepcopy of the config (before)', lambda: copy.deepcopy(legacy), args.lookups // 100)
+    finally:
+        os.unlink(secret)
+
+    size = args.size
+    project = Project('bench', dict(arg=dict(branch='master', commit='')), stages=[dict(
+        name='test',
+        shell='echo <a> <b> <c>',
+        variables=[dict(matrix=[
+            dict(a=list(range(size))),
+            dict(b=list(range(size))),
+            dict(c=list(range(size))),
+        ])],
+    )])
+    stage = project.stages[0]
+
+    measure('project.global_args', lambda: project.global_args, args.lookups)
+    measure('deepcopy of the args (before)', lambda: copy.deepcopy(project._global_args), args.lookups)
+
+    workers = list()
+    measure('ProcessStage.create (%d conf.)' % size ** 3,
+            lambda: workers.extend(ProcessStage.create(project, stage)))
+    assert len(workers) == size ** 3
+
+
+if __name__ == '__main__':
+    main()
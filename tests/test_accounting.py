@@ -0,0 +1,60 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import subprocess
+import sys
+import time
+from unittest import TestCase
+
+from cihpc.common.processing.accounting import CgroupScope, wait_with_usage
+from cihpc.core.processing.step_shell import ProcessStepResult
+
+
+SCRIPT = '''
+import time
+data = bytearray(64 * 1024 * 1024)
+for i in range(0, len(data), 4096):
+    data[i] = 1
+start = time.time()
+while time.time() - start < 0.2:
+    pass
+time.sleep(0.1)
+'''
+
+
+class TestAccounting(TestCase):
+
+    def run_process(self, args):
+        with CgroupScope() as cgroup:
+            start = time.perf_counter()
+            process = subprocess.Popen(args)
+            cgroup.attach(process.pid)
+            with process:
+                return process, wait_with_usage(process, start, cgroup)
+
+    def test_usage(self):
+        process, (returncode, usage) = self.run_process([sys.executable, '-c', SCRIPT])
+        self.assertEqual(returncode, 0)
+        self.assertEqual(process.returncode, 0)
+
+        self.assertGreaterEqual(usage.max_rss, 64 * 1024 * 1024)
+        self.assertGreaterEqual(usage.wall_time, 0.3)
+        self.assertGreater(usage.cpu_time, 0.1)
+        self.assertGreater(usage.voluntary_switches + usage.involuntary_switches, 0)
+
+        result = ProcessStepResult()
+        result.resources = usage
+        self.assertEqual(result.to_json()['resources']['max_rss'], usage.max_rss)
+
+    def test_returncode(self):
+        _, (returncode, usage) = self.run_process([sys.executable, '-c', 'exit(3)'])
+        self.assertEqual(returncode, 3)
+
+        _, (returncode, usage) = self.run_process([sys.executable, '-c', 'import os; os.kill(os.getpid(), 9)'])
+        self.assertEqual(returncode, -9)
+        self.assertIsNotNone(usage.cpu_time)
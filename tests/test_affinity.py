@@ -0,0 +1,91 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import os
+import subprocess
+import sys
+import threading
+import time
+from unittest import TestCase
+
+from cihpc.common.processing.affinity import (
+    CoreAllocator, available_cores, format_cpulist, numa_topology, parse_cpulist, pinned,
+)
+from cihpc.common.processing.pool import Worker, WorkerPool
+
+
+class TestAffinity(TestCase):
+
+    def test_cpulist(self):
+        self.assertListEqual(parse_cpulist('0-3,8,10-11\n'), [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(format_cpulist([11, 0, 1, 2, 3, 8, 10]), '0-3,8,10-11')
+        self.assertEqual(format_cpulist([]), '')
+
+    def test_topology(self):
+        topology = numa_topology()
+        self.assertListEqual(sorted(c for cores in topology.values() for c in cores), available_cores())
+
+    def test_allocator(self):
+        cores = CoreAllocator(8, {0: [0, 1, 2, 3], 1: [4, 5, 6, 7]})
+        a = cores.acquire(2)
+        self.assertListEqual(a, [0, 1])
+        self.assertListEqual(a.nodes, [0])
+
+        # the node with the least free cores which fits the job is used
+        b = cores.acquire(2)
+        self.assertListEqual(b, [2, 3])
+        c = cores.acquire(3)
+        self.assertListEqual(c, [4, 5, 6])
+
+        cores.release(a)
+        d = cores.acquire(3)
+        self.assertListEqual(d, [0, 1, 7])
+        self.assertListEqual(d.nodes, [0, 1])
+        self.assertIsNone(cores.acquire(1))
+
+        for coreset in (b, c, d):
+            cores.release(coreset)
+        self.assertEqual(cores.free, 8)
+
+        # only the cores of the biggest node are used
+        self.assertListEqual(CoreAllocator(3, {0: [0, 1], 1: [2, 3, 4, 5]}).acquire(3), [2, 3, 4])
+
+        # sets could not be disjoint
+        self.assertIsNone(CoreAllocator(16, {0: [0, 1, 2, 3]}).acquire(1))
+
+    def test_pinned(self):
+        core = available_cores()[-1]
+        with pinned([core]):
+            output = subprocess.check_output([
+                sys.executable, '-c', 'import os; print(sorted(os.sched_getaffinity(0)))'
+            ])
+            self.assertSetEqual(os.sched_getaffinity(0), {core})
+        self.assertEqual(output.decode().strip(), str([core]))
+        self.assertListEqual(sorted(os.sched_getaffinity(0)), available_cores())
+
+    def test_pool(self):
+        lock = threading.Lock()
+        used, overlaps = list(), list()
+
+        def func(worker):
+            with lock:
+                overlaps.extend(set(worker.cpuset) & set(c for s in used for c in s))
+                used.append(worker.cpuset)
+            time.sleep(0.01)
+            with lock:
+                used.remove(worker.cpuset)
+            return list(worker.cpuset)
+
+        processes = len(available_cores())
+        threads = [Worker(crate=None, target=func, cpus=1) for _ in range(processes * 3)]
+        pool = WorkerPool(cpu_count=processes, threads=threads, pin=True)
+        pool.start()
+
+        self.assertListEqual(overlaps, [])
+        self.assertTrue(all(len(x) == 1 for x in pool.result))
+        self.assertEqual(pool.cores.free, processes)
@@ -0,0 +1,87 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+from unittest import TestCase
+from cihpc.scheduler.bisect import Bisection, commit_ratios
+
+
+def report(commit, mesh, duration, **result):
+    return dict(git=dict(commit=commit), index=dict(mesh=mesh, run_id=duration),
+                result=dict(duration=duration, **result), timers=[dict(name='assembly', duration=1.0)])
+
+
+class TestBisection(TestCase):
+
+    def simulate(self, commits, first_slow, known=()):
+        bisection = Bisection(commits, threshold=0.05)
+        ratio = lambda c: 1.5 if commits.index(c) >= first_slow else 1.0
+
+        bisection.update({c: ratio(c) for c in [commits[0], commits[-1]] + list(known)})
+        self.assertTrue(bisection.is_regression())
+
+        tested = list()
+        while True:
+            commit = bisection.next()
+            if commit is None:
+                break
+            tested.append(commit)
+            bisection.update({commit: ratio(commit)})
+        return bisection.culprit, tested
+
+    def test_converges(self):
+        commits = ['c%02d' % i for i in range(33)]
+        for first_slow in [1, 7, 16, 32]:
+            culprit, tested = self.simulate(commits, first_slow)
+            self.assertEqual(culprit, commits[first_slow])
+            # log2(32) builds
+            self.assertLessEqual(len(tested), 5)
+
+    def test_existing_results(self):
+        commits = ['c%02d' % i for i in range(33)]
+        # the known results narrow the range to c10..c14
+        culprit, tested = self.simulate(commits, 12, known=['c10', 'c14', 'c20'])
+        self.assertEqual(culprit, 'c12')
+        self.assertLessEqual(len(tested), 2)
+        self.assertTrue(all('c10' < c < 'c14' for c in tested))
+
+    def test_skip(self):
+        commits = ['a', 'b', 'c', 'd']
+        bisection = Bisection(commits)
+        bisection.update(dict(a=1.0, d=2.0))
+        self.assertEqual(bisection.next(), 'b')
+        bisection.skip('b')
+        self.assertEqual(bisection.next(), 'c')
+        bisection.update(dict(c=1.0))
+        self.assertIsNone(bisection.next())
+        self.assertEqual(bisection.culprit, 'd')
+
+    def test_no_regression(self):
+        bisection = Bisection(['a', 'b', 'c'], threshold=0.1)
+        bisection.update(dict(a=1.0, c=1.05))
+        self.assertFalse(bisection.is_regression())
+
+
+class TestCommitRatios(TestCase):
+
+    def test_ratios(self):
+        documents = [
+            report('good', 1, 1.0), report('good', 1, 1.2), report('good', 1, 1.1),
+            report('good', 2, 10.0),
+            report('bad', 1, 1.21), report('bad', 1, 1.32),
+            report('bad', 2, 12.1), report('bad', 2, 100.0, **{'warm-up': True}),
+            # measured on an index the good commit does not have
+            report('other', 3, 5.0),
+        ]
+        ratios = commit_ratios(tests.Connection(documents), 'good', ['good', 'bad', 'other', 'missing'])
+        self.assertSetEqual(set(ratios), {'good', 'bad'})
+        self.assertAlmostEqual(ratios['good'], 1.0)
+        # medians 1.1 -> 1.265 and 10 -> 12.1
+        self.assertAlmostEqual(ratios['bad'], (1.265 / 1.1 * 1.21) ** 0.5)
+
+        ratios = commit_ratios(tests.Connection(documents), 'good', ['bad'], frame='assembly')
+        self.assertAlmostEqual(ratios['bad'], 1.0)
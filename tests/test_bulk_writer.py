@@ -0,0 +1,104 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+from unittest import TestCase
+from cihpc.artifacts.base import CollectResult, LogPolicy
+from cihpc.core.db.bulk_writer import BulkWriter
+
+
+class InsertManyResult(object):
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+
+class Collection(object):
+    def __init__(self):
+        self.calls = list()
+        self.documents = list()
+
+    def insert_many(self, documents, ordered=True):
+        self.calls.append((len(documents), ordered))
+        start = len(self.documents)
+        self.documents.extend(documents)
+        return InsertManyResult(list(range(start, start + len(documents))))
+
+
+class Connection(object):
+    def __init__(self):
+        self.reports = Collection()
+        self.files = Collection()
+
+
+def collect_result(items, logs=0):
+    result = CollectResult([dict(result=dict(duration=i)) for i in range(items)], log_policy=LogPolicy.NEVER)
+    result.logs = [dict(filename='log-%d' % i, data=b'log') for i in range(logs)]
+    return result
+
+
+class TestBulkWriter(TestCase):
+
+    def test_batches(self):
+        connection = Connection()
+        writer = BulkWriter(connection, batch_docs=10, rollup=False)
+
+        writer.add([collect_result(4), collect_result(4)])
+        self.assertEqual(len(connection.reports.calls), 0)
+
+        # limit reached, 12 documents are flushed in 2 batches
+        writer.add([collect_result(4), collect_result(0)])
+        self.assertListEqual(connection.reports.calls, [(10, False), (2, False)])
+
+        writer.add([collect_result(3)])
+        writer.flush()
+        writer.flush()
+        self.assertEqual(writer.documents, 15)
+        self.assertEqual(writer.batches, 3)
+        self.assertEqual(len(connection.reports.documents), 15)
+
+    def test_batch_bytes(self):
+        connection = Connection()
+        writer = BulkWriter(connection, batch_docs=1000, batch_bytes=1, rollup=False)
+
+        writer.add([collect_result(1)])
+        self.assertEqual(writer.documents, 1)
+        self.assertGreater(writer.bytes, 0)
+
+    def test_logs(self):
+        connection = Connection()
+        writer = BulkWriter(connection, rollup=False)
+        results = [collect_result(2, logs=2), collect_result(1), collect_result(1, logs=1)]
+        writer.add(results)
+        writer.flush()
+
+        # all the logs are inserted at once
+        self.assertListEqual(connection.files.calls, [(3, False)])
+        self.assertListEqual([x['data'] for x in results[0].items[0]['logs']], [0, 1])
+        self.assertNotIn('logs', results[1].items[0])
+        self.assertListEqual([x['data'] for x in results[2].items[0]['logs']], [2])
+
+    def test_detector(self):
+        class Detector(object):
+            calls = list()
+
+            def update(self, commits):
+                self.calls.append(commits)
+
+        connection = Connection()
+        writer = BulkWriter(connection, batch_docs=2, rollup=False, detector=Detector())
+        results = [collect_result(2), collect_result(1)]
+        for result, commit in zip(results, ['a', 'b']):
+            for item in result.items:
+                item['git'] = dict(commit=commit)
+
+        # the commits are tested once the owner flushes the writer
+        writer.add(results[:1])
+        self.assertListEqual(Detector.calls, [])
+        writer.add(results[1:])
+        writer.flush()
+        writer.flush()
+        self.assertListEqual(Detector.calls, [['a', 'b']])
@@ -0,0 +1,115 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import TestCase
+
+from cihpc.common.logging import LogConfig
+from cihpc.common.utils.files.dynamic_io import DynamicIO, OpenerBoth, RingBuffer
+from cihpc.core.processing.step_collect_parse import (
+    InterleavedReportExtractor, ReportExtractor, create_extractor, extract_reports,
+)
+from cihpc.core.structures.project_step_collect_parse import ProjectStepContainerParse
+
+
+OUTPUT = 'noise\n@@\n{"a": 1}\n@@\nmore noise @\n@@{"b": 2}@@ @@ {"c": 3} @@ tail @@ {"d"'
+
+
+class TestReportExtractor(TestCase):
+
+    def test_chunks(self):
+        expected = ['{"a": 1}', '{"b": 2}', '{"c": 3}']
+        self.assertListEqual(ReportExtractor('@@').feed(OUTPUT), expected)
+
+        # the result does not depend on how the output is split
+        for size in range(1, 12):
+            extractor = ReportExtractor('@@')
+            reports = list()
+            for i in range(0, len(OUTPUT), size):
+                reports.extend(extractor.feed(OUTPUT[i:i + size]))
+            self.assertListEqual(reports, expected, 'chunk size %d' % size)
+            self.assertListEqual(extractor.close(), [])
+
+    def test_markers(self):
+        parse = ProjectStepContainerParse(start='<report>', stop='</report>')
+        self.assertEqual(parse.stop, '</report>')
+        self.assertEqual(ProjectStepContainerParse(start='@@').stop, '@@')
+
+        output = 'a <report>1</report> b <report>2<report>3</report>4</report> c </report> <report>5'
+        expected = ['1', '3', '24']
+        for size in (1, 3, 7, len(output)):
+            chunks = [output[i:i + size] for i in range(0, len(output), size)]
+            self.assertListEqual(list(extract_reports(chunks, create_extractor(parse))), expected)
+
+    def test_max_size(self):
+        extractor = ReportExtractor('<r>', '</r>', max_size=5)
+        reports = extractor.feed('<r>12345</r><r>1234')
+        reports += extractor.feed('56</r><r>1</r>')
+        self.assertListEqual(reports, ['12345', '1'])
+        self.assertEqual(extractor.discarded, 1)
+
+    def test_interleaved(self):
+        output = (
+            '[1,0]<stdout>:<r>{"rank": \n'
+            '[1,1]<stdout>:<r>{"rank": \n'
+            'plain line\n'
+            '[1,1]<stdout>:1}</r>\n'
+            '[1,0]<stdout>:0}</r>\n'
+            '  2: <r>{"rank": 2}</r>'
+        )
+        extractor = create_extractor(ProjectStepContainerParse(start='<r>', stop='</r>', prefix=True))
+        self.assertIsInstance(extractor, InterleavedReportExtractor)
+
+        reports = list(extract_reports([output[i:i + 5] for i in range(0, len(output), 5)], extractor))
+        self.assertListEqual(reports, ['{"rank": \n1}', '{"rank": \n0}', '{"rank": 2}'])
+        self.assertEqual(extractor.reports, 3)
+
+
+class TestStreamingOutput(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.log_path = LogConfig.log_path
+        LogConfig.log_path = os.path.join(self.root, 'log.txt')
+
+    def tearDown(self):
+        LogConfig.log_path = self.log_path
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_ring_buffer(self):
+        buffer = RingBuffer(10)
+        for i in range(5):
+            buffer.write(b'%d' % i * 4)
+        self.assertEqual(buffer.getvalue(), b'2233334444')
+        self.assertEqual(buffer.total, 20)
+        self.assertTrue(buffer.truncated)
+
+    def test_capture(self):
+        chunks = list()
+        io = DynamicIO('log+stdout')
+        self.assertTrue(io.listen(chunks.append))
+        self.assertFalse(DynamicIO('null').listen(chunks.append))
+
+        buffer_size = OpenerBoth.buffer_size
+        OpenerBoth.buffer_size = 1000
+        try:
+            with io as fp:
+                fp.write('header\n')
+                fp.flush()
+                subprocess.check_call(['python3', '-c', 'print("x" * 4999)'], stdout=fp)
+        finally:
+            OpenerBoth.buffer_size = buffer_size
+
+        # whole output is teed to the log, only the end is kept in memory
+        with open(LogConfig.log_path) as fp:
+            self.assertEqual(fp.read(), 'header\n' + 'x' * 4999 + '\n')
+        self.assertEqual(io.opener.output, 'x' * 999 + '\n')
+        self.assertEqual(''.join(chunks), 'header\n' + 'x' * 4999 + '\n')
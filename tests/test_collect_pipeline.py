@@ -0,0 +1,118 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+from cihpc.core.processing.collect_pipeline import CollectPipeline
+from cihpc.core.processing.step_collect import process_files_parallel
+from cihpc.core.structures.project_stage import ProjectStage
+
+
+class Project(object):
+    name = 'test-collect-pipeline'
+    workdir = '.'
+    report_git = dict()
+
+
+class Worker(object):
+    def __init__(self, variables):
+        self.variables = variables
+        self.collect_result = None
+
+
+class TestCollectPipeline(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write_report(self, name, timers):
+        with open(os.path.join(self.root, 'results', name), 'w') as fp:
+            json.dump(dict(result=dict(duration=1.0), timers=[dict(name='t', duration=1.0)] * timers), fp)
+
+    def test_background_collect(self):
+        os.makedirs(os.path.join(self.root, 'results', 'bench'))
+        stage = ProjectStage(dict(
+            name='test',
+            collect=dict(
+                files=os.path.join(self.root, 'results', '<name>-*.json'),
+                background=True,
+                workers=2,
+                **{'save-to-db': False, 'poll-interval': 0.01, 'move-to': os.path.join(self.root, 'done')}
+            ),
+        ))
+        pipeline = CollectPipeline(Project(), stage)
+        worker = Worker(dict(name='bench'))
+
+        watcher = pipeline.watch(worker)
+        self.write_report('bench-1.json', 2)
+
+        # the file is picked up while the "process" is still running
+        for i in range(100):
+            if watcher.files:
+                break
+            time.sleep(0.01)
+        self.assertListEqual([os.path.basename(x) for x in watcher.files], ['bench-1.json'])
+
+        self.write_report('bench-2.json', 3)
+        pipeline.submit(worker, None, watcher)
+        pipeline.close()
+
+        self.assertEqual(sum(worker.collect_result.total), 2)
+        self.assertEqual(pipeline.documents, 2)
+        self.assertIsNone(pipeline.writer)
+        self.assertListEqual(sorted(os.listdir(os.path.join(self.root, 'done'))), ['bench-1.json', 'bench-2.json'])
+
+    def test_process_files_parallel(self):
+        os.makedirs(os.path.join(self.root, 'results'))
+        for i in range(4):
+            self.write_report('bench-%d.json' % i, 1)
+
+        stage = ProjectStage(dict(
+            name='test',
+            collect=dict(files=os.path.join(self.root, 'results', '*.json'), processes=2),
+        ))
+        files = [os.path.join(self.root, 'results', 'bench-%d.json' % i) for i in range(4)]
+        results = list(process_files_parallel(Project(), stage, files))
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(sum(total for _, _, total in results), 4)
+        for file_results, _, _ in results:
+            self.assertIs(type(file_results[0].items[0]), dict)
+
+    def test_stream_collect(self):
+        stage = ProjectStage(dict(
+            name='test',
+            collect=dict(parse=dict(start='@@'), **{'save-to-db': False}),
+        ))
+        pipeline = CollectPipeline(Project(), stage)
+        worker = Worker(dict())
+        stream = pipeline.stream(worker)
+        stream.attached = True
+
+        report = json.dumps(dict(result=dict(duration=1.0), timers=[dict(name='t', duration=1.0)]))
+        stream.feed('noise @@ %s @' % report)
+        stream.feed('@ noise @@ %s' % report)
+
+        # the first report is processed before the output ends
+        self.assertEqual(len(stream.futures), 1)
+        stream.futures[0].result()
+        self.assertEqual(pipeline.documents, 1)
+
+        stream.feed(' @@')
+        pipeline.submit(worker, None, None, stream)
+        pipeline.close()
+
+        self.assertEqual(sum(worker.collect_result.total), 2)
+        self.assertEqual(pipeline.documents, 2)
@@ -105,3 +105,35 @@ class TestConfig(TestCase):
             cfgutil.configure_string('foobar.bar.foo is <foobar.bar.foo> and I am <$.USER>', kwargs),
             'foobar.bar.foo is foo.bar and I am %s' % os.environ.get('USER')
         )
+
+    def test_frozen_config(self):
+        import copy
+        import pickle
+        from cihpc.cfg import cfgutil
+
+        cfg = cfgutil.freeze(dict(foo=dict(bar=[1, 2, dict(baz=3)])))
+        self.assertIsInstance(cfg, cfgutil.FrozenDict)
+        self.assertEqual(cfg['foo']['bar'][2], dict(baz=3))
+        self.assertIs(copy.deepcopy(cfg), cfg)
+        self.assertEqual(pickle.loads(pickle.dumps(cfg)), cfg)
+
+        with self.assertRaises(TypeError):
+            cfg['foo']['bar'] = 1
+        with self.assertRaises(TypeError):
+            cfg.update(foo=1)
+
+        thawed = cfgutil.thaw(cfg)
+        thawed['foo']['bar'][2]['baz'] = 4
+        self.assertEqual(thawed, dict(foo=dict(bar=[1, 2, dict(baz=4)])))
+        self.assertEqual(cfg['foo']['bar'][2]['baz'], 3)
+
+    def test_global_args_shared(self):
+        from cihpc.core.structures.project import Project
+
+        project = Project('foobar', dict(arg=dict(branch='master')))
+        a, b = project.global_args, project.global_args
+        a['foo'] = 'foo'
+        self.assertNotIn('foo', b)
+        self.assertIs(a['arg'], b['arg'])
+        self.assertIs(a['__project__']['counter'], b['__project__']['counter'])
+        self.assertIsNot(a['__project__']['current'], b['__project__']['current'])
@@ -21,6 +21,8 @@ class TestArtifacts_default_configuration(TestCase):
                 col_files_name='files',
                 col_history_name='hist',
                 col_running_name='running',
+                col_rollup_name='rollup',
+                col_regressions_name='regressions',
             )
         )
         self.assertEqual(
@@ -31,5 +33,7 @@ class TestArtifacts_default_configuration(TestCase):
                 col_files_name='files',
                 col_history_name='hist',
                 col_running_name='running',
+                col_rollup_name='rollup',
+                col_regressions_name='regressions',
             )
         )
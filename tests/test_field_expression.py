@@ -0,0 +1,66 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import numpy as np
+import pandas as pd
+from unittest import TestCase
+from cihpc.www.cfg.project_config import FieldExpression, ProjectConfigFields
+
+
+class TestFieldExpression(TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'result.duration': [1.0, 2.0, 4.0],
+            'problem.cpus'   : [1, 2, 4],
+            'problem.test'   : ['a', 'b', 'c'],
+        })
+
+    def test_compile(self):
+        self.assertIsNotNone(FieldExpression._compile('row["result.duration"] * row["problem.cpus"]'))
+        self.assertIsNotNone(FieldExpression._compile('-abs(row["result.duration"]) / 2 + 1'))
+        self.assertIsNotNone(FieldExpression._compile('round(row["result.duration"], 2)'))
+
+        self.assertIsNone(FieldExpression._compile('row.get("result.duration")'))
+        self.assertIsNone(FieldExpression._compile('row["result.duration"] if True else 0'))
+        self.assertIsNone(FieldExpression._compile('str(row["problem.cpus"])'))
+        self.assertIsNone(FieldExpression._compile('row[0]'))
+        self.assertIsNone(FieldExpression._compile('__import__("os")'))
+
+    def test_evaluate(self):
+        expressions = {
+            'plain'   : 'result.duration',
+            'compiled': '=row["result.duration"] * row["problem.cpus"] - 1',
+            'rowwise' : '=row["problem.test"].upper() if row["problem.cpus"] > 1 else "-"',
+            'failing' : '=row["problem.test"] * 0.5',
+        }
+        field = FieldExpression(expressions, 'plain')
+        self.assertListEqual(list(field.evaluate(self.df)), [1.0, 2.0, 4.0])
+
+        field = FieldExpression(expressions, 'compiled')
+        self.assertIsNotNone(field.vector_func)
+        self.assertListEqual(list(field.evaluate(self.df)), list(self.df.apply(field.func, axis=1)))
+
+        field = FieldExpression(expressions, 'rowwise')
+        self.assertIsNone(field.vector_func)
+        self.assertListEqual(list(field.evaluate(self.df)), ['-', 'B', 'C'])
+
+        # compiled but fails column-wise, falls back and fails row-wise too
+        field = FieldExpression(expressions, 'failing')
+        self.assertIsNotNone(field.vector_func)
+        with self.assertRaises(TypeError):
+            field.evaluate(self.df)
+
+    def test_apply_to_df(self):
+        fields = ProjectConfigFields({
+            'result.duration': 'result.duration',
+            'problem.cpu'    : 'problem.cpus',
+            'problem.per.cpu': '=row["result.duration"] / row["problem.cpu"]',
+        })
+        fields.apply_to_df(self.df)
+        self.assertTrue(np.allclose(self.df['problem.per.cpu'], [1.0, 1.0, 1.0]))
@@ -7,13 +7,18 @@ import tests
 tests.fix_paths()
 
 import os
+import tempfile
 from os.path import join, abspath
+from types import SimpleNamespace
 
 from unittest import TestCase
 
 from cihpc.common.utils.files import StdoutType
 from cihpc.common.utils.git import Git
+from cihpc.core.structures.project_git import GitSpec
 from cihpc.core.structures.project_step_git import ProjectStepGit
+from cihpc.scheduler import ProjectScheduler
+from git import Repo
 
 
 class TestGit(TestCase):
@@ -54,3 +59,76 @@ class TestGit(TestCase):
             # depends on version of the git available on machine
         except TypeError:
             pass
+
+    def test_git_spec_root(self):
+        spec = GitSpec(url='https://github.com/janhybs/ci-hpc.git', root='/tmp/workdir')
+        self.assertEqual(spec.dir, '/tmp/workdir/ci-hpc')
+
+        spec = GitSpec(url='https://github.com/janhybs/ci-hpc.git')
+        self.assertEqual(spec.dir, abspath(join(os.getcwd(), 'ci-hpc')))
+
+    def test_worktree(self):
+        with tempfile.TemporaryDirectory() as root:
+            repo = Repo.init(join(root, 'repo'))
+            repo.git.config('user.email', 'test@example.com')
+            repo.git.config('user.name', 'test')
+            commits = list()
+            for i in range(2):
+                with open(join(root, 'repo', 'file.txt'), 'w') as fp:
+                    fp.write(str(i))
+                repo.git.add('file.txt')
+                repo.git.commit('-m', 'commit %d' % i)
+                commits.append(repo.head.commit.hexsha)
+
+            spec = GitSpec(url='repo.git', root=root)
+            spec.repo = Repo(spec.dir)
+
+            # both commits checked out at the same time
+            trees = [spec.worktree(join(root, 'worktrees', c[:12], 'repo'), c) for c in commits]
+            for tree, commit, i in zip(trees, commits, range(2)):
+                self.assertEqual(tree.head.commit.hexsha, commit)
+                with open(join(tree.working_tree_dir, 'file.txt')) as fp:
+                    self.assertEqual(fp.read(), str(i))
+
+            # existing worktree is reused
+            tree = spec.worktree(join(root, 'worktrees', commits[0][:12], 'repo'), commits[1])
+            self.assertEqual(tree.head.commit.hexsha, commits[1])
+            self.assertEqual(spec.repo.head.commit.hexsha, commits[1])
+
+    def test_remove_worktree(self):
+        with tempfile.TemporaryDirectory() as root:
+            repo = Repo.init(join(root, 'repo'))
+            repo.git.config('user.email', 'test@example.com')
+            repo.git.config('user.name', 'test')
+            with open(join(root, 'repo', 'file.txt'), 'w') as fp:
+                fp.write('0')
+            repo.git.add('file.txt')
+            repo.git.commit('-m', 'commit 0')
+            commit = repo.head.commit.hexsha
+
+            spec = GitSpec(url='repo.git', root=root)
+            spec.repo = Repo(spec.dir)
+            project = ProjectStub(join(root, 'worktrees', commit[:12]))
+            spec.worktree(project.git.main_repo.dir, commit)
+
+            # build files in the workdir and in the worktree
+            with open(join(project.workdir, 'build.log'), 'w') as fp:
+                fp.write('build')
+            with open(join(project.git.main_repo.dir, 'file.txt'), 'w') as fp:
+                fp.write('changed')
+
+            scheduler = object.__new__(ProjectScheduler)
+            scheduler.browser = SimpleNamespace(git=spec)
+            scheduler.remove_commit_project(project)
+
+            self.assertFalse(os.path.exists(project.workdir))
+            self.assertEqual(repo.git.worktree('list', '--porcelain').count('worktree '), 1)
+
+            # removing the worktree again does not fail
+            scheduler.remove_commit_project(project)
+
+
+class ProjectStub(object):
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.git = SimpleNamespace(main_repo=SimpleNamespace(dir=join(workdir, 'repo')))
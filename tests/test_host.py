@@ -0,0 +1,117 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from cihpc.common.utils.host import HostInfoCache, cpu_info, cpu_turbo, host_fingerprint, os_release
+
+
+CPUINFO = '''processor\t: 0
+physical id\t: 0
+core id\t\t: 0
+model name\t: Foo CPU @ 2.00GHz
+
+processor\t: 1
+physical id\t: 0
+core id\t\t: 0
+model name\t: Foo CPU @ 2.00GHz
+
+processor\t: 2
+physical id\t: 1
+core id\t\t: 0
+model name\t: Foo CPU @ 2.00GHz
+
+processor\t: 3
+physical id\t: 1
+core id\t\t: 1
+model name\t: Foo CPU @ 2.00GHz
+'''
+
+
+class TestHost(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fp:
+            fp.write(content)
+        return path
+
+    def test_os_release(self):
+        path = self.write('os-release', 'NAME="Debian GNU/Linux"\nVERSION="12 (bookworm)"\n# comment\nID=debian\n')
+        self.assertDictEqual(os_release([os.path.join(self.root, 'missing'), path]), {
+            'NAME': 'Debian GNU/Linux',
+            'VERSION': '12 (bookworm)',
+            'ID': 'debian',
+        })
+        self.assertDictEqual(os_release([os.path.join(self.root, 'missing')]), dict())
+
+    def test_cpu_info(self):
+        info = cpu_info(self.write('cpuinfo', CPUINFO))
+        self.assertDictEqual(info, dict(cpu_model='Foo CPU @ 2.00GHz', cpu_count=4, cpu_cores=3, cpu_sockets=2))
+
+    def test_cpu_turbo(self):
+        self.assertIsNone(cpu_turbo(self.root))
+        self.write('cpufreq/boost', '1\n')
+        self.assertTrue(cpu_turbo(self.root))
+        self.write('intel_pstate/no_turbo', '1\n')
+        self.assertFalse(cpu_turbo(self.root))
+
+    def test_host_fingerprint(self):
+        info = host_fingerprint()
+        for key in ('name', 'hostname', 'os_name', 'os_version', 'username', 'kernel', 'cpu_count', 'fingerprint'):
+            self.assertIn(key, info)
+        self.assertEqual(info['fingerprint'], host_fingerprint()['fingerprint'])
+
+    def test_cache(self):
+        calls = list()
+
+        def provider():
+            calls.append(1)
+            return dict(value=len(calls))
+
+        boot_id = self.write('boot_id', 'first')
+        cache = HostInfoCache(os.path.join(self.root, 'cache'), ttl=60, provider=provider, boot_id=boot_id)
+
+        self.assertDictEqual(cache.get(), dict(value=1))
+        self.assertDictEqual(cache.get(), dict(value=1))
+        self.assertTrue(os.path.exists(cache.location))
+
+        # a new instance (process) reads the file
+        other = HostInfoCache(os.path.join(self.root, 'cache'), ttl=60, provider=provider, boot_id=boot_id)
+        self.assertDictEqual(other.get(), dict(value=1))
+        self.assertEqual(len(calls), 1)
+
+        # host rebooted
+        self.write('boot_id', 'second')
+        self.assertDictEqual(cache.get(), dict(value=2))
+        self.assertDictEqual(cache.get(), dict(value=2))
+
+        # expired
+        with open(cache.location) as fp:
+            cached = json.load(fp)
+        cached['created'] = time.time() - 120
+        with open(cache.location, 'w') as fp:
+            json.dump(cached, fp)
+        self.assertDictEqual(cache.get(), dict(value=3))
+
+        # disabled cache
+        cache = HostInfoCache(None, provider=provider, boot_id=boot_id)
+        self.assertDictEqual(cache.get(), dict(value=4))
+        self.assertDictEqual(cache.get(), dict(value=5))
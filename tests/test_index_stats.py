@@ -0,0 +1,144 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import math
+from unittest import TestCase
+from cihpc.core.db import CIHPCMongo, index_key
+from cihpc.core.processing.stage import ProcessStage
+from cihpc.core.structures.project_stage import ProjectStage, StageOrder
+
+
+def report(duration, warmup=False, **index):
+    return dict(index=index, result={'duration': duration, 'warm-up': warmup})
+
+
+class Worker(object):
+    def __init__(self, index, cpus=1):
+        self.current_index = index
+        self.variables = {'__cpu__': cpus}
+        self.expected_duration = None
+
+
+documents = [
+    report(2.0, mesh=1, cpus=1),
+    report(4.0, mesh=1, cpus=1),
+    report(100.0, warmup=True, mesh=1, cpus=1),
+    report(10.0, mesh=2, cpus=2),
+    report(50.0, mesh=5, cpus=1),
+    dict(index=dict(mesh=4, solver=dict(name='cg')), result=dict(duration=8.0)),
+]
+
+
+class TestIndexStats(TestCase):
+
+    def test_index_stats(self):
+        mongo = tests.mongo(documents)
+        stats = mongo.index_stats([dict(mesh=1, cpus=1), dict(mesh=2, cpus=2), dict(mesh=3, cpus=1), dict()])
+
+        # warm-up runs are not counted, the index is the grouping key
+        self.assertDictEqual(stats, {
+            index_key(dict(mesh=1, cpus=1)): dict(count=2, duration=3.0, std=math.sqrt(2.0)),
+            index_key(dict(mesh=2, cpus=2)): dict(count=1, duration=10.0, std=None),
+        })
+        match = mongo.reports.pipeline[0]['$match']
+        self.assertDictEqual(match['index.mesh'], {'$in': [1, 2, 3]})
+        self.assertDictEqual(match['result.warm-up'], {'$ne': True})
+
+        # nested fields of the index
+        stats = mongo.index_stats([{'mesh': 4, 'solver.name': 'cg'}])
+        self.assertDictEqual(stats, {index_key({'mesh': 4, 'solver.name': 'cg'}): dict(count=1, duration=8.0, std=None)})
+
+        self.assertDictEqual(mongo.index_stats([dict(), None]), dict())
+
+    def test_sort_by_expected_duration(self):
+        CIHPCMongo.set_default(tests.mongo(documents))
+        self.addCleanup(CIHPCMongo.set_default, None)
+
+        a = Worker(dict(mesh=1, cpus=1), cpus=1)
+        b = Worker(dict(mesh=2, cpus=2), cpus=2)
+        c = Worker(dict(mesh=3, cpus=4), cpus=4)
+        d = Worker(dict(), cpus=1)
+
+        workers = ProcessStage.sort_by_expected_duration([a, b, c, d])
+        self.assertEqual(a.expected_duration, 3.0)
+        self.assertEqual(b.expected_duration, 10.0)
+
+        # unseen configurations: mean duration per core times the cores
+        per_cpu = (3.0 + 10.0) / 3
+        self.assertAlmostEqual(c.expected_duration, per_cpu * 4)
+        self.assertAlmostEqual(d.expected_duration, per_cpu * 1)
+        self.assertListEqual(workers, [c, b, d, a])
+
+    def test_sort_without_history(self):
+        workers = [Worker(dict(mesh=1)), Worker(dict(mesh=2), cpus=2)]
+
+        # no connection, the order is kept
+        CIHPCMongo.set_default(None)
+        self.assertListEqual(ProcessStage.sort_by_expected_duration(list(workers)), workers)
+
+        # nothing known, the workers with more cores go first
+        CIHPCMongo.set_default(tests.mongo([]))
+        self.addCleanup(CIHPCMongo.set_default, None)
+        self.assertListEqual(ProcessStage.sort_by_expected_duration(list(workers)), workers[::-1])
+        self.assertIsNone(workers[0].expected_duration)
+
+
+class Project(object):
+    global_args = dict()
+
+
+def stage(repeat):
+    return ProjectStage(dict(
+        name='test', index=dict(mesh='<mesh>'), repeat=repeat,
+        variables=dict(matrix=[dict(mesh=[1, 2])]),
+    ))
+
+
+class TestPlanRepetitions(TestCase):
+
+    def tearDown(self):
+        CIHPCMongo.set_default(None)
+
+    def test_warmup(self):
+        workers = list(ProcessStage.iter_create(Project(), stage({'exactly': 3, 'warm-up': 2})))
+
+        # the warm-up runs precede the first job of each configuration only
+        self.assertEqual(len(workers), 6)
+        self.assertListEqual([w.warmup for w in workers], [2, 0, 0, 2, 0, 0])
+
+    def test_adaptive(self):
+        CIHPCMongo.set_default(tests.mongo([
+            report(1.0, mesh='1'), report(1.01, mesh='1'), report(0.99, mesh='1'), report(1.0, mesh='1'),
+            report(5.0, warmup=True, mesh='1'),
+            report(1.0, mesh='2'), report(2.0, mesh='2'),
+        ]))
+        repeat = {'warm-up': 1, 'adaptive': {'min': 3, 'max': 10, 'relative-width': 0.1}}
+        workers = list(ProcessStage.iter_create(Project(), stage(repeat)))
+
+        # the first configuration already converged in the database
+        self.assertEqual(len(workers), 1)
+        worker = workers[0]
+        self.assertDictEqual(worker.current_index, dict(mesh='2'))
+        self.assertEqual(worker.history['count'], 2)
+
+        # the series continues from the results in the database
+        spec = worker.stage.smart_repeat
+        self.assertTrue(spec.more_runs([], worker.history))
+        self.assertTrue(spec.more_runs([1.5], worker.history))
+        self.assertFalse(spec.more_runs([1.5] * 8, worker.history))
+
+
+class TestStageOrder(TestCase):
+
+    def test_order(self):
+        self.assertIs(ProjectStage(dict(name='test')).order, StageOrder.DEFAULT)
+        self.assertIs(ProjectStage(dict(name='test', order='default')).order, StageOrder.DEFAULT)
+        self.assertIs(ProjectStage(dict(name='test', order='longest-first')).order, StageOrder.LONGEST_FIRST)
+
+        with self.assertRaises(ValueError):
+            ProjectStage(dict(name='test', order='shortest-first'))
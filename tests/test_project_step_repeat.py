@@ -6,7 +6,9 @@ import tests
 
 tests.fix_paths()
 
+import numpy as np
 from unittest import TestCase
+from cihpc.common.utils.datautils import mean_confidence_interval
 from cihpc.core.structures.project_step_repeat import ProjectStepRepeat
 
 
@@ -68,6 +70,65 @@ class TestProjectStepRepeat(TestCase):
         repeat = ProjectStepRepeat(data)
         self.assertTrue(repeat.is_complex())
 
+    def test_remaining(self):
+        repeat = ProjectStepRepeat(None)
+        self.assertEqual(repeat.remaining(), 1)
+        self.assertEqual(repeat.remaining(10), 1)
+
+        repeat = ProjectStepRepeat({'exactly': 10})
+        self.assertEqual(repeat.remaining(3), 10)
+
+        repeat = ProjectStepRepeat({'no-less-than': 15})
+        self.assertEqual(repeat.remaining(), 15)
+        self.assertEqual(repeat.remaining(0), 15)
+        self.assertEqual(repeat.remaining(5), 10)
+        self.assertEqual(repeat.remaining(15), 0)
+        self.assertEqual(repeat.remaining(20), 0)
+
+    def test_adaptive(self):
+        repeat = ProjectStepRepeat({'warm-up': 2, 'adaptive': {'min': 3, 'max': 6, 'relative-width': 0.1}})
+        self.assertTrue(repeat.is_adaptive())
+        self.assertFalse(repeat.is_complex())
+        self.assertEqual(repeat.warmup, 2)
+        # a single job runs the whole series
+        self.assertEqual(repeat.remaining(), 1)
+
+        # stable durations stop at the minimum
+        self.assertTrue(repeat.more_runs([1.0, 1.0]))
+        self.assertFalse(repeat.more_runs([1.0, 1.01, 0.99]))
+
+        # noisy durations run until the maximum
+        self.assertTrue(repeat.more_runs([1.0, 2.0, 0.5, 1.5]))
+        self.assertFalse(repeat.more_runs([1.0, 2.0, 0.5, 1.5, 1.0, 3.0]))
+
+        # the history in the database is merged with the new runs
+        values = [1.0, 2.0, 0.5, 1.5]
+        history = dict(count=3, duration=np.mean(values[:3]), std=np.std(values[:3], ddof=1))
+        self.assertAlmostEqual(repeat.adaptive.width(values[3:], history), repeat.adaptive.width(values))
+        self.assertAlmostEqual(
+            repeat.adaptive.width(values) * np.mean(values) / 2,
+            mean_confidence_interval(values, repeat.adaptive.confidence),
+        )
+
+        # converged configurations are not repeated
+        self.assertEqual(repeat.remaining(3, dict(count=3, duration=1.0, std=0.01)), 0)
+        self.assertEqual(repeat.remaining(3, history), 1)
+        self.assertEqual(repeat.remaining(6, dict(count=6, duration=1.0, std=1.0)), 0)
+
+        repeat = ProjectStepRepeat({'adaptive': None})
+        self.assertEqual(repeat.warmup, 0)
+        self.assertEqual(repeat.adaptive.min, 3)
+
+        with self.assertRaises(ValueError):
+            ProjectStepRepeat({'exactly': 5, 'adaptive': {}})
+
+    def test_more_runs(self):
+        repeat = ProjectStepRepeat({'exactly': 5, 'warm-up': 1})
+        self.assertFalse(repeat.is_adaptive())
+        self.assertEqual(repeat.warmup, 1)
+        self.assertTrue(repeat.more_runs([]))
+        self.assertFalse(repeat.more_runs([1.0]))
+
     # def test_load_stats(self):
     #     repeat = ProjectStepRepeat(None)
     #
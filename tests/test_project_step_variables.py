@@ -0,0 +1,108 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import itertools
+from unittest import TestCase
+
+from cihpc.core.structures.project_step_variables import ProjectStepVariables, VariableSection
+
+
+def strip(items):
+    return [{k: v for k, v in x.items() if not k.startswith('__')} for x in items]
+
+
+class TestProjectStepVariables(TestCase):
+
+    def test_expand(self):
+        variables = ProjectStepVariables([
+            dict(matrix=[dict(a=[1, 2]), dict(b=['x', 'y', 'z'])]),
+            dict(table=[dict(c=[1, 2, 3]), dict(d='foo')]),
+        ])
+        items = list(variables.expand())
+        self.assertEqual(variables.count(), 9)
+        self.assertEqual(len(items), 9)
+        self.assertEqual(strip(items[:3]), [dict(a=1, b='x'), dict(a=1, b='y'), dict(a=1, b='z')])
+        self.assertEqual(strip(items[6:]), [dict(c=1, d='foo'), dict(c=2, d='foo'), dict(c=3, d='foo')])
+        self.assertEqual(items[5]['__total__'], 6)
+        self.assertEqual(items[5]['__current__'], 6)
+
+        self.assertEqual(strip(ProjectStepVariables(None).expand()), [dict()])
+
+    def test_constraints(self):
+        section = VariableSection(dict(
+            matrix=[dict(cpu=[1, 2, 4, 8]), dict(mesh=['small', 'big'])],
+            exclude=["cpu == 1 and mesh == 'big'", dict(cpu=8, mesh='small')],
+            include=['cpu <= 4 or mesh == "big"'],
+        ))
+        items = list(section)
+        self.assertEqual(section.count(), 6)
+        self.assertNotIn(dict(cpu=1, mesh='big'), items)
+        self.assertNotIn(dict(cpu=8, mesh='small'), items)
+        self.assertIn(dict(cpu=8, mesh='big'), items)
+
+        with self.assertRaises(ValueError):
+            list(VariableSection(dict(matrix=[dict(a=[1])], exclude=['b == 1'])))
+
+    def test_constraints_count(self):
+        variables = ProjectStepVariables(dict(
+            matrix=[dict(cpu=[1, 2, 4, 8]), dict(mesh=['small', 'big'])],
+            exclude=["cpu == 1 and mesh == 'big'"],
+        ))
+        section = variables.sections[0]
+        calls = dict(n=0)
+        accepts = section.accepts
+
+        def counted(configuration):
+            calls['n'] += 1
+            return accepts(configuration)
+
+        section.accepts = counted
+
+        # the estimate does not evaluate the constraints
+        self.assertEqual(variables.estimate(), 8)
+        self.assertEqual(calls['n'], 0)
+
+        # streaming pass for the total, then the configurations
+        items = list(variables.expand())
+        self.assertEqual(len(items), 7)
+        self.assertEqual(items[0]['__total__'], 7)
+        self.assertEqual(calls['n'], 16)
+
+        # the count is known after the first full pass
+        self.assertEqual(variables.count(), 7)
+        self.assertEqual(variables.estimate(), 7)
+        self.assertEqual(len(list(variables.expand())), 7)
+        self.assertEqual(calls['n'], 24)
+
+    def test_sampling(self):
+        matrix = [{'v%d' % i: list(range(100))} for i in range(6)]
+
+        # 10^12 configurations, none of them is stored
+        section = VariableSection(dict(matrix=matrix, sample=20, seed=3))
+        self.assertEqual(section.size, 100 ** 6)
+        items = list(section)
+        self.assertEqual(len(items), 20)
+        self.assertEqual(items, list(VariableSection(dict(matrix=matrix, sample=20, seed=3))))
+        self.assertNotEqual(items, list(VariableSection(dict(matrix=matrix, sample=20, seed=4))))
+
+        section = VariableSection(dict(matrix=matrix, sample=20, sampling='lhs', exclude=['v0 == 0']))
+        items = list(section)
+        self.assertEqual(len(items), 20)
+        self.assertTrue(all(x['v0'] != 0 for x in items))
+
+        # every stratum of every dimension is used exactly once
+        section = VariableSection(dict(matrix=[dict(a=list(range(10))), dict(b=list(range(10)))],
+                                       sample=10, sampling='lhs'))
+        items = list(section)
+        self.assertEqual(sorted(x['a'] for x in items), list(range(10)))
+        self.assertEqual(sorted(x['b'] for x in items), list(range(10)))
+
+        # sample larger than the space
+        section = VariableSection(dict(matrix=[dict(a=[1, 2]), dict(b=[1, 2])], sample=10))
+        self.assertEqual(section.count(), 4)
+        self.assertEqual(sorted((x['a'], x['b']) for x in section), list(itertools.product([1, 2], [1, 2])))
@@ -0,0 +1,158 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import numpy as np
+import pandas as pd
+from unittest import TestCase
+from cihpc.common.utils import datautils as du
+from cihpc.core.db.rollup import QuantileSketch, Rollup
+from cihpc.www.cfg.project_config import ProjectConfigFields
+from cihpc.www.engines.highcharts import ChartGroup
+from cihpc.www.engines.pushdown import GroupPushdown
+
+
+class Collection(object):
+    name = 'timers'
+
+    def __init__(self, items, meta=None):
+        self.items = items
+        self.meta = meta
+        self.pipeline = None
+
+    def aggregate(self, pipeline, **kwargs):
+        self.pipeline = pipeline
+        return iter(self.items)
+
+    def find_one(self, filter):
+        return self.meta if self.meta and filter == {'_id': self.meta['_id']} else None
+
+
+class Mongo(object):
+    def __init__(self, items, version=(4, 4), rollup=(), rebuilt=None):
+        self.reports = Collection(items)
+        # the rollup is complete only after a rebuild
+        rebuilt = bool(rollup) if rebuilt is None else rebuilt
+        meta = dict(_id=Rollup.meta_id, version=Rollup.version) if rebuilt else None
+        self.rollup = Collection(list(rollup), meta)
+        self.version = version
+
+    def server_version(self):
+        return self.version
+
+
+class Config(object):
+    pushdown = True
+
+    def __init__(self, fields):
+        self.fields = ProjectConfigFields(fields)
+
+
+chart_options = du.dotdict(
+    y='result.duration',
+    x='git.datetime',
+    c='git.commit',
+    groupby={'problem.cpu': 'cpu'},
+    colorby={},
+)
+
+
+class TestGroupPushdown(TestCase):
+
+    def test_create(self):
+        chart_group = ChartGroup(chart_options, {'show-boxplot': True, 'show-ci': True})
+        config = Config({'result.duration': 'result.time', 'problem.cpu': 'problem.cpus'})
+        pushdown = GroupPushdown.create(config, chart_options, chart_group, Mongo([]))
+
+        pipeline = pushdown.pipeline({'problem.test': 'foo'})
+        self.assertDictEqual(pipeline[0], {'$match': {'problem.test': 'foo'}})
+        group = pipeline[1]['$group']
+        self.assertDictEqual(group['_id'], {'k0': '$git.datetime', 'k1': '$problem.cpus'})
+        self.assertDictEqual(group['mean'], {'$avg': '$result.time'})
+        self.assertDictEqual(group['_values'], {'$push': '$result.time'})
+
+        # percentiles are computed by the server
+        pushdown = GroupPushdown.create(config, chart_options, chart_group, Mongo([], (7, 0)))
+        group = pushdown.pipeline(None)[0]['$group']
+        self.assertDictEqual(group['_percentiles']['$percentile'], {
+            'input': '$result.time', 'p': [0.25, 0.5, 0.75], 'method': 'approximate'
+        })
+
+        # complex expressions cannot be pushed down
+        config = Config({'result.duration': '=row["result.time"] * 2'})
+        self.assertIsNone(GroupPushdown.create(config, chart_options, chart_group, Mongo([])))
+
+    def test_aggregate(self):
+        values = [1.0, 2.0, 4.0, 8.0]
+        items = [
+            dict(_id=dict(k0=2, k1=1), _count=4, _commits=['a'], _ids=[1, 2, 3, 4],
+                 mean=np.mean(values), min=1.0, max=8.0, _sample_std=np.std(values, ddof=1), _values=values),
+            dict(_id=dict(k0=1, k1=1), _count=1, _commits=['b'], _ids=[5],
+                 mean=3.0, min=3.0, max=3.0, _sample_std=None, _values=[3.0]),
+            dict(_id=dict(k0=3, k1=None), _count=1, _commits=['c'], _ids=[6],
+                 mean=3.0, min=3.0, max=3.0, _sample_std=None, _values=[3.0]),
+        ]
+        chart_group = ChartGroup(chart_options, {'show-boxplot': True, 'show-ci': True})
+        config = Config({})
+        mongo = Mongo(items)
+
+        pushdown = GroupPushdown.create(config, chart_options, chart_group, mongo)
+        df = pushdown.aggregate(mongo, None)
+
+        # row with missing key is dropped
+        self.assertEqual(len(df), 2)
+
+        points = pushdown.points(df)
+        self.assertListEqual(list(points.index), [1, 2])
+        self.assertAlmostEqual(points['result.duration']['75%'][2], np.percentile(values, 75))
+        self.assertAlmostEqual(points['result.duration']['ci'][2], du.mean_confidence_interval(values))
+        self.assertTrue(np.isnan(points['result.duration']['ci'][1]))
+        self.assertListEqual(list(points['_id']['<lambda>']), [[5], [1, 2, 3, 4]])
+
+    def test_std(self):
+        chart_group = ChartGroup(chart_options, {'show-stdbar': True})
+        pushdown = GroupPushdown.create(Config({}), chart_options, chart_group, Mongo([]))
+        group = pushdown.pipeline(None)[0]['$group']
+
+        # both paths compute the population std
+        self.assertDictEqual(group['std'], {'$stdDevPop': '$result.duration'})
+        values = pd.Series([1.0, 2.0, 4.0, 8.0])
+        self.assertAlmostEqual(ChartGroup.y_metrics_default['std'](values), np.std(values.values, ddof=0))
+
+    def test_rollup(self):
+        sketch = QuantileSketch()
+        for v in [1.0, 2.0, 4.0, 8.0]:
+            sketch.add(v)
+
+        items = [
+            dict(_id=dict(k0=1, k1=1), _count=4, _sum=15.0, _sumsq=85.0, min=1.0, max=8.0,
+                 _commits=['a'], _ids=[[1, 2], [3, 4]], _sketches=[dict(sketch.buckets)]),
+        ]
+        chart_group = ChartGroup(chart_options, {'show-boxplot': True, 'show-ci': True, 'show-stdbar': True})
+        mongo = Mongo([], rollup=items)
+
+        pushdown = GroupPushdown.create(Config({}), chart_options, chart_group, mongo, {'git.branch': 'master'})
+        self.assertTrue(pushdown.rollup)
+        group = pushdown.pipeline({'git.branch': 'master'})
+        self.assertDictEqual(group[0]['$match'], {'git.branch': 'master', 'frame': None})
+
+        points = pushdown.points(pushdown.aggregate(mongo, None))
+        values = [1.0, 2.0, 4.0, 8.0]
+        self.assertAlmostEqual(points['result.duration']['mean'][1], np.mean(values))
+        self.assertAlmostEqual(points['result.duration']['std'][1], np.std(values))
+        self.assertAlmostEqual(points['result.duration']['ci'][1], du.mean_confidence_interval(values))
+        self.assertAlmostEqual(points['result.duration']['50%'][1], 2.0, delta=0.05)
+        self.assertListEqual(points['_id']['<lambda>'][1], [1, 2, 3, 4])
+
+        # filters outside of the rollup sections
+        pushdown = GroupPushdown.create(Config({}), chart_options, chart_group, mongo, {'system.hostname': 'foo'})
+        self.assertFalse(pushdown.rollup)
+
+        # rollup filled by the inserts only, not rebuilt yet
+        mongo = Mongo([], rollup=items, rebuilt=False)
+        pushdown = GroupPushdown.create(Config({}), chart_options, chart_group, mongo, {'git.branch': 'master'})
+        self.assertFalse(pushdown.rollup)
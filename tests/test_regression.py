@@ -0,0 +1,110 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import datetime
+import numpy as np
+from scipy import stats as st
+from unittest import TestCase
+from cihpc.core.db.regression import RegressionDetector, change_point, group_moments, welch_test
+
+
+def history(slowdown, commits=8, reps=5, seed=1234):
+    """
+    Reports of the commits, the last commit is slower by the given factor
+    """
+    random = np.random.RandomState(seed)
+    documents = list()
+    start = datetime.datetime(2020, 1, 1)
+    for i in range(commits):
+        factor = slowdown if i == commits - 1 else 1.0
+        git = dict(commit='c%d' % i, datetime=start + datetime.timedelta(days=i))
+        for j in range(reps):
+            documents.append(dict(
+                git=git, index=dict(mesh=1, run_id=j),
+                result=dict(duration=10.0 * factor * random.lognormal(0.0, 0.02)),
+                timers=[dict(name='assembly', duration=2.0 * random.lognormal(0.0, 0.02))],
+            ))
+        # warm-up runs are ignored
+        documents.append(dict(git=git, index=dict(mesh=1), result=dict(duration=100.0, **{'warm-up': True})))
+    return documents
+
+
+class TestStatistics(TestCase):
+
+    def test_group_moments(self):
+        values = np.array([1.0, 2.0, 4.0, 3.0, 5.0])
+        count, mean, variance = group_moments(np.array([0, 0, 0, 2, 2]), values, 3)
+        self.assertListEqual(count.tolist(), [3, 0, 2])
+        self.assertAlmostEqual(mean[0], np.mean(values[:3]))
+        self.assertAlmostEqual(variance[0], np.var(values[:3], ddof=1))
+        self.assertAlmostEqual(variance[2], np.var(values[3:], ddof=1))
+        self.assertTrue(np.isnan(mean[1]))
+
+    def test_welch(self):
+        random = np.random.RandomState(1)
+        a, b = random.normal(1.0, 0.1, 10), random.normal(1.1, 0.2, 7)
+        expected = st.ttest_ind(b, a, equal_var=False, alternative='greater').pvalue
+
+        pvalue = welch_test(
+            np.array([len(a)]), np.array([a.mean()]), np.array([a.var(ddof=1)]),
+            np.array([len(b)]), np.array([b.mean()]), np.array([b.var(ddof=1)]),
+        )
+        self.assertAlmostEqual(pvalue[0], expected)
+
+        # no noise at all
+        pvalue = welch_test(*[np.array([x]) for x in (3, 1.0, 0.0, 3, 2.0, 0.0)])
+        self.assertEqual(pvalue[0], 0.0)
+
+    def test_change_point(self):
+        split, shift = change_point([1.0, 1.0, 1.0, 1.0, 1.2, 1.2])
+        self.assertEqual(split, 4)
+        self.assertAlmostEqual(shift, np.exp(0.2) - 1.0)
+        self.assertTupleEqual(change_point([1.0]), (None, 0.0))
+
+
+class TestRegressionDetector(TestCase):
+
+    def test_detect(self):
+        for method in RegressionDetector.methods:
+            detector = RegressionDetector(tests.Connection(history(1.2)), window=5, method=method)
+            regressions = detector.detect('c7')
+
+            # only the whole report slowed down, the assembly frame did not
+            self.assertEqual(len(regressions), 1, method)
+            regression = regressions[0]
+            self.assertIsNone(regression['frame'])
+            self.assertDictEqual(regression['index'], dict(mesh=1))
+            self.assertAlmostEqual(regression['ratio'], 1.2, delta=0.05)
+            self.assertEqual(regression['baseline']['commits'], 5)
+            self.assertEqual(regression['baseline']['count'], 25)
+            self.assertEqual(regression['current']['count'], 5)
+            self.assertEqual(regression['change_point']['commit'], 'c7')
+
+    def test_no_regression(self):
+        detector = RegressionDetector(tests.Connection(history(1.0)), window=5)
+        self.assertListEqual(detector.detect('c7'), [])
+
+        # small slowdowns are not reported
+        detector = RegressionDetector(tests.Connection(history(1.03)), window=5, threshold=0.05)
+        self.assertListEqual(detector.detect('c7'), [])
+
+        # no baseline for the first commit
+        self.assertListEqual(detector.detect('c0'), [])
+
+        with self.assertRaises(ValueError):
+            RegressionDetector(None, method='anova')
+
+    def test_samples(self):
+        detector = RegressionDetector(tests.Connection(history(1.0)), window=5)
+        groups, group, position, values = detector.samples(['c0', 'c1'])
+
+        # 5 runs of each commit, the whole report and the assembly frame, no warm-up
+        self.assertEqual(len(values), 20)
+        self.assertLess(np.exp(values).max(), 20.0)
+        self.assertEqual(len(groups), 2)
+        self.assertListEqual(sorted(set(position.tolist())), [0, 1])
@@ -0,0 +1,147 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from cihpc.artifacts.base import CIHPCReport, ReportContext
+from cihpc.core.processing.collect_pipeline import CollectPipeline
+from cihpc.core.processing.step_collect import create_report_context, process_files_parallel, process_step_collect
+from cihpc.core.processing.step_shell import ProcessStepResult
+from cihpc.core.structures.project_stage import ProjectStage
+
+
+class Project(object):
+    name = 'test-report-context'
+    workdir = '.'
+    report_git = dict(name='repo', branch='master', commit='abc')
+
+
+class Worker(object):
+    def __init__(self, variables):
+        self.variables = variables
+        self.collect_result = None
+
+
+class Writer(object):
+    def __init__(self):
+        self.reports = list()
+        self._lock = threading.Lock()
+
+    def add(self, collect_results):
+        with self._lock:
+            for result in collect_results:
+                self.reports.extend(result.items)
+
+    def flush(self):
+        pass
+
+
+class TestReportContext(TestCase):
+
+    jobs = 200
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for i in range(self.jobs):
+            with open(os.path.join(self.root, 'job-%d.json' % i), 'w') as fp:
+                json.dump(dict(problem={'file-job': i}, result=dict(duration=1.0), timers=[dict(name='t', duration=1.0)]), fp)
+
+        self.stage = ProjectStage(dict(
+            name='test',
+            index=dict(job='<job>'),
+            collect=dict(
+                files=os.path.join(self.root, 'job-<job>.json'),
+                extra={'extra-job': '<job>'},
+                background=True,
+                workers=16,
+            ),
+        ))
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def assertReports(self, reports):
+        self.assertEqual(len(reports), self.jobs)
+        for report in reports:
+            job = report['problem']['file-job']
+            self.assertEqual(str(report['index']['job']), str(job))
+            self.assertEqual(str(report['problem']['extra-job']), str(job))
+            self.assertEqual(report['result']['repetition'], job)
+            self.assertDictEqual(report['git'], Project.report_git)
+        self.assertEqual(sorted(r['problem']['file-job'] for r in reports), list(range(self.jobs)))
+
+    @staticmethod
+    def process_result(job):
+        result = ProcessStepResult()
+        result.repetition = job
+        result.warmup = False
+        return result
+
+    def test_context(self):
+        result = self.process_result(3)
+        context = create_report_context(self.stage, dict(job=3), result, Project.report_git)
+        self.assertDictEqual(context.index, dict(job='3'))
+        self.assertDictEqual(context.result, {'repetition': 3, 'warm-up': False})
+
+        # reports do not share the fields with the context
+        report = CIHPCReport(context)
+        report.index['foo'] = 'bar'
+        self.assertNotIn('foo', context.index)
+        self.assertDictEqual(report.git, Project.report_git)
+        self.assertDictEqual(CIHPCReport().index, dict())
+
+        # the context can be sent to the worker processes
+        copy = pickle.loads(pickle.dumps(context))
+        self.assertDictEqual(copy.index, context.index)
+        self.assertDictEqual(copy.system, context.system)
+
+    def test_concurrent_collect(self):
+        writer = Writer()
+
+        def collect(job):
+            return process_step_collect(Project(), self.stage, self.process_result(job), dict(job=job), writer)
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            summaries = list(executor.map(collect, range(self.jobs)))
+
+        self.assertEqual(sum(sum(s.total) for s in summaries), self.jobs)
+        self.assertReports(writer.reports)
+
+    def test_concurrent_pipeline(self):
+        writer = Writer()
+        pipeline = CollectPipeline(Project(), self.stage, writer)
+
+        def submit(job):
+            file = os.path.join(self.root, 'job-%d.json' % job)
+            return pipeline.submit_file(Worker(dict(job=job)), file, self.process_result(job))
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            futures = list(executor.map(submit, range(self.jobs)))
+        for future in futures:
+            future.result()
+        pipeline.close()
+
+        self.assertEqual(pipeline.documents, self.jobs)
+        self.assertReports(writer.reports)
+
+    def test_process_files_parallel(self):
+        stage = ProjectStage(dict(name='test', collect=dict(files='*.json', processes=2)))
+        files = [os.path.join(self.root, 'job-%d.json' % i) for i in range(4)]
+        context = ReportContext(git=Project.report_git, index=dict(job='all'))
+
+        results = list(process_files_parallel(Project(), stage, files, context=context))
+        self.assertEqual(len(results), 4)
+        for file_results, _, _ in results:
+            self.assertDictEqual(file_results[0].items[0]['index'], dict(job='all'))
@@ -0,0 +1,104 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import base64
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from cihpc.cfg.config import global_configuration
+from cihpc.common.utils.caching.response_cache import ResponseCache, cached_view
+from cihpc.www.cfg.project_config import ProjectConfig
+
+
+def encode(options):
+    return base64.encodebytes(json.dumps(options).encode()).decode()
+
+
+class TestResponseCache(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_memory_budget(self):
+        cache = ResponseCache(memory=3000)
+        for i in range(10):
+            cache.set('key-%d' % i, 'x' * 1000)
+
+        self.assertLessEqual(cache.size, 3000)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('key-0'))
+        self.assertEqual(cache.get('key-9'), 'x' * 1000)
+
+        # recently used entries are kept
+        cache.get('key-8')
+        cache.set('key-10', 'x' * 1000)
+        self.assertIsNotNone(cache.get('key-8'))
+        self.assertIsNone(cache.get('key-9'))
+
+    def test_disk_tier(self):
+        cache = ResponseCache(memory=1024, disk=self.root)
+        cache.set('foo', dict(data=list(range(10))))
+
+        # a new instance (e.g. after a restart) reads the disk tier
+        cache = ResponseCache(memory=1024, disk=self.root)
+        self.assertEqual(cache.get('foo'), dict(data=list(range(10))))
+        self.assertEqual(cache.disk_hits, 1)
+        self.assertEqual(cache.get('foo'), dict(data=list(range(10))))
+        self.assertEqual(cache.hits, 1)
+
+        cache = ResponseCache(memory=1024, disk=self.root, disk_size=1500)
+        cache.set('bar', 'y' * 1000)
+        cache.set('baz', 'z' * 1000)
+        self.assertNotIn('bar', ResponseCache(disk=self.root))
+        self.assertIn('baz', ResponseCache(disk=self.root))
+
+    def test_cached_view(self):
+        calls = dict(n=0)
+        version = dict(token=1)
+
+        @cached_view(lambda project: version['token'], ResponseCache(), ttl=0)
+        def view(project, base64data=''):
+            calls['n'] += 1
+            return dict(project=project, n=calls['n'])
+
+        a = encode(dict(filters=dict(foo=1), groupby=dict(bar=True)))
+        b = encode(dict(groupby=dict(bar=True), filters=dict(foo=1)))
+
+        self.assertEqual(view('foo', a)['n'], 1)
+        # the order of the options does not matter
+        self.assertEqual(view('foo', b)['n'], 1)
+        self.assertEqual(view('bar', b)['n'], 2)
+
+        # new data invalidate the cached responses
+        version['token'] = 2
+        self.assertEqual(view('foo', a)['n'], 3)
+        self.assertEqual(view('foo', b)['n'], 3)
+
+    def test_config_version(self):
+        project = os.path.join(self.root, 'foo')
+        os.makedirs(project)
+        with open(os.path.join(project, 'www.yaml'), 'w') as fp:
+            fp.write('name: foo\n')
+
+        home = global_configuration.home
+        global_configuration.home = self.root
+        self.addCleanup(setattr, global_configuration, 'home', home)
+
+        first = ProjectConfig.version('foo')
+        self.assertEqual(ProjectConfig.version('foo'), first)
+
+        # edited configuration changes the cache key
+        with open(os.path.join(project, 'www.yaml'), 'w') as fp:
+            fp.write('name: foo\npushdown: false\n')
+        self.assertNotEqual(ProjectConfig.version('foo'), first)
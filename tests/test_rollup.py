@@ -0,0 +1,98 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import numpy as np
+from unittest import TestCase
+from cihpc.core.db.rollup import QuantileSketch, Rollup
+
+
+class TestQuantileSketch(TestCase):
+
+    def test_quantile(self):
+        values = np.random.RandomState(1234).lognormal(0.0, 1.0, 5000)
+        sketch = QuantileSketch()
+        for v in values:
+            sketch.add(v)
+
+        self.assertEqual(sketch.count, len(values))
+        for q in [0.1, 0.25, 0.5, 0.75, 0.9]:
+            expected = np.quantile(values, q)
+            self.assertAlmostEqual(sketch.quantile(q), expected, delta=expected * 0.03)
+
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+        self.assertEqual(QuantileSketch().add(0.0).add(-1.0).quantile(0.0), -QuantileSketch.value('p0'))
+
+    def test_merge(self):
+        a, b, c = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        for v in range(1, 100):
+            (a if v % 2 else b).add(v)
+            c.add(v)
+
+        merged = QuantileSketch(dict(a.buckets)).merge(b)
+        self.assertDictEqual(dict(merged.buckets), dict(c.buckets))
+
+
+class TestRollup(TestCase):
+
+    def test_updates(self):
+        documents = [
+            dict(_id=1, git=dict(commit='a'), index=dict(mesh=1, run_id='x'),
+                 result=dict(duration=2.0), timers=[dict(name='assembly', duration=1.0)]),
+            dict(_id=2, git=dict(commit='a'), index=dict(mesh=1, run_id='y'),
+                 result=dict(duration=4.0), timers=[dict(name='assembly', duration=3.0)]),
+            dict(_id=3, git=dict(commit='b'), index=dict(mesh=1),
+                 result=dict(duration=None)),
+            dict(_id=4, git=dict(commit='a'), index=dict(mesh=1),
+                 result={'duration': 100.0, 'warm-up': True}, timers=[dict(name='assembly', duration=50.0)]),
+        ]
+        operations = Rollup(tests.Connection()).updates(documents)
+
+        # commit a: report and assembly frame, commit b has no valid duration, warm-up is skipped
+        self.assertEqual(len(operations), 2)
+
+        report = operations[0]._doc
+        self.assertEqual(operations[0]._filter['_id'], Rollup.key('a', dict(mesh=1), None))
+        self.assertDictEqual(
+            {k: v for k, v in report['$inc'].items() if not k.startswith('sketch.')},
+            dict(count=2, sum=6.0, sumsq=20.0),
+        )
+        self.assertDictEqual(report['$min'], dict(min=2.0))
+        self.assertDictEqual(report['$max'], dict(max=4.0))
+        self.assertDictEqual(report['$setOnInsert']['index'], dict(mesh=1))
+        self.assertListEqual(report['$push']['ids']['$each'], [1, 2])
+        self.assertEqual(operations[1]._doc['$setOnInsert']['frame'], 'assembly')
+
+    def test_moments(self):
+        values = [1.0, 2.0, 4.0, 8.0]
+        mean, std, sample_std = Rollup.moments(len(values), sum(values), sum(v * v for v in values))
+        self.assertAlmostEqual(mean, np.mean(values))
+        self.assertAlmostEqual(std, np.std(values))
+        self.assertAlmostEqual(sample_std, np.std(values, ddof=1))
+        self.assertTupleEqual(Rollup.moments(0, 0, 0), (None, None, None))
+
+    def test_available(self):
+        reports = [
+            dict(_id=1, git=dict(commit='a'), index=dict(mesh=1), result=dict(duration=2.0)),
+            dict(_id=2, git=dict(commit='b'), index=dict(mesh=1), result=dict(duration=4.0)),
+        ]
+        # filled by the inserts made after the upgrade only
+        connection = tests.Connection(reports, [dict(_id='x', frame=None, count=1)])
+        rollup = Rollup(connection)
+        self.assertFalse(rollup.available())
+
+        self.assertEqual(rollup.rebuild(), 2)
+        self.assertTrue(rollup.available())
+        self.assertEqual(len(connection.rollup.operations), 2)
+
+        meta = connection.rollup.find_one({'_id': Rollup.meta_id})
+        self.assertEqual(meta['reports'], 2)
+        self.assertIsNotNone(meta['frame'])
+
+        # rollup built by an older version
+        meta['version'] = Rollup.version - 1
+        self.assertFalse(rollup.available())
@@ -0,0 +1,138 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import threading
+import time
+from unittest import TestCase
+from cihpc.common.processing.pool import CoreBudget, WorkerPool, Worker
+from cihpc.common.processing.scheduler import JobQueue
+
+
+class Job(object):
+    def __init__(self, cpus, expected_duration=None):
+        self.cpus = cpus
+        self.expected_duration = expected_duration
+
+
+class TestJobQueue(TestCase):
+
+    def test_priority(self):
+        jobs = [Job(1, 1.0), Job(4, 1.0), Job(2, 10.0), Job(8, None)]
+        queue = JobQueue(8, jobs)
+
+        self.assertEqual(len(queue), 4)
+        self.assertListEqual(list(queue), [jobs[2], jobs[1], jobs[0], jobs[3]])
+
+    def test_backfill_greedy(self):
+        jobs = [Job(8), Job(2), Job(4), Job(1)]
+        queue = JobQueue(8, jobs)
+
+        # the head job fits
+        worker, backfilled = queue.pop(8)
+        self.assertIs(worker, jobs[0])
+        self.assertFalse(backfilled)
+
+        # largest job which fits 5 free cores
+        worker, backfilled = queue.pop(5, [(None, 3)])
+        self.assertIs(worker, jobs[2])
+        self.assertFalse(backfilled)
+
+        worker, backfilled = queue.pop(1, [(None, 3), (None, 4)])
+        self.assertIs(worker, jobs[3])
+
+        worker, backfilled = queue.pop(0, [(None, 8)])
+        self.assertIsNone(worker)
+
+    def test_backfill_reservation(self):
+        now = 100.0
+        head, short, long = Job(8, 50.0), Job(2, 5.0), Job(2, 40.0)
+        queue = JobQueue(8, [head, long, short])
+
+        # 4 free cores, the rest ends at 110, head job is reserved at 110
+        running = [(110.0, 4)]
+        worker, backfilled = queue.pop(4, running, now)
+        self.assertIs(worker, short)
+        self.assertTrue(backfilled)
+
+        # the long job would delay the head job
+        worker, backfilled = queue.pop(2, running + [(105.0, 2)], now)
+        self.assertIsNone(worker)
+
+    def test_reservation(self):
+        self.assertEqual(JobQueue.reservation(4, 2, [(10.0, 1), (20.0, 4)]), (20.0, 3))
+        self.assertEqual(JobQueue.reservation(4, 2, [(10.0, 1), (None, 4)]), (None, None))
+
+
+class TestBackfillPool(TestCase):
+
+    def test_mixed_cores(self):
+        lock = threading.Lock()
+        usage = dict(current=0, peak=0)
+
+        def func(worker: Worker):
+            with lock:
+                usage['current'] += worker.cpus
+                usage['peak'] = max(usage['peak'], usage['current'])
+            time.sleep(0.01)
+            with lock:
+                usage['current'] -= worker.cpus
+            return worker.crate
+
+        cpus = [1, 2, 4, 8, 1, 2, 4, 8, 16]
+        threads = [Worker(crate=i, target=func, cpus=c) for i, c in enumerate(cpus)]
+        pool = WorkerPool(cpu_count=8, threads=threads)
+        result = pool.start_parallel()
+
+        self.assertListEqual(sorted(result), list(range(len(cpus))))
+        self.assertLessEqual(usage['peak'], 8)
+        self.assertEqual(pool.semaphore.value, 8)
+        self.assertEqual(pool.stats.jobs, len(cpus))
+        self.assertGreater(pool.stats.utilisation, 0.0)
+
+
+class TestCoreBudget(TestCase):
+
+    def test_shared_budget(self):
+        lock = threading.Lock()
+        usage = dict(current=0, peak=0)
+
+        def func(worker: Worker):
+            with lock:
+                usage['current'] += worker.cpus
+                usage['peak'] = max(usage['peak'], usage['current'])
+            time.sleep(0.01)
+            with lock:
+                usage['current'] -= worker.cpus
+            return worker.crate
+
+        # two pools of 4 cores each, but only 4 cores in total
+        budget = CoreBudget(4)
+        pools = [
+            WorkerPool(cpu_count=4, threads=[Worker(crate=i, target=func, cpus=c) for i, c in enumerate([1, 2, 4, 1])],
+                       budget=budget)
+            for _ in range(2)
+        ]
+        results = dict()
+        threads = [
+            threading.Thread(target=lambda p=p: results.update({id(p): p.start_parallel()}))
+            for p in pools
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+        for pool in pools:
+            self.assertListEqual(sorted(results[id(pool)]), [0, 1, 2, 3])
+        self.assertLessEqual(usage['peak'], 4)
+        self.assertEqual(budget.free, 4)
+
+    def test_budget_limits_pool(self):
+        budget = CoreBudget(2)
+        pool = WorkerPool(cpu_count=8, threads=[], budget=budget)
+        self.assertEqual(pool.processes, 2)
@@ -0,0 +1,181 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from cihpc.common.utils.files.cache_store import CacheStore, LinkMode, parse_size
+from cihpc.core.processing.stage import ProcessStage
+from cihpc.core.processing.step_cache import ProcessStepCache
+from cihpc.core.structures.project_stage import ProjectStage
+from cihpc.core.structures.project_step_cache import ProjectStepCache
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fp:
+        fp.write(content)
+
+
+def read(path):
+    with open(path, 'r') as fp:
+        return fp.read()
+
+
+class TestCacheStore(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.storage = os.path.join(self.root, 'storage')
+        self.work = os.path.join(self.root, 'work')
+
+        write(os.path.join(self.work, 'build', 'lib.so'), 'library')
+        write(os.path.join(self.work, 'build', 'bin', 'app'), 'application')
+        os.chmod(os.path.join(self.work, 'build', 'bin', 'app'), 0o755)
+        os.symlink('bin/app', os.path.join(self.work, 'build', 'app'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def objects(self, store):
+        return sum(len(files) for _, _, files in os.walk(store.objects))
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size(None), None)
+        self.assertEqual(parse_size(1000), 1000)
+        self.assertEqual(parse_size('512'), 512)
+        self.assertEqual(parse_size('2K'), 2048)
+        self.assertEqual(parse_size('1.5gb'), int(1.5 * 1024 ** 3))
+
+    def test_dedupe(self):
+        store = CacheStore(self.storage)
+        store.save('commit-a', self.work, ['build'])
+        self.assertEqual(store.transferred, 2)
+        self.assertEqual(self.objects(store), 2)
+
+        # only the changed file is stored
+        write(os.path.join(self.work, 'build', 'lib.so'), 'library v2')
+        store.save('commit-b', self.work, ['build'])
+        self.assertEqual(store.transferred, 1)
+        self.assertEqual(store.skipped, 1)
+        self.assertEqual(self.objects(store), 3)
+
+    def test_restore(self):
+        for link in LinkMode:
+            store = CacheStore(os.path.join(self.storage, link.value), link=link)
+            store.save('commit-a', self.work, ['build'])
+
+            target = os.path.join(self.root, 'target-' + link.value)
+            self.assertTrue(store.restore('commit-a', target, ['build']))
+            self.assertEqual(read(os.path.join(target, 'build', 'lib.so')), 'library')
+            self.assertEqual(read(os.path.join(target, 'build', 'app')), 'application')
+            self.assertTrue(os.access(os.path.join(target, 'build', 'bin', 'app'), os.X_OK))
+            self.assertEqual(store.transferred, 2)
+
+            # only the files which differ are transferred, extra files are removed
+            os.unlink(os.path.join(target, 'build', 'lib.so'))
+            write(os.path.join(target, 'build', 'obj', 'extra.o'), 'extra')
+            self.assertTrue(store.restore('commit-a', target, ['build']))
+            self.assertEqual(store.transferred, 1)
+            self.assertEqual(store.skipped, 1)
+            self.assertEqual(store.removed, 2)
+            self.assertEqual(read(os.path.join(target, 'build', 'lib.so')), 'library')
+            self.assertFalse(os.path.exists(os.path.join(target, 'build', 'obj')))
+
+        self.assertFalse(store.restore('missing', target))
+
+    def test_corrupted(self):
+        store = CacheStore(self.storage, link=LinkMode.HARDLINK)
+        store.save('commit-a', self.work, ['build'])
+        target = os.path.join(self.root, 'target')
+        self.assertTrue(store.restore('commit-a', target, ['build']))
+
+        # files modified in place through a hardlink invalidate the cache
+        with open(os.path.join(target, 'build', 'lib.so'), 'a') as fp:
+            fp.write(' modified')
+        self.assertFalse(store.restore('commit-a', target, ['build']))
+        self.assertFalse(store.exists('commit-a'))
+
+    def test_eviction(self):
+        store = CacheStore(self.storage, max_size=3000)
+        for i in range(5):
+            write(os.path.join(self.work, 'build', 'lib.so'), str(i) * 1000)
+            store.save('commit-%d' % i, self.work, ['build'])
+            os.utime(store.snapshot_path('commit-%d' % i), (i, i))
+
+        # the shared file is counted only once
+        self.assertEqual(sorted(os.listdir(store.snapshots)), ['commit-3.json', 'commit-4.json'])
+        self.assertEqual(self.objects(store), 3)
+
+        # restored snapshot is the most recently used
+        store.restore('commit-3', self.work, ['build'])
+        write(os.path.join(self.work, 'build', 'lib.so'), 'x' * 1000)
+        store.save('commit-5', self.work, ['build'])
+        self.assertEqual(sorted(os.listdir(store.snapshots)), ['commit-3.json', 'commit-5.json'])
+
+
+class TestProcessStepCache(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        write(os.path.join(self.root, 'config', 'flags.cmake'), 'set(FLAGS -O2)')
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def cache(self, shell='make', **variables):
+        args = {'project-name': 'foo', 'git': dict(commit='abc'), 'compiler': 'gcc'}
+        args.update(variables)
+        return ProcessStepCache(ProjectStepCache(dict(
+            directories=['build'],
+            storage=os.path.join(self.root, 'storage'),
+            fields=['compiler'],
+            inputs=['config/*.cmake'],
+        )), [], args, cwd=self.root, shell=shell)
+
+    def test_key(self):
+        key = self.cache().name
+        self.assertEqual(self.cache(unused='foo').name, key)
+        self.assertNotEqual(self.cache(compiler='clang').name, key)
+        self.assertNotEqual(self.cache(shell='make -j4').name, key)
+        self.assertNotEqual(self.cache(git=dict(commit='def')).name, key)
+
+        write(os.path.join(self.root, 'config', 'flags.cmake'), 'set(FLAGS -O3)')
+        self.assertNotEqual(self.cache().name, key)
+
+    def test_job_variables(self):
+        class Project(object):
+            init_shell = None
+
+        stage = ProjectStage(dict(name='build', shell='taskset -c <__cpuset__> make -j <__cpu__> # <__unique__>'))
+
+        def shell(**variables):
+            return ProcessStage(Project(), stage, variables)._cache_shell()
+
+        # the jobs of the same configuration share the cache
+        key = shell(__cpu__=4, __cpuset__='0-3', __unique__='a', __current__=1)
+        self.assertEqual(shell(__cpu__=4, __cpuset__='4-7', __unique__='b', __current__=2), key)
+        self.assertEqual(key, 'taskset -c <__cpuset__> make -j 4 # <__unique__>')
+        self.assertNotEqual(shell(__cpu__=8, __cpuset__='0-7', __unique__='c', __current__=1), key)
+
+    def test_statistics(self):
+        write(os.path.join(self.root, 'build', 'app'), 'application')
+        cache = self.cache()
+        self.assertFalse(cache.exists())
+        cache.miss()
+        cache.save(10.0)
+
+        self.assertTrue(cache.restore())
+        self.assertTrue(cache.restore())
+        stats = cache.store.statistics(cache.name)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['build_time'], 10.0)
+        self.assertGreater(stats['restore_time'], 0.0)
@@ -0,0 +1,69 @@
+#!/bin/python3
+# author: Jan Hybs
+
+import tests
+
+
+tests.fix_paths()
+
+import random
+from unittest import TestCase
+
+from cihpc.cfg.cfgutil import Template, compile_template, configure_object, configure_string
+
+
+def call(func, *args):
+    try:
+        return func(*args)
+    except Exception as e:
+        return e.__class__
+
+
+class TestTemplate(TestCase):
+
+    variables = dict(
+        foo='foo',
+        num='12',
+        cpu='4_8_16',
+        lt='<foo>',
+        empty='',
+        bar=dict(foo='123', bar=True),
+    )
+
+    def test_compile(self):
+        template = compile_template('mpirun -np <cpu|0i> ./app <bar.foo> > <foo>.log')
+        self.assertIs(compile_template('mpirun -np <cpu|0i> ./app <bar.foo> > <foo>.log'), template)
+        self.assertEqual(len(template.matches), 3)
+        self.assertEqual(template.segments[0], 'mpirun -np ')
+        self.assertEqual(template.matches[1][0], ('bar', 'foo'))
+        self.assertFalse(compile_template('no placeholders'))
+
+    def test_render(self):
+        self.assertEqual(configure_string('<num|i>', self.variables), 12)
+        self.assertEqual(configure_string('<cpu|1i>', self.variables), 8)
+        self.assertEqual(configure_string('<foo>-<bar.foo>', self.variables), 'foo-123')
+        self.assertEqual(configure_string('<missing>-<foo>', self.variables, True), '<missing>-foo')
+        self.assertEqual(configure_string('<missing|i>', self.variables), 0)
+        self.assertEqual(configure_string(42, self.variables), 42)
+
+    def test_render_equivalence(self):
+        random.seed(1234)
+        pieces = ['<foo>', '<num|i>', '<num|f>', '<cpu|2>', '<lt>', '<empty>', '<missing>', '<missing|i>',
+                  '<bar.foo>', '<bar.bar|b>', '<', '>', '<<', 'x', ' ', '<f', 'oo>', '|i>', '<bar.']
+
+        for i in range(5000):
+            value = ''.join(random.choice(pieces) for j in range(random.randint(1, 6)))
+            template = Template(value)
+            for preserve in (True, False):
+                self.assertEqual(
+                    call(template.render, self.variables, preserve),
+                    call(template._render_sequential, self.variables, preserve),
+                    value
+                )
+
+    def test_configure_object(self):
+        obj = dict(a=['<foo>', dict(b='<num|i>')], c=('<bar.foo>',), d=1)
+        result = configure_object(obj, self.variables)
+        self.assertEqual(result, dict(a=['foo', dict(b=12)], c=('123',), d=1))
+        self.assertEqual(obj['a'][1]['b'], '<num|i>')
+        self.assertIsNot(result['a'], obj['a'])
@@ -19,6 +19,7 @@ from cihpc.common.processing.pool import (
     Worker,
     LogStatusFormat,
 )
+from cihpc.exceptions.exec_error import OnError
 
 
 cpu_count = multiprocessing.cpu_count()
@@ -94,3 +95,45 @@ class TestWorkerPool(TestCase):
             pool.log_statuses(format=LogStatusFormat.ONELINE)
             pool.start()
             self.assertListEqual(pool.result, result)
+
+    def test_start_lazy(self):
+        created = dict(cnt=0, max_pending=0)
+        finished = list()
+
+        def func(worker: Worker):
+            return worker.crate
+
+        def source():
+            for i in range(200):
+                created['cnt'] += 1
+                created['max_pending'] = max(created['max_pending'], created['cnt'] - len(finished))
+                yield Worker(crate=i, target=func)
+
+        for cpus in (1, 2):
+            created.update(cnt=0, max_pending=0)
+            finished.clear()
+
+            pool = WorkerPool(cpu_count=cpus, threads=source(), lookahead=8)
+            pool.thread_event.on_exit.on(lambda w: finished.append(w.result))
+            pool.start()
+
+            self.assertEqual(sorted(finished), list(range(200)))
+            self.assertEqual(pool.stats.jobs, 200)
+            # the workers are created on demand and released once finished
+            self.assertLessEqual(created['max_pending'], 8 + cpus)
+            self.assertListEqual(pool.threads, [])
+
+    def test_start_parallel_exception(self):
+        def func(worker: Worker):
+            if worker.crate == 3:
+                raise ValueError('unexpected')
+            return worker.crate
+
+        threads = [Worker(crate=i, target=func) for i in range(8)]
+        pool = WorkerPool(cpu_count=2, threads=threads)
+
+        # the unexpected exceptions terminate the pool as well
+        self.assertFalse(pool.start_parallel())
+        self.assertTrue(pool.terminate)
+        self.assertIs(pool.exception.on_error, OnError.EXIT)
+        self.assertIsInstance(pool.exception.details['exception'], ValueError)